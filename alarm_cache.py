@@ -0,0 +1,153 @@
+import threading
+import time
+
+from extensions import db
+from models import Task
+from routing import on_primary
+from socket_queue import cache_sync
+
+
+class AlarmIndex:
+    """In-process index of task ids in 'Alarm' status, per company.
+
+    Companies are loaded lazily from the tasks table and kept up to date by
+    submit_alarm/delete_alarm; other workers get those changes through
+    cache_sync. Every reconcile_interval seconds a company is re-read from
+    the database in case a message was lost.
+    """
+
+    def __init__(self, reconcile_interval=60):
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._alarms = {}         # company_id -> set of task ids
+        self._reconciled_at = {}  # company_id -> time.monotonic() of last DB read
+        self._pending = {}        # company_id -> changes made while a DB read is in flight
+        self.hits = 0
+        self.misses = 0
+        self.reconciliations = 0
+        self.drift = 0
+        self.last_drift = 0
+
+    @on_primary()
+    def _query(self, company_id):
+        rows = db.session.query(Task.id).filter(
+            Task.company_id == company_id,
+            Task.status == 'Alarm'
+        ).all()
+        return {row[0] for row in rows}
+
+    def _refresh(self, company_id):
+        with self._lock:
+            if company_id in self._pending:
+                # Another request is already reading this company, don't wait for it
+                loading = False
+            else:
+                self._pending[company_id] = []
+                loading = True
+
+        if not loading:
+            return self._query(company_id)
+
+        try:
+            task_ids = self._query(company_id)
+        except Exception:
+            with self._lock:
+                self._pending.pop(company_id, None)
+            raise
+
+        with self._lock:
+            # Replay write-through changes committed while the query was running
+            for task_id, active in self._pending.pop(company_id):
+                if active:
+                    task_ids.add(task_id)
+                else:
+                    task_ids.discard(task_id)
+
+            cached = self._alarms.get(company_id)
+            if cached is not None:
+                drift = len(cached ^ task_ids)
+                self.reconciliations += 1
+                self.last_drift = drift
+                self.drift += drift
+
+            self._alarms[company_id] = task_ids
+            self._reconciled_at[company_id] = time.monotonic()
+            return set(task_ids)
+
+    def task_ids(self, company_id):
+        with self._lock:
+            cached = self._alarms.get(company_id)
+            fresh = time.monotonic() - self._reconciled_at.get(company_id, 0) < self.reconcile_interval
+            if cached is not None and fresh:
+                self.hits += 1
+                return set(cached)
+            self.misses += 1
+
+        return self._refresh(company_id)
+
+    def has_alarms(self, company_id):
+        with self._lock:
+            cached = self._alarms.get(company_id)
+            fresh = time.monotonic() - self._reconciled_at.get(company_id, 0) < self.reconcile_interval
+            if cached is not None and fresh:
+                self.hits += 1
+                return bool(cached)
+            self.misses += 1
+
+        return bool(self._refresh(company_id))
+
+    def _apply(self, company_id, task_id, active):
+        with self._lock:
+            if company_id in self._pending:
+                self._pending[company_id].append((task_id, active))
+
+            cached = self._alarms.get(company_id)
+            if cached is None:
+                # Not loaded yet, the next read will take it from the database
+                return
+            if active:
+                cached.add(task_id)
+            else:
+                cached.discard(task_id)
+
+    def add(self, company_id, task_id):
+        self._apply(company_id, task_id, True)
+        cache_sync.publish('alarm_index', company_id=company_id, task_id=task_id, active=True)
+
+    def discard(self, company_id, task_id):
+        self._apply(company_id, task_id, False)
+        cache_sync.publish('alarm_index', company_id=company_id, task_id=task_id, active=False)
+
+    def reconcile(self, company_id=None):
+        with self._lock:
+            company_ids = [company_id] if company_id is not None else list(self._alarms)
+        for cid in company_ids:
+            self._refresh(cid)
+
+    def clear(self):
+        with self._lock:
+            self._alarms.clear()
+            self._reconciled_at.clear()
+
+    def stats(self, company_id):
+        # Hit and drift counters are process-wide, cached ids only those of the company
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'loaded': company_id in self._alarms,
+                'active_alarms': len(self._alarms.get(company_id, ())),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'reconciliations': self.reconciliations,
+                'drift': self.drift,
+                'last_drift': self.last_drift,
+            }
+
+
+alarm_index = AlarmIndex()
+
+
+@cache_sync.handler('alarm_index')
+def _apply_published_alarm(company_id, task_id, active):
+    alarm_index._apply(company_id, task_id, active)
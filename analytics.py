@@ -0,0 +1,217 @@
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import DurationHistogram, Employee, Operation, Product, ShiftThroughput, Task, aTask
+
+DONE_STATUS = 'Завершене'
+OPEN_STATUSES = ('Не активне', 'У роботі', 'Alarm')
+# Shifts start at these hours (UTC, like Task.start_time / end_time)
+SHIFT_START_HOURS = (6, 14, 22)
+# Each histogram bucket is 2^(1/4) ≈ 19% wider than the previous one,
+# so a percentile read from it is within ~9% of the exact value
+BUCKET_BASE = 2 ** 0.25
+PERCENTILES = (0.5, 0.9, 0.99)
+DIMENSIONS = ('operation', 'employee', 'product')
+
+
+def bucket_for(seconds):
+    if seconds < 1:
+        return 0
+    return int(math.log(seconds, BUCKET_BASE)) + 1
+
+
+def bucket_value(bucket):
+    # Geometric middle of the bucket's range
+    if bucket == 0:
+        return 0.0
+    return BUCKET_BASE ** (bucket - 0.5)
+
+
+def percentiles(buckets, quantiles=PERCENTILES):
+    """{quantile: seconds} from [(bucket, count)] sorted by bucket."""
+    total = sum(count for _, count in buckets)
+    result = {}
+    if not total:
+        return {q: None for q in quantiles}
+    cumulative, i = 0, 0
+    for q in sorted(quantiles):
+        rank = max(q * total, 1)
+        while cumulative + buckets[i][1] < rank:
+            cumulative += buckets[i][1]
+            i += 1
+        result[q] = bucket_value(buckets[i][0])
+    return result
+
+
+def shift_start(moment):
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    for hour in reversed(SHIFT_START_HOURS):
+        start = day + timedelta(hours=hour)
+        if start <= moment:
+            return start
+    return day - timedelta(days=1) + timedelta(hours=SHIFT_START_HOURS[-1])
+
+
+def _duration(task):
+    if task.start_time is None or task.end_time is None:
+        return None
+    return max((task.end_time - task.start_time).total_seconds(), 0.0)
+
+
+def _increment(model, counter, key, seconds):
+    """counter += 1 and total_seconds += seconds on the row with `key`, creating it if needed."""
+    conditions = [getattr(model, column) == value for column, value in key.items()]
+    for _ in range(2):
+        result = db.session.execute(
+            update(model).where(*conditions).values({
+                counter: getattr(model, counter) + 1,
+                'total_seconds': model.total_seconds + seconds,
+            })
+        )
+        if result.rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model).values(**key, **{counter: 1}, total_seconds=seconds))
+            return
+        except IntegrityError:
+            # Somebody created the row in between: add to it instead
+            continue
+
+
+def record_finished_task(task, product_id=None):
+    """Add a just finished task to the rollups; the caller commits."""
+    seconds = _duration(task)
+    if seconds is not None:
+        if product_id is None:
+            admin_task = db.session.get(aTask, task.admin_task_id)
+            product_id = admin_task.product_id if admin_task else None
+        bucket = bucket_for(seconds)
+        keys = {'operation': task.operation_id, 'employee': task.responsible_id, 'product': product_id}
+        for dimension, key_id in keys.items():
+            if key_id is not None:
+                _increment(DurationHistogram, 'count', {
+                    'company_id': task.company_id, 'dimension': dimension, 'key_id': key_id, 'bucket': bucket
+                }, seconds)
+
+    if task.end_time is not None:
+        _increment(ShiftThroughput, 'completed', {
+            'company_id': task.company_id, 'shift_start': shift_start(task.end_time)
+        }, seconds or 0.0)
+
+
+def rebuild_rollups(company_id=None, batch_size=10000):
+    """Recompute the rollup tables from tasks, streaming them in batches. Returns the task count."""
+    for model in (DurationHistogram, ShiftThroughput):
+        query = model.query
+        if company_id is not None:
+            query = query.filter_by(company_id=company_id)
+        query.delete(synchronize_session=False)
+
+    query = db.session.query(
+        Task.company_id, Task.operation_id, Task.responsible_id, aTask.product_id, Task.start_time, Task.end_time
+    ).outerjoin(aTask, aTask.id == Task.admin_task_id).filter(Task.status == DONE_STATUS)
+    if company_id is not None:
+        query = query.filter(Task.company_id == company_id)
+
+    histograms, shifts = {}, {}
+    tasks = 0
+    for company, operation_id, employee_id, product_id, start, end in query.yield_per(batch_size):
+        tasks += 1
+        seconds = max((end - start).total_seconds(), 0.0) if start and end else None
+        if seconds is not None:
+            bucket = bucket_for(seconds)
+            for dimension, key_id in (('operation', operation_id), ('employee', employee_id), ('product', product_id)):
+                if key_id is not None:
+                    entry = histograms.setdefault((company, dimension, key_id, bucket), [0, 0.0])
+                    entry[0] += 1
+                    entry[1] += seconds
+        if end is not None:
+            entry = shifts.setdefault((company, shift_start(end)), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds or 0.0
+
+    rows = [{'company_id': c, 'dimension': d, 'key_id': k, 'bucket': b, 'count': n, 'total_seconds': s}
+            for (c, d, k, b), (n, s) in histograms.items()]
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(insert(DurationHistogram), rows[i:i + batch_size])
+    rows = [{'company_id': c, 'shift_start': start, 'completed': n, 'total_seconds': s}
+            for (c, start), (n, s) in shifts.items()]
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(insert(ShiftThroughput), rows[i:i + batch_size])
+    return tasks
+
+
+def _names(dimension, ids):
+    if not ids:
+        return {}
+    if dimension == 'employee':
+        rows = db.session.query(Employee.id, Employee.surname, Employee.name).filter(Employee.id.in_(ids)).all()
+        return {row_id: f'{surname} {name}' for row_id, surname, name in rows}
+    model = Operation if dimension == 'operation' else Product
+    return dict(db.session.query(model.id, model.name).filter(model.id.in_(ids)).all())
+
+
+def duration_stats(company_id, dimension, key_id=None):
+    """Count, mean and p50/p90/p99 per operation, employee or product, busiest first."""
+    query = db.session.query(
+        DurationHistogram.key_id, DurationHistogram.bucket, DurationHistogram.count, DurationHistogram.total_seconds
+    ).filter(DurationHistogram.company_id == company_id, DurationHistogram.dimension == dimension)
+    if key_id is not None:
+        query = query.filter(DurationHistogram.key_id == key_id)
+
+    by_key = {}
+    for row_key, bucket, count, seconds in query.order_by(DurationHistogram.key_id, DurationHistogram.bucket):
+        entry = by_key.setdefault(row_key, {'buckets': [], 'total_seconds': 0.0})
+        entry['buckets'].append((bucket, count))
+        entry['total_seconds'] += seconds
+
+    names = _names(dimension, list(by_key))
+    stats = []
+    for row_key, entry in by_key.items():
+        count = sum(c for _, c in entry['buckets'])
+        p = percentiles(entry['buckets'])
+        stats.append({
+            'id': row_key,
+            'name': names.get(row_key, 'Невідомо'),
+            'count': count,
+            'mean_seconds': entry['total_seconds'] / count,
+            'p50_seconds': p[0.5],
+            'p90_seconds': p[0.9],
+            'p99_seconds': p[0.99],
+        })
+    stats.sort(key=lambda s: (-s['count'], s['id']))
+    return stats
+
+
+def throughput_by_shift(company_id, since):
+    rows = ShiftThroughput.query.filter(
+        ShiftThroughput.company_id == company_id,
+        ShiftThroughput.shift_start >= since
+    ).order_by(ShiftThroughput.shift_start).all()
+    return [{
+        'shift_start': row.shift_start.isoformat(),
+        'shift': SHIFT_START_HOURS.index(row.shift_start.hour) + 1 if row.shift_start.hour in SHIFT_START_HOURS else None,
+        'completed': row.completed,
+        'work_seconds': row.total_seconds,
+    } for row in rows]
+
+
+def work_in_progress(company_id):
+    # Open tasks only, so this stays an index range scan on (company_id, status)
+    rows = db.session.query(Task.status, func.count(Task.id), func.count(func.distinct(Task.responsible_id))).filter(
+        Task.company_id == company_id,
+        Task.status.in_(OPEN_STATUSES)
+    ).group_by(Task.status).all()
+    by_status = {status: {'tasks': 0, 'employees': 0} for status in OPEN_STATUSES}
+    for status, tasks, employees in rows:
+        by_status[status] = {'tasks': tasks, 'employees': employees}
+    return {
+        'by_status': by_status,
+        'total': sum(s['tasks'] for s in by_status.values()),
+        'generated_at': datetime.utcnow().isoformat(),
+    }
@@ -1,24 +1,71 @@
 import os
 import json
+import time
+import hmac
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify, abort
+from werkzeug.security import safe_join
+import config
 from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SECRET_KEY
 from extensions import db, migrate
+from connections import configure_database, pool_metrics
+from routing import read_only, replica_monitor
+from sql_profiler import sql_profiler
+from metrics import metrics, database_gauges
+from dashboard import (STATUS_BUCKETS, get_dashboard_tasks, change_task_status, count_new_tasks, forget_admin_task,
+                       admin_task_counts, admin_task_state, company_has_alarms, rebuild_status_summary,
+                       check_status_summary)
+from alarm_cache import alarm_index
+from blocking_tasks import blocking_task_cache, find_blocking_task
+from operation_bundle import load_operation_bundle, load_instruction_files
+from product_tree import component_company_id, load_product_tree, load_operations_batch, tree_operations
+from task_assignment import bulk_assign
+from pagination import page_from_request, wants_json
+from search_index import search_index, component_product_id
+from dependency_graph import DependencyCycleError, load_dependency_graph, describe_graph, unfinished_prerequisites
+from scheduler import schedule_admin_task, plan_rows
+from analytics import (DIMENSIONS, record_finished_task, rebuild_rollups, duration_stats, throughput_by_shift,
+                       work_in_progress)
+from resource_usage import (RESOURCES, get_resource, resource_usage, usage_summary, unlink_resource,
+                            demand_reports)
+from media_store import attach_files, detach_files, purge_blobs, import_folder
+from media_pipeline import media_pipeline, queue_media_job, remove_renditions, rendition_url
+from media_serving import IMMUTABLE_CACHE_CONTROL, file_fingerprint, send_media
+from chunked_uploads import (UploadError, parse_content_range, create_upload, get_upload, write_chunk,
+                             complete_upload, discard_uploads)
 import uuid
 from werkzeug.utils import secure_filename
 from models import *
 from functools import wraps
 import shutil
-from datetime import datetime
-from flask_socketio import SocketIO, emit
+from datetime import datetime, timedelta
+from flask_socketio import SocketIO, emit, join_room
+from socket_queue import cache_sync, socketio_options
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = SQLALCHEMY_TRACK_MODIFICATIONS
 app.config['SECRET_KEY'] = SECRET_KEY
-socketio = SocketIO(app)
+configure_database(app, config)
+app.config['SQL_PROFILING'] = getattr(config, 'SQL_PROFILING', False)
+# Largest file the chunked upload path accepts
+app.config['MAX_UPLOAD_SIZE'] = getattr(config, 'MAX_UPLOAD_SIZE', 4 * 1024 ** 3)
+app.config['METRICS_DIR'] = getattr(config, 'METRICS_DIR', None)
+app.config['METRICS_TOKEN'] = getattr(config, 'METRICS_TOKEN', None)
+# Several workers share room broadcasts through SOCKETIO_MESSAGE_QUEUE (see gunicorn.conf.py)
+socketio = SocketIO(app, async_mode=getattr(config, 'SOCKETIO_ASYNC_MODE', None),
+                    **socketio_options(getattr(config, 'SOCKETIO_MESSAGE_QUEUE', None)))
+cache_sync.init_app(socketio)
 db.init_app(app)
+pool_metrics.init_app(app, db)
+sql_profiler.init_app(app, db)
+metrics.init_app(app)
 migrate.init_app(app, db)
+for name in ('MEDIA_WORKERS', 'MEDIA_JOB_TIMEOUT', 'MEDIA_JOB_MAX_ATTEMPTS', 'MEDIA_REQUEUE_INTERVAL'):
+    if hasattr(config, name):
+        app.config[name] = getattr(config, name)
+media_pipeline.init_app(app)
+app.jinja_env.globals['rendition_url'] = rendition_url
 
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -31,6 +78,17 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    # Employee accounts share the company with the admin but not its internals
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        if not session.get('is_admin'):
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
 def task_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -39,20 +97,39 @@ def task_required(f):
         if not employee_id:
             return redirect(url_for('login'))
 
-        # Check if there is an "Alarm"
-        alarm_task = Task.query.filter_by(responsible_id=employee_id, status='Alarm').first()
-        if alarm_task:
-            alarm = Alarm.query.filter_by(task_id=alarm_task.id).first()
-            return redirect(url_for('alarm', alarm=alarm.id, task_id=alarm_task.id))
-
-        # Check if there is "У роботі"
-        working_task = Task.query.filter_by(responsible_id=employee_id, status='У роботі').first()
-        if working_task:
-            return redirect(url_for('instruction_page', task_id=working_task.id))
+        blocking = blocking_task_cache.get(employee_id)
+        if blocking and blocking['status'] == 'Alarm':
+            return redirect(url_for('alarm', alarm=blocking['alarm_id'], task_id=blocking['task_id']))
+        if blocking:
+            return redirect(url_for('instruction_page', task_id=blocking['task_id']))
 
         return f(*args, **kwargs)
     return decorated_function
 
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', ...) gets ?v=<content hash>, so those URLs can be cached forever
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        path = os.path.join(app.static_folder, values['filename'])
+        if os.path.isfile(path):
+            values['v'] = file_fingerprint(path)
+
+@app.after_request
+def cache_fingerprinted_static(response):
+    if request.endpoint == 'static' and response.status_code in (200, 206, 304):
+        version = request.args.get('v')
+        path = safe_join(app.static_folder, request.view_args.get('filename', ''))
+        if version and path and os.path.isfile(path) and version == file_fingerprint(path):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+@app.route('/media/<fingerprint>/<path:filename>')
+def media(fingerprint, filename):
+    path = safe_join(UPLOAD_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_media(path, fingerprint)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -72,6 +149,7 @@ def login():
         if account and account.check_password(password):
             session['user_id'] = account.id
             session['company_id'] = account.company_id
+            session['is_admin'] = account.is_admin
             if account.is_admin:
                 session['name'] = "Адміністратор"
                 return redirect(url_for('home'))
@@ -135,97 +213,111 @@ def register():
 
 @app.route('/home', methods=['GET', 'POST'])
 @login_required
+@read_only
 def home():
     company_id = session['company_id']
-    tasks = aTask.query.filter_by(company_id=company_id).all()
-
-    # Lists for each status
-    inactive_tasks = []
-    in_progress_tasks = []
-    completed_tasks = []
-    alarm_tasks = []
-
-    alarm = False
-
-    for task in tasks:
-        product = Product.query.filter_by(id=task.product_id, company_id=company_id).first()
-
-        actual_task = Task.query.filter_by(
-            company_id=company_id,
-            admin_task_id=task.id
-        ).first()
-
-        if actual_task:
-            task_info = {
-                'task_id': task.id,
-                'product_id': product.id if product else None,
-                'product_name': product.name if product else 'Unknown'
-            }
-
-            if actual_task.status == 'Не активне':
-                inactive_tasks.append(task_info)
-            elif actual_task.status == 'У роботі':
-                in_progress_tasks.append(task_info)
-            elif actual_task.status == 'Завершене':
-                completed_tasks.append(task_info)
-            elif actual_task.status == 'Alarm':
-                alarm_tasks.append(task_info)
-                alarm = True
+    dashboard = get_dashboard_tasks(company_id)
 
     return render_template(
         'main_admin.html',
         name=session['name'],
-        inactive_tasks=inactive_tasks,
-        in_progress_tasks=in_progress_tasks,
-        completed_tasks=completed_tasks,
-        alarm_tasks=alarm_tasks,
-        alarm=alarm
+        inactive_tasks=dashboard['inactive_tasks'],
+        in_progress_tasks=dashboard['in_progress_tasks'],
+        completed_tasks=dashboard['completed_tasks'],
+        alarm_tasks=dashboard['alarm_tasks'],
+        alarm=alarm_index.has_alarms(company_id)
     )
 
+def company_room(company_id):
+    return f'company_{company_id}'
+
+def publish_task_status(company_id, admin_task_id):
+    # Current counts of an admin task from task_status_summary; bucket is None once it is gone
+    counts = admin_task_counts(admin_task_id)
+    state = admin_task_state(counts)
+    socketio.emit('dashboard_status', {
+        'admin_task_id': admin_task_id,
+        'bucket': STATUS_BUCKETS[state] if state else None,
+        'counts': counts
+    }, to=company_room(company_id))
+
+def publish_alarm_change(company_id, task_id, active):
+    # Push the delta to every page of the company instead of having them poll.
+    # The flag comes from the summary table: this worker's alarm index may not
+    # have seen alarms raised on other workers yet
+    socketio.emit('alarm_status', {
+        'alarm': company_has_alarms(company_id),
+        'task_id': task_id,
+        'active': active
+    }, to=company_room(company_id))
+
+@socketio.on('connect')
+@metrics.socket_event('connect')
+@sql_profiler.socket_event('connect')
+def handle_connect():
+    company_id = session.get('company_id')
+    if not company_id:
+        return False
+    join_room(company_room(company_id))
+    # Current state is sent once, further changes are pushed by publish_alarm_change
+    emit('alarm_status', {'alarm': alarm_index.has_alarms(company_id)})
+
 @socketio.on('check_alarm')
+@metrics.socket_event('check_alarm')
+@sql_profiler.socket_event('check_alarm')
 def handle_check_alarm():
     company_id = session['company_id']
-    tasks = aTask.query.filter_by(company_id=company_id).all()
-
-    alarm = False
-    for task in tasks:
-        actual_task = Task.query.filter_by(company_id=company_id, admin_task_id=task.id).first()
-        if actual_task and actual_task.status == 'Alarm':
-            alarm = True
-            break
-
-    emit('alarm_status', {'alarm': alarm})
+    emit('alarm_status', {'alarm': alarm_index.has_alarms(company_id)})
 
 @app.route('/home_for_employee', methods=['GET', 'POST'])
 @login_required
+@read_only
 @task_required
 def home_for_employee():
     employee_id = session['employee_id']
-    tasks = Task.query.filter(
+    rows = db.session.query(Task.id, Operation.id, Operation.name).join(
+        Operation, Operation.id == Task.operation_id
+    ).filter(
         Task.responsible_id == employee_id,
         Task.status != "Завершене"
-    ).all()
-    task_data = []
-    for task in tasks:
-        operation = Operation.query.filter_by(id=task.operation_id).first()
-        if operation:
-            task_data.append({
-                'task_id': task.id,
-                'operation_id': operation.id,
-                'operation_name': operation.name
-            })
+    ).order_by(Task.id).all()
+    task_data = [{
+        'task_id': task_id,
+        'operation_id': operation_id,
+        'operation_name': operation_name
+    } for task_id, operation_id, operation_name in rows]
     return render_template('main_for_user.html', name=session['name'], tasks=task_data)
 
+# Sort keys of the name-only list pages (?sort=name, -name, id, -id)
+NAME_SORTS = {
+    model: {'name': model.name, 'id': model.id}
+    for model in (Tool, Material, Location, Product)
+}
+
+
+def name_item(row):
+    return {'id': row.id, 'name': row.name}
+
+
 @app.route('/employees', methods=['GET', 'POST'])
 @login_required
+@read_only
 def employees():
     company_id = session.get('company_id')
     is_admin = session.get('is_admin')
     if not company_id:
         return "Company ID not found in session", 400
 
-    employees = Employee.query.filter_by(company_id=company_id).all()
-    return render_template('edit_employees_list.html', employees=employees, name=session['name'])
+    page = page_from_request(
+        Employee.query.filter_by(company_id=company_id), Employee.id,
+        {'name': Employee.surname, 'id': Employee.id},
+        (Employee.surname, Employee.name, Employee.middle_name)
+    )
+    if wants_json():
+        return jsonify(page.to_dict(lambda e: {
+            'id': e.id, 'name': e.name, 'surname': e.surname, 'middle_name': e.middle_name
+        }))
+    return render_template('edit_employees_list.html', employees=page.items, page=page, name=session['name'])
 
 @app.route('/add_employee', methods=['GET', 'POST'])
 @login_required
@@ -260,6 +352,7 @@ def add_employee_action():
             unique_name = f"{uuid.uuid4().hex}{ext}"
             photo.save(os.path.join(UPLOAD_FOLDER, unique_name))
             photo_path = os.path.join(UPLOAD_FOLDER, unique_name)
+            queue_media_job(photo_path)
 
         employee = Employee(
             name=name,
@@ -280,6 +373,7 @@ def add_employee_action():
         db.session.add(employee)
         db.session.add(account)
         db.session.commit()
+        media_pipeline.dispatch()
         return redirect(url_for('employees'))
 
     return redirect(url_for('add_employee'))
@@ -297,6 +391,8 @@ def delete_employee(employee_id):
         db.session.delete(account)
 
     # Delete the photo if it exists
+    if employee.photo_path:
+        remove_renditions(employee.photo_path)
     if employee.photo_path and os.path.exists(employee.photo_path):
         try:
             os.remove(employee.photo_path)
@@ -336,6 +432,7 @@ def edit_employee(employee_id):
 
         if photo and allowed_file(photo.filename):
             if employee.photo_path:
+                remove_renditions(employee.photo_path)
                 full_old_path = os.path.join(app.root_path, 'static', employee.photo_path)
                 if os.path.exists(full_old_path):
                     os.remove(full_old_path)
@@ -346,6 +443,7 @@ def edit_employee(employee_id):
             photo.save(full_path)
             photo_path = os.path.join('uploads', unique_name)
             employee.photo_path = photo_path
+            queue_media_job(photo_path)
 
         # Employee update
         employee.name = name
@@ -354,19 +452,23 @@ def edit_employee(employee_id):
         employee.phone_number = new_phone
 
         db.session.commit()
+        media_pipeline.dispatch()
         return redirect(url_for('employees'))
 
     return render_template('edit_employee_info.html', employee=employee)
 
 @app.route('/edit_materials_list')
 @login_required
+@read_only
 def edit_materials_list():
     company_id = session.get('company_id')
     if not company_id:
         return "Company ID not found in session", 400
 
-    materials = Material.query.filter_by(company_id=company_id).all()
-    return render_template('edit_materials_list.html', materials=materials)
+    page = page_from_request(Material.query.filter_by(company_id=company_id), Material.id, NAME_SORTS[Material], (Material.name,))
+    if wants_json():
+        return jsonify(page.to_dict(name_item))
+    return render_template('edit_materials_list.html', materials=page.items, page=page)
 
 @app.route('/add-material', methods=['POST'])
 @login_required
@@ -380,6 +482,7 @@ def add_material():
     material = Material(name=name, company_id=company_id)
     db.session.add(material)
     db.session.commit()
+    search_index.upsert(company_id, 'material', material.id, material.name)
 
     return jsonify({"id": material.id, "name": material.name})
 
@@ -393,6 +496,7 @@ def edit_material(material_id):
         return jsonify({'error': 'Матеріал не знайдено'}), 404
     material.name = new_name
     db.session.commit()
+    search_index.upsert(material.company_id, 'material', material.id, material.name)
     return '', 204
 
 @app.route('/delete-material/<int:material_id>', methods=['DELETE'])
@@ -401,19 +505,27 @@ def delete_material(material_id):
     material = Material.query.get(material_id)
     if not material:
         return jsonify({'error': 'Матеріал не знайдено'}), 404
+    usage = usage_summary('material', material_id)
+    if usage['operations'] and not request.args.get('force'):
+        return jsonify(dict(usage, error='Матеріал використовується в операціях')), 409
+    unlink_resource('material', material_id)
     db.session.delete(material)
     db.session.commit()
+    search_index.remove(material.company_id, 'material', material_id)
     return '', 204
 
 @app.route('/edit_locations_list')
 @login_required
+@read_only
 def edit_locations_list():
     company_id = session.get('company_id')
     if not company_id:
         return "Company ID not found in session", 400
 
-    locations = Location.query.filter_by(company_id=company_id).all()
-    return render_template('edit_locations_list.html', locations=locations)
+    page = page_from_request(Location.query.filter_by(company_id=company_id), Location.id, NAME_SORTS[Location], (Location.name,))
+    if wants_json():
+        return jsonify(page.to_dict(name_item))
+    return render_template('edit_locations_list.html', locations=page.items, page=page)
 
 @app.route('/add-location', methods=['POST'])
 @login_required
@@ -427,6 +539,7 @@ def add_location():
         location = Location(name=name, company_id=company_id)
         db.session.add(location)
         db.session.commit()
+        search_index.upsert(company_id, 'location', location.id, location.name)
     return redirect(url_for('edit_locations_list'))
 
 @app.route('/edit-location/<int:location_id>', methods=['PUT'])
@@ -439,6 +552,7 @@ def edit_location(location_id):
         return jsonify({'error': 'Локацію не знайдено'}), 404
     location.name = new_name
     db.session.commit()
+    search_index.upsert(location.company_id, 'location', location.id, location.name)
     return '', 204
 
 @app.route('/delete-location/<int:location_id>', methods=['DELETE'])
@@ -447,19 +561,27 @@ def delete_location(location_id):
     location = Location.query.get(location_id)
     if not location:
         return jsonify({'error': 'Локацію не знайдено'}), 404
+    usage = usage_summary('location', location_id)
+    if usage['operations'] and not request.args.get('force'):
+        return jsonify(dict(usage, error='Локація використовується в операціях')), 409
+    unlink_resource('location', location_id)
     db.session.delete(location)
     db.session.commit()
+    search_index.remove(location.company_id, 'location', location_id)
     return '', 204
 
 @app.route('/edit_tools_list')
 @login_required
+@read_only
 def edit_tools_list():
     company_id = session.get('company_id')
     if not company_id:
         return "Company ID not found in session", 400
 
-    tools = Tool.query.filter_by(company_id=company_id).all()
-    return render_template('edit_tools_list.html', tools=tools)
+    page = page_from_request(Tool.query.filter_by(company_id=company_id), Tool.id, NAME_SORTS[Tool], (Tool.name,))
+    if wants_json():
+        return jsonify(page.to_dict(name_item))
+    return render_template('edit_tools_list.html', tools=page.items, page=page)
 
 @app.route('/add-tool', methods=['POST'])
 @login_required
@@ -473,6 +595,7 @@ def add_tool():
     tool = Tool(name=name, company_id=company_id)
     db.session.add(tool)
     db.session.commit()
+    search_index.upsert(company_id, 'tool', tool.id, tool.name)
     return jsonify({'id': tool.id}), 201
 
 @app.route('/edit-tool/<int:tool_id>', methods=['PUT'])
@@ -485,6 +608,7 @@ def edit_tool(tool_id):
         return jsonify({'error': 'Інструмент не знайдено'}), 404
     tool.name = new_name
     db.session.commit()
+    search_index.upsert(tool.company_id, 'tool', tool.id, tool.name)
     return '', 204
 
 @app.route('/delete-tool/<int:tool_id>', methods=['DELETE'])
@@ -493,20 +617,101 @@ def delete_tool(tool_id):
     tool = Tool.query.get(tool_id)
     if not tool:
         return jsonify({'error': 'Інсрумент не знайдено'}), 404
+    usage = usage_summary('tool', tool_id)
+    if usage['operations'] and not request.args.get('force'):
+        return jsonify(dict(usage, error='Інструмент використовується в операціях')), 409
+    unlink_resource('tool', tool_id)
     db.session.delete(tool)
     db.session.commit()
+    search_index.remove(tool.company_id, 'tool', tool_id)
     return '', 204
 
+RESOURCE_LABELS = {'tool': 'Інструмент', 'material': 'Матеріал', 'location': 'Локація'}
+RESOURCE_LIST_PAGES = {'tool': 'edit_tools_list', 'material': 'edit_materials_list', 'location': 'edit_locations_list'}
+
+@app.route('/usage/<kind>/<int:resource_id>')
+@login_required
+@read_only
+def resource_usage_view(kind, resource_id):
+    company_id = session.get('company_id')
+    if kind not in RESOURCES:
+        abort(404)
+    resource = get_resource(kind, resource_id, company_id)
+    if not resource:
+        if wants_json():
+            return jsonify({'error': 'Not found'}), 404
+        abort(404)
+
+    usage = resource_usage(kind, resource)
+    if wants_json():
+        return jsonify(usage)
+    return render_template(
+        'resource_usage.html',
+        usage=usage,
+        kind_label=RESOURCE_LABELS[kind],
+        back_url=url_for(RESOURCE_LIST_PAGES[kind]),
+        operation_names={op['id']: op['name'] for op in usage['operations']}
+    )
+
+@app.route('/demand_report')
+@login_required
+@read_only
+def demand_report():
+    company_id = session.get('company_id')
+    if not company_id:
+        return "Company ID not found in session", 400
+
+    report = demand_reports.get(company_id)
+    if wants_json():
+        return jsonify(report)
+    return render_template('demand_report.html', report=report)
+
+@app.route('/analytics')
+@login_required
+def analytics_page():
+    if not session.get('company_id'):
+        return "Company ID not found in session", 400
+    return render_template('analytics.html')
+
+@app.route('/analytics/durations')
+@login_required
+@read_only
+def analytics_durations():
+    # ?dimension=operation|employee|product&id=<optional key>
+    company_id = session.get('company_id')
+    dimension = request.args.get('dimension', 'operation')
+    if dimension not in DIMENSIONS:
+        return jsonify({'error': 'Unknown dimension'}), 400
+    stats = duration_stats(company_id, dimension, request.args.get('id', type=int))
+    return jsonify({'dimension': dimension, 'items': stats})
+
+@app.route('/analytics/throughput')
+@login_required
+@read_only
+def analytics_throughput():
+    days = min(max(request.args.get('days', 14, type=int), 1), 366)
+    since = datetime.utcnow() - timedelta(days=days)
+    return jsonify({'days': days, 'shifts': throughput_by_shift(session.get('company_id'), since)})
+
+@app.route('/analytics/wip')
+@login_required
+@read_only
+def analytics_wip():
+    return jsonify(work_in_progress(session.get('company_id')))
+
 @app.route('/edit_products_list')
 @login_required
+@read_only
 def edit_products_list():
     company_id = session.get('company_id')
     is_admin = session.get('is_admin')
     if not company_id:
         return "Company ID not found in session", 400
 
-    products = Product.query.filter_by(company_id=company_id).all()
-    return render_template('edit_products_list.html', products=products)
+    page = page_from_request(Product.query.filter_by(company_id=company_id), Product.id, NAME_SORTS[Product], (Product.name,))
+    if wants_json():
+        return jsonify(page.to_dict(name_item))
+    return render_template('edit_products_list.html', products=page.items, page=page)
 
 @app.route('/add_product', methods=['GET', 'POST'])
 @login_required
@@ -534,6 +739,7 @@ def add_product():
         product = Product(name=product_name, company_id=company_id)
         db.session.add(product)
         db.session.commit()
+        search_index.upsert(company_id, 'product', product.id, product.name, product_id=product.id)
 
         flash("Виріб додано успішно", 'success')
 
@@ -546,7 +752,7 @@ def add_product():
 
     product_id = request.args.get('product_id', type=int)
     if product_id:
-        product = Product.query.filter_by(id=product_id, company_id=company_id).first()
+        product = load_product_tree(product_id, company_id)
 
     return render_template('add_product.html', product=product, selected_component=selected_component)
 
@@ -560,6 +766,7 @@ def add_block(product_id):
         block = Block(name=block_name, product_id=product_id)
         db.session.add(block)
         db.session.commit()
+        search_index.upsert(session.get('company_id'), 'block', block.id, block.name, product_id=product_id)
         return '', 204  # успіх
     return 'Missing name', 400
 
@@ -573,6 +780,8 @@ def add_detail(block_id):
         detail = Detail(name=detail_name, block_id=block_id)
         db.session.add(detail)
         db.session.commit()
+        search_index.upsert(session.get('company_id'), 'detail', detail.id, detail.name,
+                            product_id=component_product_id('block', block_id))
         return '', 204
     return 'Missing name', 400
 
@@ -595,8 +804,59 @@ def delete_product(product_id):
 
     db.session.delete(product)
     db.session.commit()
+    search_index.remove_product(company_id, product_id)
     return jsonify({'success': True}), 200
 
+@app.route('/product_tree/<int:product_id>')
+@login_required
+def product_tree(product_id):
+    company_id = session.get('company_id')
+    admin_task_id = request.args.get('admin_task_id', type=int)
+    if admin_task_id and not aTask.query.filter_by(id=admin_task_id, company_id=company_id).first():
+        return jsonify({'error': 'Admin task not found'}), 404
+
+    tree = load_product_tree(product_id, company_id, admin_task_id)
+    if tree is None:
+        return jsonify({'error': 'Product not found'}), 404
+    return jsonify(tree)
+
+@app.route('/operations_batch')
+@login_required
+def operations_batch():
+    # ?admin_task_id=<id> | ?product_id=<id> | ?components=product:1,block:2,...
+    company_id = session.get('company_id')
+    admin_task_id = request.args.get('admin_task_id', type=int)
+    product_id = request.args.get('product_id', type=int)
+    tasks = []
+
+    if admin_task_id:
+        admin_task = aTask.query.filter_by(id=admin_task_id, company_id=company_id).first()
+        if not admin_task:
+            return jsonify({'error': 'Admin task not found'}), 404
+        tree = load_product_tree(admin_task.product_id, company_id, admin_task.id)
+        components = tree_operations(tree) if tree else {}
+        tasks = tree['tasks'] if tree else []
+    elif product_id:
+        tree = load_product_tree(product_id, company_id)
+        if tree is None:
+            return jsonify({'error': 'Product not found'}), 404
+        components = tree_operations(tree)
+    else:
+        pairs = []
+        for item in request.args.get('components', '').split(','):
+            component_type, _, component_id = item.partition(':')
+            if component_id.isdigit():
+                pairs.append((component_type, int(component_id)))
+        if not pairs:
+            return jsonify({'error': 'Components are required'}), 400
+        components = load_operations_batch(pairs, company_id)
+
+    response = jsonify({'components': components, 'tasks': tasks})
+    # Unchanged trees are answered with 304 Not Modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/get_operations/<component_type>/<int:component_id>')
 def get_operations(component_type, component_id):
     operations = Operation.query.filter_by(
@@ -719,39 +979,107 @@ def save_operation():
         dep_type, dep_id = dep.split(":")
         db.session.add(dComponent(component_id=int(dep_id), product_type=dep_type, operation_id=operation.id))
 
-    # 6. Download instructions
-    uid = str(uuid.uuid4())
-    base_path = os.path.join(UPLOAD_FOLDER)
-    photo_path = save_files(files.getlist("photos"), os.path.join(base_path, "photos", uid))
-    video_path = save_files(files.getlist("videos"), os.path.join(base_path, "videos", uid))
-    text_path = save_files(files.getlist("texts"), os.path.join(base_path, "text_instructions", uid))
-
-    instruction = Instruction(operation_id=operation.id, photo_path=photo_path, video_path=video_path, text_path=text_path)
+    # 6. Download instructions into the media store
+    instruction = Instruction(operation_id=operation.id, photo_path=None, video_path=None, text_path=None)
     db.session.add(instruction)
+    db.session.flush()
+
+    attach_files(instruction.id, "photo", files.getlist("photos"))
+    attach_files(instruction.id, "video", files.getlist("videos"))
+    attach_files(instruction.id, "text", files.getlist("texts"))
 
     db.session.commit()
-    return jsonify({"status": "success"})
+    media_pipeline.dispatch()
+    search_index.index_operation(session.get('company_id'), operation)
+    return jsonify({"status": "success", "operation_id": operation.id})
+
+@app.route('/media_uploads', methods=['POST'])
+@login_required
+def create_media_upload():
+    data = request.get_json(silent=True) or {}
+    operation = Operation.query.get_or_404(data.get('operation_id'))
+    if component_company_id(operation.product_type, operation.component_id) != session['company_id']:
+        abort(404)
+
+    instruction = Instruction.query.filter_by(operation_id=operation.id).first()
+    if not instruction:
+        instruction = Instruction(operation_id=operation.id, photo_path=None, video_path=None, text_path=None)
+        db.session.add(instruction)
+        db.session.flush()
 
-def save_files(file_list, target_folder):
-    if not os.path.exists(target_folder):
-        os.makedirs(target_folder)
+    try:
+        upload = create_upload(
+            instruction.id,
+            data.get('category'),
+            data.get('filename'),
+            data.get('size'),
+            data.get('sha256'),
+            max_size=app.config['MAX_UPLOAD_SIZE']
+        )
+    except UploadError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
+
+    return jsonify({'upload_id': upload.id, 'received': upload.received, 'size': upload.size}), 201
+
+@app.route('/media_uploads/<upload_id>', methods=['GET'])
+@login_required
+def media_upload_status(upload_id):
+    try:
+        upload = get_upload(upload_id, company_id=session['company_id'])
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({'upload_id': upload.id, 'received': upload.received, 'size': upload.size})
+
+@app.route('/media_uploads/<upload_id>', methods=['PUT'])
+@login_required
+def media_upload_chunk(upload_id):
+    try:
+        offset, length, total = parse_content_range(request.headers.get('Content-Range'))
+        # The body is read from the raw stream, Werkzeug does not buffer it
+        upload = write_chunk(upload_id, request.stream, offset, length, total, request.headers.get('X-Chunk-Sha256'),
+                             company_id=session['company_id'])
+    except UploadError as e:
+        response = {'error': e.message}
+        if e.received is not None:
+            response['received'] = e.received
+        return jsonify(response), e.status
+    return jsonify({'upload_id': upload.id, 'received': upload.received, 'size': upload.size})
+
+@app.route('/media_uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_media_upload(upload_id):
+    try:
+        released = complete_upload(upload_id, session['company_id'])
+    except UploadError as e:
+        db.session.rollback()
+        response = {'error': e.message}
+        if e.received is not None:
+            response['received'] = e.received
+        return jsonify(response), e.status
+    purge_blobs(released)
+    media_pipeline.dispatch()
+    return jsonify({"status": "success"})
 
-    for file in file_list:
-        filename = file.filename
-        if filename:
-            file.save(os.path.join(target_folder, filename))
-    return target_folder
+@app.route('/media_jobs')
+@admin_required
+def media_jobs():
+    return jsonify(media_pipeline.status(session['company_id']))
 
 @app.route('/delete_operation/<int:operation_id>', methods=['POST'])
 @login_required
 def delete_operation(operation_id):
     operation = Operation.query.get_or_404(operation_id)
 
-    # We get instructions for deleting directory paths
+    # We get instructions for releasing their files
     instruction = Instruction.query.filter_by(operation_id=operation_id).first()
+    released = []
 
     if instruction:
-        # Deleting directories if they exist
+        released = detach_files(instruction.id)
+        discard_uploads(instruction.id)
+
+        # Instructions uploaded before the media store keep their own directories
         for path in [instruction.photo_path, instruction.video_path, instruction.text_path]:
             if path and os.path.exists(path):
                 shutil.rmtree(path)
@@ -766,6 +1094,8 @@ def delete_operation(operation_id):
 
     db.session.delete(operation)
     db.session.commit()
+    purge_blobs(released)
+    search_index.remove_operation(session.get('company_id'), operation_id)
 
     return jsonify({"status": "success"})
 
@@ -783,29 +1113,25 @@ def update_operation(operation_id):
     # Download instructions or create a new one
     instruction = Instruction.query.filter_by(operation_id=operation_id).first()
     if not instruction:
-        uid = str(uuid.uuid4())
-        instruction = Instruction(
-            operation_id=operation_id,
-            photo_path=os.path.join(UPLOAD_FOLDER, "photos", uid),
-            video_path=os.path.join(UPLOAD_FOLDER, "videos", uid),
-            text_path=os.path.join(UPLOAD_FOLDER, "text_instructions", uid)
-        )
-        os.makedirs(instruction.photo_path, exist_ok=True)
-        os.makedirs(instruction.video_path, exist_ok=True)
-        os.makedirs(instruction.text_path, exist_ok=True)
+        instruction = Instruction(operation_id=operation_id, photo_path=None, video_path=None, text_path=None)
         db.session.add(instruction)
+        db.session.flush()
 
     # Delete individual files
+    released = []
     for category, path in [("photo", instruction.photo_path), ("video", instruction.video_path), ("text", instruction.text_path)]:
-        for filename in deleted_files.get(category, []):
-            file_path = os.path.join(path, filename)
-            if os.path.exists(file_path):
+        names = deleted_files.get(category, [])
+        released += detach_files(instruction.id, category, names)
+        # Files of instructions uploaded before the media store
+        for filename in names:
+            file_path = os.path.join(path, filename) if path else None
+            if file_path and os.path.exists(file_path):
                 os.remove(file_path)
 
     # Add new files
-    save_files(files.getlist("photos"), instruction.photo_path)
-    save_files(files.getlist("videos"), instruction.video_path)
-    save_files(files.getlist("texts"), instruction.text_path)
+    released += attach_files(instruction.id, "photo", files.getlist("photos"))
+    released += attach_files(instruction.id, "video", files.getlist("videos"))
+    released += attach_files(instruction.id, "text", files.getlist("texts"))
 
     # Location update
     db.session.query(LocationO).filter_by(operation_id=operation_id).delete()
@@ -826,6 +1152,9 @@ def update_operation(operation_id):
         db.session.add(dComponent(component_id=int(dep_id), product_type=dep_type, operation_id=operation_id))
 
     db.session.commit()
+    purge_blobs(released)
+    media_pipeline.dispatch()
+    search_index.index_operation(session.get('company_id'), operation)
     return jsonify({"status": "success"})
 
 @app.route('/edit_operation/<int:operation_id>')
@@ -865,17 +1194,10 @@ def edit_operation(operation_id):
     location_id = location_o.location_id if location_o else None
 
     instruction = Instruction.query.filter_by(operation_id=operation_id).first()
-    photo_files, video_files, text_files = [], [], []
-
-    def list_files_in_dir(folder_path):
-        if folder_path and os.path.exists(folder_path):
-            return os.listdir(folder_path)
-        return []
-
-    if instruction:
-        photo_files = list_files_in_dir(instruction.photo_path)
-        video_files = list_files_in_dir(instruction.video_path)
-        text_files = list_files_in_dir(instruction.text_path)
+    files = load_instruction_files(instruction)
+    photo_files = [f['name'] for f in files['photo']]
+    video_files = [f['name'] for f in files['video']]
+    text_files = [f['name'] for f in files['text']]
 
     # Name of the component
     obj = None
@@ -935,14 +1257,17 @@ def edit_operation(operation_id):
 
 @app.route('/task_product_list')
 @login_required
+@read_only
 def task_product_list():
     company_id = session.get('company_id')
     is_admin = session.get('is_admin')
     if not company_id:
         return "Company ID not found in session", 400
 
-    products = Product.query.filter_by(company_id=company_id).all()
-    return render_template('add_task.html', products=products)
+    page = page_from_request(Product.query.filter_by(company_id=company_id), Product.id, NAME_SORTS[Product], (Product.name,))
+    if wants_json():
+        return jsonify(page.to_dict(name_item))
+    return render_template('add_task.html', products=page.items, page=page)
 
 @app.route('/create_admin_task', methods=['POST'])
 @login_required
@@ -986,21 +1311,9 @@ def add_task():
     else:
         return "Product ID or Admin Task ID is required", 400
 
-    product = Product.query.filter_by(id=admin_task.product_id, company_id=company_id).first()
-
-    # Find already created tasks
-    existing_tasks = Task.query.filter_by(admin_task_id=admin_task.id).all()
-    task_map = [
-        {
-            "component_type": t.component_type,
-            "product_id": t.product_id,
-            "operation_id": t.operation_id,
-            "id": t.id,
-            "responsible_id": t.responsible_id,
-            "status": t.status,
-        }
-        for t in existing_tasks
-    ]
+    # Whole component tree together with already created tasks
+    product = load_product_tree(admin_task.product_id, company_id, admin_task.id)
+    task_map = product['tasks'] if product else []
 
     return render_template(
         'assign_task.html',
@@ -1031,7 +1344,9 @@ def create_task():
             company_id=company_id
         ).first()
 
+        previous_responsible_id = None
         if task:
+            previous_responsible_id = task.responsible_id
             task.responsible_id = employee_id
         else:
             task = Task(
@@ -1044,14 +1359,96 @@ def create_task():
                 admin_task_id=admin_task_id
             )
             db.session.add(task)
+            count_new_tasks(company_id, admin_task_id, 1)
 
         db.session.commit()
+        blocking_task_cache.invalidate(previous_responsible_id, task.responsible_id)
+        publish_task_status(company_id, task.admin_task_id)
 
         return jsonify({'message': 'Завдання успішно призначено'})  # ← ДОДАНО
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/bulk_assign_tasks', methods=['POST'])
+@login_required
+def bulk_assign_tasks():
+    # {"admin_task": id, "assignments": [{operation_id, component_type, component_id, employee_id}], "atomic": bool}
+    data = request.get_json(silent=True) or {}
+    company_id = session.get('company_id')
+    rows = data.get('assignments')
+    atomic = bool(data.get('atomic'))
+
+    if not isinstance(rows, list):
+        return jsonify({'error': 'Не передано план призначень'}), 400
+    admin_task = aTask.query.filter_by(id=data.get('admin_task'), company_id=company_id).first()
+    if not admin_task:
+        return jsonify({'error': 'Завдання не знайдено'}), 404
+
+    try:
+        summary, touched = bulk_assign(admin_task, rows, atomic=atomic)
+        if atomic and summary['conflicts']:
+            db.session.rollback()
+            summary['created'] = summary['updated'] = 0
+            return jsonify(summary), 409
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    blocking_task_cache.invalidate(*touched)
+    if summary['created']:
+        publish_task_status(company_id, admin_task.id)
+    summary['message'] = 'Завдання успішно призначено'
+    return jsonify(summary)
+
+@app.route('/admin_task_graph/<int:admin_task_id>')
+@login_required
+def admin_task_graph(admin_task_id):
+    # Topological order, critical path and cycles of the admin task's operations
+    admin_task = aTask.query.filter_by(id=admin_task_id, company_id=session.get('company_id')).first()
+    if not admin_task:
+        return jsonify({'error': 'Admin task not found'}), 404
+    graph = load_dependency_graph(admin_task)
+    if graph is None:
+        return jsonify({'error': 'Product not found'}), 404
+    return jsonify(describe_graph(graph))
+
+@app.route('/admin_task_schedule/<int:admin_task_id>', methods=['GET', 'POST'])
+@login_required
+def admin_task_schedule(admin_task_id):
+    # GET previews the automatic plan, POST recomputes it and assigns it in one go
+    admin_task = aTask.query.filter_by(id=admin_task_id, company_id=session.get('company_id')).first()
+    if not admin_task:
+        return jsonify({'error': 'Завдання не знайдено'}), 404
+
+    if request.method == 'POST':
+        employee_ids = (request.get_json(silent=True) or {}).get('employee_ids')
+    else:
+        employee_ids = request.args.getlist('employee_id', type=int)
+    try:
+        plan = schedule_admin_task(admin_task, employee_ids or None)
+    except DependencyCycleError as e:
+        return jsonify({'error': str(e), 'cycle': e.cycle}), 409
+    if plan is None:
+        return jsonify({'error': 'Виріб не знайдено'}), 404
+    if request.method == 'GET':
+        return jsonify(plan)
+
+    try:
+        summary, touched = bulk_assign(admin_task, plan_rows(plan))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    blocking_task_cache.invalidate(*touched)
+    if summary['created']:
+        publish_task_status(admin_task.company_id, admin_task.id)
+    summary['makespan_seconds'] = plan['makespan_seconds']
+    summary['message'] = 'Завдання успішно призначено'
+    return jsonify(summary)
+
 @app.route('/delete_admin_task/<int:task_id>', methods=['POST'])
 @login_required
 def delete_admin_task(task_id):
@@ -1060,12 +1457,21 @@ def delete_admin_task(task_id):
     if not admin_task:
         return redirect(url_for('home'))
 
+    company_id = admin_task.company_id
+    # Alarms of the deleted tasks have to leave the alarm index and the banners too
+    alarmed = [row[0] for row in db.session.query(Task.id).filter_by(admin_task_id=task_id, status='Alarm')]
     # Deleting tasks-related entries
     Task.query.filter_by(admin_task_id=task_id).delete()
+    forget_admin_task(task_id)
 
     # Deleting the entry itself from admin_tasks
     db.session.delete(admin_task)
     db.session.commit()
+    for alarmed_task_id in alarmed:
+        alarm_index.discard(company_id, alarmed_task_id)
+        publish_alarm_change(company_id, alarmed_task_id, False)
+    blocking_task_cache.clear()
+    publish_task_status(company_id, task_id)
 
     return redirect(url_for('home'))
 
@@ -1094,20 +1500,8 @@ def task_status():
     else:
         return "Product ID or Admin Task ID is required", 400
 
-    product = Product.query.filter_by(id=admin_task.product_id, company_id=company_id).first()
-
-    existing_tasks = Task.query.filter_by(admin_task_id=admin_task.id).all()
-    task_map = [
-        {
-            "component_type": t.component_type,
-            "product_id": t.product_id,
-            "operation_id": t.operation_id,
-            "id": t.id,
-            "responsible_id": t.responsible_id,
-            "status": t.status,
-        }
-        for t in existing_tasks
-    ]
+    product = load_product_tree(admin_task.product_id, company_id, admin_task.id)
+    task_map = product['tasks'] if product else []
 
     return render_template(
         'task_status.html',
@@ -1119,144 +1513,80 @@ def task_status():
 
 @app.route('/instruction_page', methods=['POST', 'GET'])
 @login_required
+@read_only
 def instruction_page():
     task_id = request.args.get('task_id')
     task = Task.query.filter_by(id=int(task_id)).first()
-    status = task.status
-    operation = Operation.query.filter_by(id=task.operation_id).first()
-    name = operation.name
-    instruction = Instruction.query.filter_by(operation_id=operation.id).first()
-
-    photos, videos, texts = [], [], []
-
-    def normalize_path_for_url(path):
-        if path:
-            return path.replace('\\', '/')
-        return path
-
-    photo_path = ""
-    video_path = ""
-    text_path = ""
-
-    if instruction:
-        # Normalize paths for URLs
-        photo_path = normalize_path_for_url(instruction.photo_path) or ""
-        video_path = normalize_path_for_url(instruction.video_path) or ""
-        text_path = normalize_path_for_url(instruction.text_path) or ""
-
-        # To read files from the file system, we will correctly form absolute paths
-        # If the database stores relative paths relative to static, add them
-        base_static_path = os.path.join(os.getcwd(), 'static')  # or where is your root static
-
-        def get_fs_path(url_path):
-            # Translate a URL-like path into a file system path (for os.listdir)
-            # If url_path starts with "static/", cut off static and add base_static_path
-            if url_path.startswith('static/'):
-                relative_part = url_path[len('static/'):]
-                return os.path.join(base_static_path, relative_part)
-            else:
-                # If there is no static at the beginning
-                return os.path.join(base_static_path, url_path)
-
-        if photo_path:
-            photo_dir = get_fs_path(photo_path)
-            if os.path.exists(photo_dir):
-                photos = [f for f in os.listdir(photo_dir) if os.path.isfile(os.path.join(photo_dir, f))]
-
-        if video_path:
-            video_dir = get_fs_path(video_path)
-            if os.path.exists(video_dir):
-                videos = [f for f in os.listdir(video_dir) if os.path.isfile(os.path.join(video_dir, f))]
-
-        if text_path:
-            text_dir = get_fs_path(text_path)
-            if os.path.exists(text_dir):
-                texts = [f for f in os.listdir(text_dir) if os.path.isfile(os.path.join(text_dir, f))]
-
-    material_links = MaterialO.query.filter_by(operation_id=operation.id).all()
-    tool_links = ToolO.query.filter_by(operation_id=operation.id).all()
-    location_link = LocationO.query.filter_by(operation_id=operation.id).first()
-
-    material_ids = [m.material_id for m in material_links]
-    materials = Material.query.filter(Material.id.in_(material_ids)).all() if material_ids else []
-
-    tool_ids = [t.tool_id for t in tool_links]
-    tools = Tool.query.filter(Tool.id.in_(tool_ids)).all() if tool_ids else []
-
-    location = Location.query.filter_by(id=location_link.location_id).first() if location_link else None
-
-    dependent_components = dComponent.query.filter_by(operation_id=operation.id).all()
-
-    dependencies = []
-
-    for dc in dependent_components:
-        component_id = dc.component_id
-        component_type = dc.product_type
-        component_name = "Невідомо"
-        product_id = None
-
-        if component_type == "product":
-            product = Product.query.get(component_id)
-            if product:
-                component_name = product.name
-                product_id = product.id
-
-        elif component_type == "block":
-            block = Block.query.get(component_id)
-            if block:
-                component_name = block.name
-                product_id = block.product_id
-
-        elif component_type == "detail":
-            detail = Detail.query.get(component_id)
-            if detail:
-                component_name = detail.name
-                block = Block.query.get(detail.block_id)
-                if block:
-                    product_id = block.product_id
-
-        dependencies.append({
-            'type': component_type,
-            'name': component_name,
-            'product_id': product_id
-        })
+    bundle = load_operation_bundle(task.operation_id)
 
     return render_template(
         'open_task.html',
-        name=name,
-        materials=materials,
-        location=location,
-        tools=tools,
-        dependencies=dependencies,
-        image_files=photos,
-        video_files=videos,
-        text_files=texts,
-        photo_path=photo_path,
-        video_path=video_path,
-        text_path=text_path,
+        name=bundle['name'],
+        materials=bundle['materials'],
+        location=bundle['location'],
+        tools=bundle['tools'],
+        dependencies=bundle['dependencies'],
+        image_files=bundle['photos'],
+        video_files=bundle['videos'],
+        text_files=bundle['texts'],
         emp_name = session['name'],
-        status=status,
+        status=task.status,
         task_id=task_id
     )
 
+@app.route('/operation_bundle/<int:operation_id>')
+@admin_required
+def operation_bundle(operation_id):
+    bundle = load_operation_bundle(operation_id, session['company_id'])
+    if bundle is None:
+        return jsonify({'error': 'Операцію не знайдено'}), 404
+    return jsonify(bundle)
+
 @app.route('/start_task/<int:task_id>')
 @login_required
 def start_task(task_id):
     task = Task.query.filter_by(id=task_id).first()
-    task.status = "У роботі"
-    task.start_time = datetime.utcnow()
-    db.session.add(task)
-    db.session.commit()
+
+    # Operations this one depends on have to be finished first
+    waiting_for = unfinished_prerequisites(task)
+    if waiting_for:
+        names = dict(db.session.query(Operation.id, Operation.name).filter(
+            Operation.id.in_([t.operation_id for t in waiting_for])
+        ).all())
+        flash('Спочатку мають бути завершені: ' + ', '.join(
+            sorted({names.get(t.operation_id, 'Невідомо') for t in waiting_for})
+        ), 'error')
+        return redirect(url_for('instruction_page', task_id=task.id))
+
+    # task_required may have passed on another worker's stale cache: the primary
+    # decides whether the employee is still busy. The row lock serializes
+    # concurrent starts of one employee.
+    Employee.query.filter_by(id=task.responsible_id).with_for_update().first()
+    blocking = find_blocking_task(task.responsible_id)
+    if blocking and blocking['task_id'] != task.id:
+        db.session.rollback()
+        blocking_task_cache.invalidate(task.responsible_id)
+        if blocking['status'] == 'Alarm':
+            return redirect(url_for('alarm', alarm=blocking['alarm_id'], task_id=blocking['task_id']))
+        return redirect(url_for('instruction_page', task_id=blocking['task_id']))
+
+    if change_task_status(task, "У роботі"):
+        task.start_time = datetime.utcnow()
+        db.session.commit()
+        blocking_task_cache.invalidate(task.responsible_id)
+        publish_task_status(task.company_id, task.admin_task_id)
     return redirect(url_for('instruction_page', task_id=task.id))
 
 @app.route('/finish_task/<int:task_id>')
 @login_required
 def finish_task(task_id):
     task = Task.query.filter_by(id=task_id).first()
-    task.status = "Завершене"
-    task.end_time = datetime.utcnow()
-    db.session.add(task)
-    db.session.commit()
+    if change_task_status(task, "Завершене"):
+        task.end_time = datetime.utcnow()
+        record_finished_task(task)
+        db.session.commit()
+        blocking_task_cache.invalidate(task.responsible_id)
+        publish_task_status(task.company_id, task.admin_task_id)
     return redirect(url_for('home_for_employee'))
 
 
@@ -1283,9 +1613,12 @@ def submit_alarm(task_id):
     alarm = Alarm(task_id=task_id, text=text)
     db.session.add(alarm)
     task = Task.query.filter_by(id=task_id).first()
-    task.status = "Alarm"
-    db.session.add(task)
+    change_task_status(task, "Alarm")
     db.session.commit()
+    alarm_index.add(task.company_id, task.id)
+    blocking_task_cache.invalidate(task.responsible_id)
+    publish_alarm_change(task.company_id, task.id, True)
+    publish_task_status(task.company_id, task.admin_task_id)
     return redirect(url_for('alarm', alarm = alarm.id, task_id=task_id))
 
 
@@ -1302,6 +1635,66 @@ def folder_create(name, relative_dir):
         os.mkdir(target_folder)
         print(f'Folder "{name}" successfully created!')
 
+@app.cli.command('import-instruction-media')
+def import_instruction_media():
+    """Move instruction files from per-operation folders into the media store."""
+    instructions = Instruction.query.filter(
+        (Instruction.photo_path.isnot(None)) |
+        (Instruction.video_path.isnot(None)) |
+        (Instruction.text_path.isnot(None))
+    ).all()
+
+    for instruction in instructions:
+        folders = [("photo", instruction.photo_path), ("video", instruction.video_path), ("text", instruction.text_path)]
+        for category, path in folders:
+            if path and os.path.isdir(path):
+                import_folder(instruction.id, category, path)
+
+        instruction.photo_path = None
+        instruction.video_path = None
+        instruction.text_path = None
+        db.session.commit()
+
+        for category, path in folders:
+            if path and os.path.isdir(path):
+                shutil.rmtree(path)
+        print(f'Instruction {instruction.id} imported')
+
+    media_pipeline.dispatch()
+
+@app.cli.command('dispatch-media-jobs')
+def dispatch_media_jobs():
+    """Re-queue media jobs of dead workers and process everything queued (for cron)."""
+    requeued = media_pipeline.requeue_stale()
+    media_pipeline.dispatch()
+    media_pipeline.wait()
+    print(f'{requeued} stale jobs re-queued')
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics():
+    """Recompute duration histograms and shift throughput from the tasks table."""
+    tasks = rebuild_rollups()
+    db.session.commit()
+    print(f'Rollups rebuilt from {tasks} finished tasks')
+
+@app.cli.command('rebuild-status-summary')
+def rebuild_status_summary_command():
+    """Recompute task_status_summary from the tasks table."""
+    rows = rebuild_status_summary()
+    db.session.commit()
+    print(f'Status summary rebuilt: {rows} rows')
+
+@app.cli.command('check-status-summary')
+def check_status_summary_command():
+    """Compare task_status_summary with the tasks table and list any drift."""
+    drift = check_status_summary()
+    for row in drift:
+        print(f"company {row['company_id']}, admin task {row['admin_task_id']}, {row['status']}: "
+              f"summary {row['summary']}, tasks {row['actual']}")
+    if drift:
+        raise SystemExit(f'{len(drift)} rows out of sync, run "flask rebuild-status-summary"')
+    print('Status summary is consistent')
+
 @app.route('/alarm_for_admin')
 @login_required
 def alarm_for_admin():
@@ -1313,43 +1706,120 @@ def alarm_for_admin():
     responsible_id = task.responsible_id
     employee = Employee.query.filter_by(id=responsible_id).first()
     responsible_name = f"{employee.surname} {employee.name} {employee.middle_name}"
-    location_o = LocationO.query.filter_by(operation_id=operation.id).first()
-    location = Location.query.filter_by(id=location_o.location_id).first()
-    location_name = location.name
+    # The location may have been unlinked by a forced delete
+    location = db.session.query(Location.name).join(
+        LocationO, LocationO.location_id == Location.id
+    ).filter(LocationO.operation_id == operation.id).order_by(LocationO.id).first()
+    location_name = location.name if location else "Невідомо"
     alarm = Alarm.query.filter_by(task_id=task_id).first()
     return render_template('alarm_for_admin.html', operation=operation.name, task_id=task_id, name=name, responsible=responsible_name, location=location_name, alarm=alarm.text)
 
 @app.route('/alarm_list_admin')
 @login_required
+@read_only
 def alarm_list_admin():
     company_id = session['company_id']
-    tasks = Task.query.filter(
-        Task.company_id == company_id,
-        Task.status == "Alarm"
-    ).all()
+    task_ids = alarm_index.task_ids(company_id)
     task_data = []
-    for task in tasks:
-        operation = Operation.query.filter_by(id=task.operation_id).first()
-        if operation:
+    if task_ids:
+        rows = db.session.query(Task.id, Operation.id, Operation.name).join(
+            Operation, Operation.id == Task.operation_id
+        ).filter(
+            Task.id.in_(task_ids),
+            Task.status == "Alarm"
+        ).order_by(Task.id).all()
+        for task_id, operation_id, operation_name in rows:
             task_data.append({
-                'task_id': task.id,
-                'operation_id': operation.id,
-                'operation_name': operation.name
+                'task_id': task_id,
+                'operation_id': operation_id,
+                'operation_name': operation_name
             })
     return render_template('alarm_list_admin.html', name=session['name'], tasks=task_data)
 
+SEARCH_KINDS = ('product', 'block', 'detail', 'operation', 'tool', 'material', 'location', 'instruction')
+
+
+def search_result_url(result):
+    kind = result['type']
+    if kind in ('product', 'block', 'detail') and result.get('product_id'):
+        return url_for('add_product', product_id=result['product_id'])
+    if kind in ('operation', 'instruction'):
+        return url_for('edit_operation', operation_id=result['id'])
+    if kind in RESOURCES:
+        return url_for('resource_usage_view', kind=kind, resource_id=result['id'])
+    return None
+
+@app.route('/search')
+@login_required
+@read_only
+def search():
+    # ?q=<words, prefixes or one-typo words>&type=tool,material&limit=20
+    company_id = session.get('company_id')
+    if not company_id:
+        return jsonify({'error': 'Company ID not found in session'}), 400
+
+    query = request.args.get('q', '').strip()
+    kinds = None
+    if request.args.get('type'):
+        kinds = {k for k in request.args.get('type').split(',') if k in SEARCH_KINDS}
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+
+    started = time.perf_counter()
+    results = search_index.search(company_id, query, kinds, limit)
+    took_ms = (time.perf_counter() - started) * 1000
+
+    for result in results:
+        result['url'] = search_result_url(result)
+    return jsonify({'query': query, 'results': results, 'took_ms': round(took_ms, 3)})
+
+@app.route('/search_index_stats')
+@admin_required
+def search_index_stats():
+    return jsonify(search_index.stats(session['company_id']))
+
+@app.route('/alarm_cache_stats')
+@admin_required
+def alarm_cache_stats():
+    return jsonify(alarm_index.stats(session['company_id']))
+
+@app.route('/sql_profile')
+@admin_required
+def sql_profile():
+    return jsonify(sql_profiler.stats(session['company_id']))
+
+@app.route('/db_pool_stats')
+@admin_required
+def db_pool_stats():
+    return jsonify(dict(pool_metrics.stats(), replica=replica_monitor.stats()))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Scrapers authenticate with METRICS_TOKEN and see every company; a company
+    # admin's browser session sees the request metrics and its own company only
+    token = app.config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return metrics.response(database_gauges())
+    if 'user_id' not in session:
+        abort(401)
+    if not session.get('is_admin'):
+        abort(403)
+    return metrics.response(database_gauges(session['company_id']))
+
 @app.route('/delete_alarm/<int:task_id>')
 @login_required
 def delete_alarm(task_id):
     task = Task.query.filter_by(id=task_id).first()
-    task.status = "У роботі"
+    change_task_status(task, "У роботі")
 
-    db.session.add(task)
     alarm = Alarm.query.filter_by(task_id=task_id).first()
-    socketio.emit('alarm_cleared', {'alarm_id': alarm.id})
+    socketio.emit('alarm_cleared', {'alarm_id': alarm.id}, to=company_room(task.company_id))
     db.session.delete(alarm)
     db.session.commit()
-    return redirect(url_for('home')) 
+    alarm_index.discard(task.company_id, task.id)
+    blocking_task_cache.invalidate(task.responsible_id)
+    publish_alarm_change(task.company_id, task.id, False)
+    publish_task_status(task.company_id, task.admin_task_id)
+    return redirect(url_for('home'))
 
 if __name__ == '__main__':
     folder_create('uploads', 'static')
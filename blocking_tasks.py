@@ -0,0 +1,96 @@
+import threading
+import time
+
+from sqlalchemy import case
+
+from extensions import db
+from models import Alarm, Task
+from routing import on_primary
+from socket_queue import cache_sync
+
+BLOCKING_STATUSES = ('Alarm', 'У роботі')
+
+
+@on_primary()
+def find_blocking_task(employee_id):
+    # An alarm outranks a task in progress; the alarm row comes in the same query.
+    # Read from the primary: the result is cached for every page of the employee
+    row = db.session.query(Task.id, Task.status, Alarm.id).outerjoin(
+        Alarm, Alarm.task_id == Task.id
+    ).filter(
+        Task.responsible_id == employee_id,
+        Task.status.in_(BLOCKING_STATUSES)
+    ).order_by(
+        case((Task.status == 'Alarm', 0), else_=1),
+        Task.id,
+        Alarm.id
+    ).first()
+
+    if row is None:
+        return None
+    task_id, status, alarm_id = row
+    return {'task_id': task_id, 'status': status, 'alarm_id': alarm_id}
+
+
+class BlockingTaskCache:
+    """Per-employee cache of the task that employee pages must redirect to.
+
+    Entries are dropped by the routes that change a task status, in every
+    worker through cache_sync; ttl bounds how long a lost message can go
+    unnoticed.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}   # employee_id -> (blocking task or None, time.monotonic())
+        self._versions = {}  # employee_id -> invalidation counter
+        self._epoch = 0      # bumped by clear()
+
+    def get(self, employee_id):
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                return entry[0]
+            version = (self._epoch, self._versions.get(employee_id, 0))
+
+        blocking = find_blocking_task(employee_id)
+
+        with self._lock:
+            # Skip storing if the entry was invalidated while the query was running
+            if (self._epoch, self._versions.get(employee_id, 0)) == version:
+                self._entries[employee_id] = (blocking, time.monotonic())
+        return blocking
+
+    def invalidate(self, *employee_ids):
+        employee_ids = sorted({int(e) for e in employee_ids if e is not None})
+        self._invalidate(employee_ids)
+        if employee_ids:
+            cache_sync.publish('blocking_tasks', employee_ids=employee_ids)
+
+    def _invalidate(self, employee_ids):
+        with self._lock:
+            for employee_id in employee_ids:
+                self._entries.pop(employee_id, None)
+                self._versions[employee_id] = self._versions.get(employee_id, 0) + 1
+
+    def clear(self):
+        self._clear()
+        cache_sync.publish('blocking_tasks', employee_ids=None)
+
+    def _clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+
+blocking_task_cache = BlockingTaskCache()
+
+
+@cache_sync.handler('blocking_tasks')
+def _invalidate_published(employee_ids):
+    # None stands for clear()
+    if employee_ids is None:
+        blocking_task_cache._clear()
+    else:
+        blocking_task_cache._invalidate(employee_ids)
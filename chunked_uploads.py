@@ -0,0 +1,160 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from extensions import db
+from media_store import CATEGORIES, CHUNK_SIZE, attach_blob, new_temp_path, store_temp_file
+from models import Instruction, MediaUpload, Operation
+from product_tree import component_company_id
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.received = received  # bytes the server has, for the client to resume from
+
+
+def parse_content_range(header):
+    # "bytes <first>-<last>/<total>" -> (offset, length, total)
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Некоректний заголовок Content-Range')
+    first, last, total = (int(value) for value in match.groups())
+    if last < first:
+        raise UploadError('Некоректний заголовок Content-Range')
+    return first, last - first + 1, total
+
+
+def create_upload(instruction_id, category, filename, size, sha256=None, max_size=None):
+    if category not in CATEGORIES:
+        raise UploadError('Невідома категорія файлу')
+    if not filename:
+        raise UploadError('Відсутня назва файлу')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Некоректний розмір файлу')
+    if size < 0:
+        raise UploadError('Некоректний розмір файлу')
+    if max_size is not None and size > max_size:
+        raise UploadError('Файл завеликий', 413)
+
+    temp_path = new_temp_path()
+    open(temp_path, 'wb').close()
+
+    upload = MediaUpload(
+        id=uuid.uuid4().hex,
+        instruction_id=instruction_id,
+        category=category,
+        filename=filename,
+        size=size,
+        sha256=sha256.lower() if sha256 else None,
+        temp_path=temp_path
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def instruction_company_id(instruction_id):
+    row = db.session.query(Operation.product_type, Operation.component_id).join(
+        Instruction, Instruction.operation_id == Operation.id
+    ).filter(Instruction.id == instruction_id).first()
+    return component_company_id(*row) if row else None
+
+
+def get_upload(upload_id, lock=False, company_id=None):
+    # With company_id, uploads of other companies' instructions are reported as missing
+    query = MediaUpload.query.filter_by(id=upload_id)
+    if lock:
+        query = query.with_for_update()
+    upload = query.first()
+    if upload is None or (company_id is not None and instruction_company_id(upload.instruction_id) != company_id):
+        raise UploadError('Завантаження не знайдено', 404)
+    return upload
+
+
+def write_chunk(upload_id, stream, offset, length, total, chunk_sha256=None, company_id=None):
+    """Append one chunk to the upload's file, reading the body in bounded pieces.
+
+    The chunk must start where the previous one ended; otherwise a 409 tells
+    the client how many bytes the server already has.
+    """
+    upload = get_upload(upload_id, lock=True, company_id=company_id)
+    if total != upload.size or offset + length > upload.size:
+        raise UploadError('Розмір не збігається з оголошеним')
+    if offset != upload.received:
+        raise UploadError('Невірне зміщення', 409, received=upload.received)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(upload.temp_path, 'r+b') as out:
+        out.seek(offset)
+        while written < length:
+            data = stream.read(min(CHUNK_SIZE, length - written))
+            if not data:
+                break
+            out.write(data)
+            digest.update(data)
+            written += len(data)
+
+        if written != length or (chunk_sha256 and digest.hexdigest() != chunk_sha256.lower()):
+            # Drop the partial / corrupted chunk, the client resends it from upload.received
+            out.truncate(offset)
+            db.session.rollback()
+            raise UploadError('Частину файлу отримано пошкодженою', 422)
+
+    upload.received = offset + written
+    db.session.commit()
+    return upload
+
+
+def complete_upload(upload_id, company_id=None):
+    """Verify the assembled file and attach it to the instruction in one transaction.
+
+    Returns blob ids released by a replaced file of the same name, for purge_blobs.
+    """
+    upload = get_upload(upload_id, lock=True, company_id=company_id)
+    if upload.received != upload.size:
+        raise UploadError('Файл завантажено не повністю', 409, received=upload.received)
+
+    digest = hashlib.sha256()
+    with open(upload.temp_path, 'rb') as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    sha256 = digest.hexdigest()
+    if upload.sha256 and upload.sha256 != sha256:
+        raise UploadError('Контрольна сума не збігається', 422)
+
+    # The store takes a second name of the file, so the upload keeps its own
+    # until the commit: if the commit fails, the client can complete it again
+    store_path = new_temp_path()
+    try:
+        os.link(upload.temp_path, store_path)
+    except OSError:
+        shutil.copyfile(upload.temp_path, store_path)
+    blob_id = store_temp_file(store_path, upload.filename, sha256, upload.size)
+    released = attach_blob(upload.instruction_id, upload.category, upload.filename, blob_id)
+    temp_path = upload.temp_path
+    db.session.delete(upload)
+    db.session.commit()
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    return released
+
+
+def discard_uploads(instruction_id):
+    # Unfinished uploads of an instruction that is about to be deleted
+    for upload in MediaUpload.query.filter_by(instruction_id=instruction_id).all():
+        if os.path.exists(upload.temp_path):
+            os.remove(upload.temp_path)
+        db.session.delete(upload)
@@ -0,0 +1,177 @@
+import threading
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Pool settings per worker process: every gunicorn worker opens up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so keep
+# WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's limit
+DEFAULTS = {
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    'DB_POOL_TIMEOUT': 10,
+    # Below MySQL's wait_timeout and the idle timeouts of proxies in between
+    'DB_POOL_RECYCLE': 1800,
+    'DB_STATEMENT_TIMEOUT_MS': None,
+    'REPLICA_DATABASE_URI': None,
+    # Reads fall back to the primary while the replica is further behind than this
+    'REPLICA_MAX_LAG_SECONDS': 5,
+    # After a commit the user's reads stay on the primary this long (read-your-writes)
+    'REPLICA_STICKY_SECONDS': 5,
+}
+REPLICA_BIND = 'replica'
+
+
+def _statement_timeout_args(url, timeout_ms):
+    backend = make_url(url).get_backend_name()
+    if not timeout_ms:
+        return {}
+    if backend == 'mysql':
+        # Applies to SELECTs only, MySQL has no general statement timeout
+        return {'init_command': f'SET SESSION max_execution_time={int(timeout_ms)}'}
+    if backend == 'postgresql':
+        return {'options': f'-c statement_timeout={int(timeout_ms)}'}
+    return {}
+
+
+def engine_options(url, settings):
+    options = {'pool_pre_ping': True}
+    if make_url(url).get_backend_name() == 'sqlite' and make_url(url).database in (None, '', ':memory:'):
+        # An in-memory database lives in a single connection, there is nothing to pool
+        return options
+    options.update(
+        pool_size=settings['DB_POOL_SIZE'],
+        max_overflow=settings['DB_MAX_OVERFLOW'],
+        pool_timeout=settings['DB_POOL_TIMEOUT'],
+        pool_recycle=settings['DB_POOL_RECYCLE'],
+    )
+    connect_args = _statement_timeout_args(url, settings['DB_STATEMENT_TIMEOUT_MS'])
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_database(app, config):
+    """Pool options for the primary database and the optional read replica bind."""
+    settings = {name: getattr(config, name, default) for name, default in DEFAULTS.items()}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], settings)
+    replica = settings['REPLICA_DATABASE_URI']
+    if replica:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = dict(
+            engine_options(replica, settings), url=replica
+        )
+    app.config['REPLICA_MAX_LAG_SECONDS'] = settings['REPLICA_MAX_LAG_SECONDS']
+    app.config['REPLICA_STICKY_SECONDS'] = settings['REPLICA_STICKY_SECONDS']
+    return settings
+
+
+class PoolMetrics:
+    """Checkouts, connection churn and hold times per engine and per request.
+
+    Checkouts per request and how long a request held connections show
+    whether the pool is sized right. connects growing together with
+    requests means connections are churned rather than reused.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self.counters = {}  # engine name -> {'connects', 'checkouts', 'invalidated'}
+        self.requests = 0
+        self.timeouts = 0
+        self.max_checkouts_per_request = 0
+        self.total_checkouts_per_request = 0
+        self.max_held_ms_per_request = 0.0
+        self.total_held_ms = 0.0
+
+    def init_app(self, app, db):
+        with app.app_context():
+            for bind, engine in db.engines.items():
+                self.watch(bind or 'default', engine)
+
+        @app.before_request
+        def start_pool_metrics():
+            g.db_checkouts = 0
+            g.db_held_ms = 0.0
+            g.db_records = []
+
+        @app.teardown_request
+        def finish_pool_metrics(exc):
+            if 'db_checkouts' not in g:
+                return
+            # The session gives its connection back only after the request, when
+            # the app context is torn down: count it as held until now
+            held_ms = g.get('db_held_ms', 0.0)
+            now = time.perf_counter()
+            for record in g.get('db_records', ()):
+                started = record.info.pop('checked_out_at', None)
+                if started is not None:
+                    held_ms += (now - started) * 1000
+            with self._lock:
+                self.requests += 1
+                if isinstance(exc, PoolTimeoutError):
+                    self.timeouts += 1
+                self.total_checkouts_per_request += g.db_checkouts
+                self.max_checkouts_per_request = max(self.max_checkouts_per_request, g.db_checkouts)
+                self.total_held_ms += held_ms
+                self.max_held_ms_per_request = max(self.max_held_ms_per_request, held_ms)
+
+    def watch(self, name, engine):
+        with self._lock:
+            self._engines[name] = engine
+            self.counters[name] = {'connects': 0, 'checkouts': 0, 'invalidated': 0}
+
+        def count(key):
+            with self._lock:
+                self.counters[name][key] += 1
+
+        @event.listens_for(engine, 'connect')
+        def on_connect(dbapi_connection, record):
+            count('connects')
+
+        @event.listens_for(engine, 'invalidate')
+        def on_invalidate(dbapi_connection, record, exc):
+            count('invalidated')
+
+        @event.listens_for(engine, 'checkout')
+        def on_checkout(dbapi_connection, record, proxy):
+            count('checkouts')
+            record.info['checked_out_at'] = time.perf_counter()
+            if has_request_context():
+                g.db_checkouts = g.get('db_checkouts', 0) + 1
+                g.setdefault('db_records', []).append(record)
+
+        @event.listens_for(engine, 'checkin')
+        def on_checkin(dbapi_connection, record):
+            started = record.info.pop('checked_out_at', None)
+            if started is not None and has_request_context():
+                g.db_held_ms = g.get('db_held_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+    def stats(self):
+        with self._lock:
+            engines = {}
+            for name, engine in self._engines.items():
+                pool = engine.pool
+                engines[name] = dict(
+                    self.counters[name],
+                    pool=type(pool).__name__,
+                    size=pool.size() if hasattr(pool, 'size') else None,
+                    checked_out=pool.checkedout() if hasattr(pool, 'checkedout') else None,
+                    overflow=pool.overflow() if hasattr(pool, 'overflow') else None,
+                    checked_in=pool.checkedin() if hasattr(pool, 'checkedin') else None,
+                )
+            return {
+                'engines': engines,
+                'requests': self.requests,
+                'timeouts': self.timeouts,
+                'avg_checkouts_per_request': self.total_checkouts_per_request / self.requests if self.requests else 0.0,
+                'max_checkouts_per_request': self.max_checkouts_per_request,
+                'avg_held_ms_per_request': self.total_held_ms / self.requests if self.requests else 0.0,
+                'max_held_ms_per_request': self.max_held_ms_per_request,
+            }
+
+
+pool_metrics = PoolMetrics()
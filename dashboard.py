@@ -0,0 +1,195 @@
+from sqlalchemy import func, and_, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from extensions import db
+from models import aTask, Product, Task, TaskStatusSummary
+from routing import on_primary
+
+NEW_STATUS = 'Не активне'
+DONE_STATUS = 'Завершене'
+ALARM_STATUS = 'Alarm'
+IN_PROGRESS_STATUS = 'У роботі'
+
+# Admin task state -> key of the list rendered by main_admin.html
+STATUS_BUCKETS = {
+    'Не активне': 'inactive_tasks',
+    'У роботі': 'in_progress_tasks',
+    'Завершене': 'completed_tasks',
+    'Alarm': 'alarm_tasks',
+}
+
+
+# --- maintenance ----------------------------------------------------------------
+# Every change of Task.status goes through here, in the same transaction as the
+# change itself, so task_status_summary always matches tasks after a commit.
+
+def _adjust(company_id, admin_task_id, status, delta):
+    conditions = (
+        TaskStatusSummary.company_id == company_id,
+        TaskStatusSummary.admin_task_id == admin_task_id,
+        TaskStatusSummary.status == status,
+    )
+    for _ in range(2):
+        result = db.session.execute(
+            update(TaskStatusSummary).where(*conditions).values(count=TaskStatusSummary.count + delta)
+        )
+        if result.rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(TaskStatusSummary).values(
+                    company_id=company_id, admin_task_id=admin_task_id, status=status, count=delta
+                ))
+            return
+        except IntegrityError:
+            # Somebody created the row in between: adjust it instead
+            continue
+
+
+def count_new_tasks(company_id, admin_task_id, count, status=NEW_STATUS):
+    if count:
+        _adjust(company_id, admin_task_id, status, count)
+
+
+def change_task_status(task, status):
+    """Move a task to `status` and update the summary; the caller commits.
+
+    The status is only changed if nobody changed it since the task was
+    loaded. Returns False if the task already had `status` or lost that
+    race, so callers can skip side effects of the transition.
+    """
+    previous = task.status
+    if previous == status:
+        return False
+    result = db.session.execute(
+        update(Task).where(Task.id == task.id, Task.status == previous).values(status=status)
+    )
+    if not result.rowcount:
+        db.session.refresh(task, ['status'])
+        return False
+    set_committed_value(task, 'status', status)
+    _adjust(task.company_id, task.admin_task_id, previous, -1)
+    _adjust(task.company_id, task.admin_task_id, status, 1)
+    return True
+
+
+def forget_admin_task(admin_task_id):
+    TaskStatusSummary.query.filter_by(admin_task_id=admin_task_id).delete(synchronize_session=False)
+
+
+def _actual_counts(company_id=None):
+    query = db.session.query(Task.company_id, Task.admin_task_id, Task.status, func.count(Task.id)).filter(
+        Task.status.isnot(None)
+    )
+    if company_id is not None:
+        query = query.filter(Task.company_id == company_id)
+    return {
+        (company, admin_task_id, status): count
+        for company, admin_task_id, status, count in query.group_by(Task.company_id, Task.admin_task_id, Task.status)
+    }
+
+
+def rebuild_status_summary(company_id=None):
+    """Recompute the summary from tasks; the caller commits. Returns the number of rows."""
+    query = TaskStatusSummary.query
+    if company_id is not None:
+        query = query.filter_by(company_id=company_id)
+    query.delete(synchronize_session=False)
+
+    rows = [{'company_id': company, 'admin_task_id': admin_task_id, 'status': status, 'count': count}
+            for (company, admin_task_id, status), count in _actual_counts(company_id).items()]
+    if rows:
+        db.session.execute(insert(TaskStatusSummary), rows)
+    return len(rows)
+
+
+def check_status_summary(company_id=None):
+    """Rows where the summary and tasks disagree: [{company_id, admin_task_id, status, summary, actual}]."""
+    query = db.session.query(
+        TaskStatusSummary.company_id, TaskStatusSummary.admin_task_id, TaskStatusSummary.status, TaskStatusSummary.count
+    )
+    if company_id is not None:
+        query = query.filter(TaskStatusSummary.company_id == company_id)
+    stored = {(company, admin_task_id, status): count for company, admin_task_id, status, count in query}
+    actual = _actual_counts(company_id)
+
+    drift = []
+    for key in sorted(set(stored) | set(actual), key=lambda k: (k[0], k[1], k[2])):
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift.append({
+                'company_id': key[0],
+                'admin_task_id': key[1],
+                'status': key[2],
+                'summary': stored.get(key, 0),
+                'actual': actual.get(key, 0),
+            })
+    return drift
+
+
+# --- reading --------------------------------------------------------------------
+
+def admin_task_state(counts):
+    """Status of an admin task from the number of its tasks per status, or None without tasks."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    if counts.get(ALARM_STATUS):
+        return ALARM_STATUS
+    if counts.get(DONE_STATUS) == total:
+        return DONE_STATUS
+    if counts.get(IN_PROGRESS_STATUS) or counts.get(DONE_STATUS):
+        return IN_PROGRESS_STATUS
+    return NEW_STATUS
+
+
+@on_primary()
+def company_has_alarms(company_id):
+    # Broadcast to the whole company, so it must not come from a lagging replica
+    return db.session.query(TaskStatusSummary.id).filter(
+        TaskStatusSummary.company_id == company_id,
+        TaskStatusSummary.status == ALARM_STATUS,
+        TaskStatusSummary.count > 0
+    ).first() is not None
+
+
+def admin_task_counts(admin_task_id):
+    return dict(db.session.query(TaskStatusSummary.status, TaskStatusSummary.count).filter(
+        TaskStatusSummary.admin_task_id == admin_task_id,
+        TaskStatusSummary.count > 0
+    ).all())
+
+
+def get_dashboard_tasks(company_id):
+    # Admin tasks with their per-status counts, read from task_status_summary only
+    rows = db.session.query(
+        TaskStatusSummary.admin_task_id,
+        TaskStatusSummary.status,
+        TaskStatusSummary.count,
+        aTask.product_id,
+        Product.name
+    ).join(
+        aTask, aTask.id == TaskStatusSummary.admin_task_id
+    ).outerjoin(
+        Product, and_(Product.id == aTask.product_id, Product.company_id == company_id)
+    ).filter(
+        TaskStatusSummary.company_id == company_id,
+        TaskStatusSummary.count > 0
+    ).order_by(TaskStatusSummary.admin_task_id).all()
+
+    admin_tasks = {}
+    for admin_task_id, status, count, product_id, product_name in rows:
+        entry = admin_tasks.setdefault(admin_task_id, {
+            'task_id': admin_task_id,
+            'product_id': product_id,
+            'product_name': product_name if product_name is not None else 'Unknown',
+            'counts': {},
+        })
+        entry['counts'][status] = count
+
+    buckets = {key: [] for key in STATUS_BUCKETS.values()}
+    for entry in admin_tasks.values():
+        buckets[STATUS_BUCKETS[admin_task_state(entry['counts'])]].append(entry)
+
+    buckets['alarm'] = bool(buckets['alarm_tasks'])
+    return buckets
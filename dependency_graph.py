@@ -0,0 +1,239 @@
+from collections import deque
+
+from extensions import db
+from models import Task, aTask, dComponent
+from product_tree import load_product_tree
+
+DONE_STATUS = 'Завершене'
+# Expected duration of an operation nobody has finished yet, in seconds
+DEFAULT_DURATION = 3600.0
+
+
+class DependencyCycleError(Exception):
+    def __init__(self, cycle):
+        super().__init__('Циклічна залежність між операціями')
+        self.cycle = cycle  # operation ids, the first one repeated at the end
+
+
+class DependencyGraph:
+    """Operations of a product as a DAG.
+
+    A dComponent row means "this operation needs that component finished",
+    and a component is finished when its own operations and those of its
+    children (blocks of a product, details of a block) are. Components are
+    kept as zero-duration nodes, so a dependency on a whole product costs
+    one edge instead of one per operation.
+    """
+
+    def __init__(self):
+        self.operations = {}  # operation id -> {'name', 'component'}
+        self.edges = {}       # node -> set of nodes that can only start after it
+        self.durations = {}   # operation id -> seconds
+        self.prerequisites = {}  # operation id -> set of component nodes it waits for
+        self.component_operations = {}  # component node -> operation ids in its subtree
+
+    # --- building ---------------------------------------------------------------
+
+    def _edge(self, before, after):
+        self.edges.setdefault(before, set()).add(after)
+        self.edges.setdefault(after, set())
+
+    @classmethod
+    def from_tree(cls, tree, dependencies, durations=None):
+        """tree: load_product_tree() dict; dependencies: (operation_id, component_type, component_id)."""
+        graph = cls()
+        durations = durations or {}
+
+        def visit(node, parent_key):
+            key = ('component', node['type'], node['id'])
+            graph.edges.setdefault(key, set())
+            subtree = graph.component_operations.setdefault(key, [])
+            for op in node['operations']:
+                graph.operations[op['id']] = {'name': op['name'], 'component': key}
+                graph.durations[op['id']] = durations.get(op['id'], DEFAULT_DURATION)
+                graph._edge(('operation', op['id']), key)
+                subtree.append(op['id'])
+            for child in node.get('blocks', []) + node.get('details', []):
+                visit(child, key)
+                subtree.extend(graph.component_operations[('component', child['type'], child['id'])])
+            if parent_key is not None:
+                graph._edge(key, parent_key)
+
+        visit(tree, None)
+
+        for operation_id, component_type, component_id in dependencies:
+            key = ('component', component_type, component_id)
+            if operation_id not in graph.operations or key not in graph.edges:
+                # Dependencies on components of other products are not part of this plan
+                continue
+            graph.prerequisites.setdefault(operation_id, set()).add(key)
+            graph._edge(key, ('operation', operation_id))
+        return graph
+
+    # --- analysis ---------------------------------------------------------------
+
+    def topological_order(self):
+        """Kahn's algorithm; raises DependencyCycleError if the plan has a cycle."""
+        indegree = {node: 0 for node in self.edges}
+        for targets in self.edges.values():
+            for target in targets:
+                indegree[target] += 1
+
+        queue = deque(sorted((n for n, d in indegree.items() if d == 0), key=_node_sort_key))
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for target in self.edges[node]:
+                indegree[target] -= 1
+                if indegree[target] == 0:
+                    queue.append(target)
+
+        if len(order) < len(indegree):
+            raise DependencyCycleError(self._find_cycle({n for n, d in indegree.items() if d > 0}))
+        return order
+
+    def operation_order(self):
+        return [node[1] for node in self.topological_order() if node[0] == 'operation']
+
+    def _find_cycle(self, remaining):
+        # Every node left over by Kahn's algorithm still has a predecessor left over,
+        # so walking backwards from any of them has to run into a cycle
+        predecessors = {}
+        for node in remaining:
+            for target in self.edges[node]:
+                if target in remaining:
+                    predecessors.setdefault(target, []).append(node)
+
+        path, seen = [], {}
+        node = min(remaining, key=_node_sort_key)
+        while node not in seen:
+            seen[node] = len(path)
+            path.append(node)
+            node = min(predecessors[node], key=_node_sort_key)
+        cycle = list(reversed(path[seen[node]:]))
+        operations = [n[1] for n in cycle if n[0] == 'operation']
+        return operations + operations[:1]
+
+    def critical_path(self):
+        """Longest chain of operation durations: (seconds, [operation ids])."""
+        finish = {}
+        previous = {}
+        for node in self.topological_order():
+            own = self.durations.get(node[1], 0.0) if node[0] == 'operation' else 0.0
+            finish[node] = finish.get(node, 0.0) + own
+            for target in self.edges[node]:
+                if finish[node] > finish.get(target, 0.0):
+                    finish[target] = finish[node]
+                    previous[target] = node
+        if not finish:
+            return 0.0, []
+
+        end = max(finish, key=lambda n: (finish[n], _node_sort_key(n)))
+        path = []
+        node = end
+        while node is not None:
+            if node[0] == 'operation':
+                path.append(node[1])
+            node = previous.get(node)
+        path.reverse()
+        return finish[end], path
+
+    def prerequisite_operations(self, operation_id):
+        """Operations that have to be finished before operation_id can start."""
+        result = set()
+        for key in self.prerequisites.get(operation_id, ()):
+            result.update(self.component_operations.get(key, ()))
+        result.discard(operation_id)
+        return result
+
+
+def _node_sort_key(node):
+    return (0, node[1], '') if node[0] == 'operation' else (1, node[2], node[1])
+
+
+def _load_dependencies(operation_ids):
+    if not operation_ids:
+        return []
+    rows = db.session.query(dComponent.operation_id, dComponent.product_type, dComponent.component_id).filter(
+        dComponent.operation_id.in_(operation_ids)
+    ).all()
+    return [(operation_id, component_type, component_id) for operation_id, component_type, component_id in rows]
+
+
+def _load_durations(operation_ids):
+    # Mean duration of finished tasks per operation
+    if not operation_ids:
+        return {}
+    rows = db.session.query(Task.operation_id, Task.start_time, Task.end_time).filter(
+        Task.operation_id.in_(operation_ids),
+        Task.status == DONE_STATUS,
+        Task.start_time.isnot(None),
+        Task.end_time.isnot(None)
+    ).all()
+    totals = {}
+    for operation_id, start, end in rows:
+        total, count = totals.get(operation_id, (0.0, 0))
+        totals[operation_id] = (total + max((end - start).total_seconds(), 0.0), count + 1)
+    return {operation_id: total / count for operation_id, (total, count) in totals.items()}
+
+
+def load_dependency_graph(admin_task, with_durations=True):
+    """The DAG of an admin task's product, or None if the product is gone."""
+    tree = load_product_tree(admin_task.product_id, admin_task.company_id)
+    if tree is None:
+        return None
+
+    operation_ids = []
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        operation_ids.extend(op['id'] for op in node['operations'])
+        nodes.extend(node.get('blocks', []) + node.get('details', []))
+
+    durations = _load_durations(operation_ids) if with_durations else None
+    return DependencyGraph.from_tree(tree, _load_dependencies(operation_ids), durations)
+
+
+def unfinished_prerequisites(task):
+    """Tasks of the same admin task that have to be finished before `task` can start.
+
+    Only operations that were actually assigned in the admin task are waited for.
+    """
+    dependencies = _load_dependencies([task.operation_id])
+    if not dependencies:
+        return []
+
+    admin_task = db.session.get(aTask, task.admin_task_id)
+    graph = load_dependency_graph(admin_task, with_durations=False) if admin_task else None
+    if graph is None:
+        return []
+
+    required = graph.prerequisite_operations(task.operation_id)
+    if not required:
+        return []
+    return Task.query.filter(
+        Task.admin_task_id == task.admin_task_id,
+        Task.operation_id.in_(required),
+        Task.status != DONE_STATUS
+    ).order_by(Task.id).all()
+
+
+def describe_graph(graph):
+    """JSON-serializable summary: order, critical path and cycle (if any)."""
+    result = {
+        'operations': len(graph.operations),
+        'dependencies': sum(len(keys) for keys in graph.prerequisites.values()),
+        'order': [],
+        'critical_path': [],
+        'critical_path_seconds': 0.0,
+        'cycle': None,
+    }
+    try:
+        result['order'] = graph.operation_order()
+        seconds, path = graph.critical_path()
+        result['critical_path'] = path
+        result['critical_path_seconds'] = seconds
+    except DependencyCycleError as e:
+        result['cycle'] = e.cycle
+    return result
@@ -0,0 +1,39 @@
+# Production server: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every worker is a separate process with its own database pool and media
+# process pool (the app is loaded after the fork, preload_app stays off).
+# Socket.IO runs in threading mode on top of simple-websocket, one thread per
+# open connection, and clients use the websocket transport only, so any
+# worker can hold any connection without sticky sessions.
+import glob
+import multiprocessing
+import os
+
+import config
+
+bind = os.environ.get('VIRTFACT_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = os.environ.get('VIRTFACT_WORKER_CLASS', 'gthread')
+# Each tablet keeps one websocket open, which holds a thread for its lifetime
+threads = int(os.environ.get('VIRTFACT_THREADS', 100))
+# Long enough for a chunk of a video upload on a slow connection
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    if workers > 1 and not getattr(config, 'SOCKETIO_MESSAGE_QUEUE', None):
+        raise RuntimeError(
+            'SOCKETIO_MESSAGE_QUEUE has to be set in config.py when running more than one worker, '
+            'otherwise alarms reach only the clients of the worker that raised them'
+        )
+
+    metrics_dir = getattr(config, 'METRICS_DIR', None)
+    if metrics_dir:
+        # Counters start from zero with the server, files of the previous run are dropped
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            os.unlink(path)
+    elif workers > 1:
+        server.log.warning('METRICS_DIR is not set, /metrics shows the worker that answers the scrape only')
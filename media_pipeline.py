@@ -0,0 +1,303 @@
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import has_request_context, session as flask_session
+from sqlalchemy import create_engine, func, select, update, delete, insert
+
+from extensions import db
+from media_serving import media_url, normalize_media_path
+from models import MediaJob, MediaRendition
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_FOLDER = 'static/uploads/renditions'
+# kind -> maximum width in pixels
+RENDITION_WIDTHS = {'thumb': 320, 'web': 1280}
+
+
+def media_kind(path):
+    mime_type = mimetypes.guess_type(path)[0] or ''
+    if mime_type.startswith('image/'):
+        return 'image'
+    if mime_type.startswith('video/'):
+        return 'video'
+    return None
+
+
+def queue_media_job(path, company_id=None):
+    """Add a processing job for an uploaded file to the current transaction.
+
+    The job belongs to company_id, by default the company of the logged-in
+    user. Call media_pipeline.dispatch() after commit to hand it to the workers.
+    """
+    kind = media_kind(path)
+    if kind is None:
+        return None
+    if company_id is None and has_request_context():
+        company_id = flask_session.get('company_id')
+    job = MediaJob(source_path=normalize_media_path(path), kind=kind, company_id=company_id)
+    db.session.add(job)
+    return job
+
+
+def remove_renditions(path):
+    source_path = normalize_media_path(path)
+    for rendition in MediaRendition.query.filter_by(source_path=source_path).all():
+        if os.path.exists(rendition.path):
+            os.remove(rendition.path)
+        db.session.delete(rendition)
+
+
+def load_renditions(paths):
+    """Renditions of several files in one query: {source_path: [rendition, ...]} smallest first."""
+    source_paths = {normalize_media_path(p) for p in paths if p}
+    result = {p: [] for p in source_paths}
+    if not source_paths:
+        return result
+    rows = MediaRendition.query.filter(
+        MediaRendition.source_path.in_(source_paths)
+    ).order_by(MediaRendition.width).all()
+    for r in rows:
+        result[r.source_path].append({
+            'kind': r.kind,
+            'width': r.width,
+            'height': r.height,
+            'mime_type': r.mime_type,
+            'url': media_url(r.path),
+        })
+    return result
+
+
+def rendition_url(path, width):
+    """URL of the smallest rendition at least `width` pixels wide, or of the original."""
+    if not path:
+        return None
+    source_path = normalize_media_path(path)
+    rendition = MediaRendition.query.filter(
+        MediaRendition.source_path == source_path,
+        MediaRendition.width >= width,
+        MediaRendition.mime_type == 'image/jpeg'
+    ).order_by(MediaRendition.width).first()
+    return media_url(rendition.path if rendition else source_path)
+
+
+# --- Worker process side: no Flask app, its own engine -------------------------
+
+_worker_engine = None
+
+
+def _engine(database_uri):
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = create_engine(database_uri, pool_pre_ping=True)
+    return _worker_engine
+
+
+def _image_renditions(source_path, out_dir, report):
+    from PIL import Image
+
+    results = []
+    steps = len(RENDITION_WIDTHS) * 2
+    with Image.open(source_path) as original:
+        original = original.convert('RGB')
+        for kind, max_width in RENDITION_WIDTHS.items():
+            width = min(max_width, original.width)
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for ext, fmt, mime_type in (('jpg', 'JPEG', 'image/jpeg'), ('webp', 'WEBP', 'image/webp')):
+                path = f'{out_dir}/{kind}.{ext}'
+                resized.save(path, fmt, quality=82)
+                results.append((kind, width, height, mime_type, path))
+                report(len(results) * 100 // steps)
+    return results
+
+
+def _video_poster(source_path, out_dir, report):
+    from media_store import image_dimensions
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg не знайдено')
+
+    results = []
+    for kind, max_width in RENDITION_WIDTHS.items():
+        path = f'{out_dir}/{kind}.jpg'
+        subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-ss', '1', '-i', source_path,
+             '-frames:v', '1', '-vf', f"scale='min({max_width},iw)':-2", path],
+            check=True, timeout=300
+        )
+        if not os.path.exists(path):
+            # Clips shorter than a second have no frame at 00:01
+            subprocess.run(
+                [ffmpeg, '-y', '-loglevel', 'error', '-i', source_path,
+                 '-frames:v', '1', '-vf', f"scale='min({max_width},iw)':-2", path],
+                check=True, timeout=300
+            )
+        width, height = image_dimensions(path)
+        results.append((f'poster_{kind}', width or max_width, height or 0, 'image/jpeg', path))
+        report(len(results) * 100 // len(RENDITION_WIDTHS))
+    return results
+
+
+def run_job(database_uri, job_id):
+    engine = _engine(database_uri)
+    jobs = MediaJob.__table__
+    renditions = MediaRendition.__table__
+
+    with engine.begin() as conn:
+        # Claim the job; another process may have picked it up already
+        now = datetime.utcnow()
+        claimed = conn.execute(
+            update(jobs).where(jobs.c.id == job_id, jobs.c.status == 'queued')
+            .values(status='running', started_at=now, claimed_at=now, attempts=jobs.c.attempts + 1, progress=0)
+        ).rowcount
+        if not claimed:
+            return
+        job = conn.execute(select(jobs).where(jobs.c.id == job_id)).one()
+
+    def report(progress):
+        with engine.begin() as conn:
+            conn.execute(update(jobs).where(jobs.c.id == job_id).values(
+                progress=progress, claimed_at=datetime.utcnow()
+            ))
+
+    name = os.path.splitext(os.path.basename(job.source_path))[0]
+    out_dir = f'{RENDITIONS_FOLDER}/{name}'
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        if job.kind == 'image':
+            results = _image_renditions(job.source_path, out_dir, report)
+        else:
+            results = _video_poster(job.source_path, out_dir, report)
+
+        with engine.begin() as conn:
+            conn.execute(delete(renditions).where(renditions.c.source_path == job.source_path))
+            for kind, width, height, mime_type, path in results:
+                conn.execute(insert(renditions).values(
+                    source_path=job.source_path, kind=kind, width=width,
+                    height=height, mime_type=mime_type, path=path
+                ))
+            conn.execute(update(jobs).where(jobs.c.id == job_id).values(
+                status='done', progress=100, finished_at=datetime.utcnow()
+            ))
+    except Exception as e:
+        with engine.begin() as conn:
+            conn.execute(update(jobs).where(jobs.c.id == job_id).values(
+                status='failed', error=str(e), finished_at=datetime.utcnow()
+            ))
+
+
+# --- Web process side -----------------------------------------------------------
+
+class MediaPipeline:
+    """Hands queued media jobs to a local process pool; uploads never wait for it."""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._submitted = set()
+        self._lock = threading.Lock()
+        self._next_requeue = 0.0  # time.monotonic() of the next stale job check
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MEDIA_WORKERS', 2)
+        # Longer than the slowest step between two progress reports (ffmpeg runs up to 300 s)
+        app.config.setdefault('MEDIA_JOB_TIMEOUT', 900)
+        app.config.setdefault('MEDIA_JOB_MAX_ATTEMPTS', 3)
+        # Seconds between two stale job checks of dispatch(); the first one runs at once
+        app.config.setdefault('MEDIA_REQUEUE_INTERVAL', 300)
+        self.app = app
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.app.config['MEDIA_WORKERS'])
+        return self._executor
+
+    def requeue_stale(self):
+        """Put back jobs whose worker died while running them; fail those out of attempts."""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.app.config['MEDIA_JOB_TIMEOUT'])
+        stale = (MediaJob.status == 'running', func.coalesce(MediaJob.claimed_at, MediaJob.started_at) < cutoff)
+        max_attempts = self.app.config['MEDIA_JOB_MAX_ATTEMPTS']
+        failed = db.session.execute(
+            update(MediaJob).where(*stale, MediaJob.attempts >= max_attempts)
+            .values(status='failed', error='Обробку перервано', finished_at=now)
+        ).rowcount
+        requeued = db.session.execute(
+            update(MediaJob).where(*stale, MediaJob.attempts < max_attempts)
+            .values(status='queued', progress=0)
+        ).rowcount
+        db.session.commit()
+        self._next_requeue = time.monotonic() + self.app.config['MEDIA_REQUEUE_INTERVAL']
+        if failed or requeued:
+            logger.warning('Media jobs left running by a dead worker: %d re-queued, %d failed', requeued, failed)
+        return requeued
+
+    def dispatch(self):
+        # Submit every queued job this process is not running already. Dead
+        # workers are looked for once per MEDIA_REQUEUE_INTERVAL, not per upload
+        if time.monotonic() >= self._next_requeue:
+            self.requeue_stale()
+        queued = [row[0] for row in db.session.query(MediaJob.id).filter(MediaJob.status == 'queued').all()]
+        database_uri = self.app.config['SQLALCHEMY_DATABASE_URI']
+        futures = []
+        with self._lock:
+            for job_id in queued:
+                if job_id in self._submitted:
+                    continue
+                try:
+                    future = self._pool().submit(run_job, database_uri, job_id)
+                except Exception:
+                    # Leave the job queued, the next dispatch retries it with a fresh pool
+                    logger.exception('Could not submit media job %s', job_id)
+                    self._executor = None
+                    break
+                self._submitted.add(job_id)
+                futures.append((job_id, future))
+        # A future that is already done runs its callback right here, so not under the lock
+        for job_id, future in futures:
+            future.add_done_callback(lambda _, job_id=job_id: self._finished(job_id))
+
+    def _finished(self, job_id):
+        # Also called when the pool broke: a re-queued job can then be submitted again
+        with self._lock:
+            self._submitted.discard(job_id)
+
+    def wait(self):
+        # Let submitted jobs finish, e.g. before a CLI command exits
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def status(self, company_id):
+        counts = dict(db.session.query(MediaJob.status, func.count(MediaJob.id)).filter(
+            MediaJob.company_id == company_id
+        ).group_by(MediaJob.status).all())
+        recent = MediaJob.query.filter_by(company_id=company_id).order_by(MediaJob.id.desc()).limit(50).all()
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'jobs': [{
+                'id': job.id,
+                'source_path': job.source_path,
+                'kind': job.kind,
+                'status': job.status,
+                'progress': job.progress,
+                'error': job.error,
+            } for job in recent],
+        }
+
+
+media_pipeline = MediaPipeline()
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import re
+import threading
+
+from flask import send_file, url_for
+
+# Fingerprinted URLs never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+FINGERPRINT_LENGTH = 16
+SHA256_NAME_RE = re.compile(r'^[0-9a-f]{64}$')
+# Files up to this size are fingerprinted by content, larger ones by size and mtime
+CONTENT_HASH_MAX_BYTES = 1024 * 1024
+
+_fingerprints = {}  # path -> ((size, mtime_ns), fingerprint)
+_lock = threading.Lock()
+
+
+def normalize_media_path(path):
+    # Employee photos are stored both as "static/uploads/..." and "uploads/..."
+    path = path.replace('\\', '/')
+    if not path.startswith('static/'):
+        path = 'static/' + path
+    return path
+
+
+def file_fingerprint(path):
+    """Short fingerprint of a file, cached until its size or mtime changes.
+
+    Media store files carry their content hash in the name. Other small
+    files (static assets, photos) are hashed; large legacy uploads such as
+    instruction videos are fingerprinted by size and mtime, so rendering a
+    page never reads gigabytes.
+    """
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        cached = _fingerprints.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    if SHA256_NAME_RE.match(name):
+        # Media store files are already named by their content hash
+        fingerprint = name[:FINGERPRINT_LENGTH]
+    elif stat.st_size > CONTENT_HASH_MAX_BYTES:
+        fingerprint = hashlib.sha256(f'{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:FINGERPRINT_LENGTH]
+    else:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+    with _lock:
+        _fingerprints[path] = (key, fingerprint)
+    return fingerprint
+
+
+def media_url(path):
+    """Fingerprinted URL of an uploaded file ("static/uploads/..." or "uploads/...")."""
+    path = normalize_media_path(path)
+    if not path.startswith('static/uploads/') or not os.path.isfile(path):
+        return '/' + path
+    return url_for('media', fingerprint=file_fingerprint(path), filename=path[len('static/uploads/'):])
+
+
+def send_media(path, fingerprint):
+    # send_file answers If-None-Match with 304 and Range requests with 206
+    current = file_fingerprint(path)
+    response = send_file(os.path.abspath(path), conditional=True, etag=current)
+    if fingerprint == current:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        # Outdated link: still served, but revalidated every time
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
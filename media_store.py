@@ -0,0 +1,243 @@
+import hashlib
+import mimetypes
+import os
+import struct
+import uuid
+
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from media_pipeline import queue_media_job, remove_renditions
+from media_serving import media_url
+from models import InstructionFile, MediaBlob
+
+MEDIA_FOLDER = 'static/uploads/media'
+CHUNK_SIZE = 1024 * 1024
+CATEGORIES = ('photo', 'video', 'text')
+
+
+def image_dimensions(path):
+    # Width and height from the PNG / GIF / JPEG header, (None, None) for anything else
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(26)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+                return struct.unpack('>II', head[16:24])
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head.startswith(b'\xff\xd8'):
+                f.seek(2)
+                while True:
+                    marker = f.read(2)
+                    if len(marker) < 2 or marker[0] != 0xFF:
+                        break
+                    if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                        continue
+                    length = struct.unpack('>H', f.read(2))[0]
+                    if marker[1] in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                                     0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                        height, width = struct.unpack('>xHH', f.read(5))
+                        return width, height
+                    f.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        pass
+    return None, None
+
+
+def new_temp_path():
+    tmp_dir = os.path.join(MEDIA_FOLDER, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, uuid.uuid4().hex)
+
+
+def store_stream(stream, filename):
+    """Copy a file-like object into the store and return the id of its blob.
+
+    The blob's ref_count is incremented; the caller is expected to reference
+    it from an InstructionFile in the same transaction.
+    """
+    tmp_path = new_temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return store_temp_file(tmp_path, filename, digest.hexdigest(), size)
+
+
+def store_temp_file(tmp_path, filename, sha256, size):
+    # Takes ownership of tmp_path: it is either moved into the store or removed
+    blob = MediaBlob.query.filter_by(sha256=sha256).first()
+    if blob is not None:
+        updated = MediaBlob.query.filter_by(id=blob.id).update(
+            {MediaBlob.ref_count: MediaBlob.ref_count + 1}, synchronize_session=False
+        )
+        if updated:
+            if os.path.exists(blob.path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob.path)
+            return blob.id
+        # Purged between the lookup and the update, store it again below
+
+    ext = os.path.splitext(filename)[1].lower()
+    path = os.path.join(MEDIA_FOLDER, sha256[:2], sha256 + ext).replace('\\', '/')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    width, height = image_dimensions(path)
+
+    blob = MediaBlob(
+        sha256=sha256,
+        size=size,
+        mime_type=mimetypes.guess_type(filename)[0],
+        width=width,
+        height=height,
+        path=path,
+        ref_count=1
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+        queue_media_job(path)
+        return blob.id
+    except IntegrityError:
+        # The same content was stored concurrently, reference that blob instead
+        blob = MediaBlob.query.filter_by(sha256=sha256).first()
+        MediaBlob.query.filter_by(id=blob.id).update(
+            {MediaBlob.ref_count: MediaBlob.ref_count + 1}, synchronize_session=False
+        )
+        return blob.id
+
+
+def attach_files(instruction_id, category, file_list):
+    """Store uploaded files and add them to the instruction's manifest.
+
+    A file with the same name in the same category replaces the old one.
+    Returns ids of blobs that lost a reference, to be passed to purge_blobs
+    after commit.
+    """
+    released = []
+    for file in file_list:
+        filename = file.filename
+        if not filename:
+            continue
+        released += detach_files(instruction_id, category, [filename])
+        blob_id = store_stream(file.stream, filename)
+        db.session.add(InstructionFile(
+            instruction_id=instruction_id,
+            category=category,
+            name=filename,
+            blob_id=blob_id
+        ))
+    return released
+
+
+def attach_blob(instruction_id, category, filename, blob_id):
+    # Same as attach_files for a blob that is already in the store
+    released = detach_files(instruction_id, category, [filename])
+    db.session.add(InstructionFile(
+        instruction_id=instruction_id,
+        category=category,
+        name=filename,
+        blob_id=blob_id
+    ))
+    return released
+
+
+def detach_files(instruction_id, category=None, names=None):
+    """Remove entries from an instruction's manifest and drop their blob references."""
+    query = InstructionFile.query.filter_by(instruction_id=instruction_id)
+    if category is not None:
+        query = query.filter_by(category=category)
+    if names is not None:
+        if not names:
+            return []
+        query = query.filter(InstructionFile.name.in_(names))
+
+    entries = query.all()
+    released = []
+    for entry in entries:
+        MediaBlob.query.filter_by(id=entry.blob_id).update(
+            {MediaBlob.ref_count: MediaBlob.ref_count - 1}, synchronize_session=False
+        )
+        released.append(entry.blob_id)
+        db.session.delete(entry)
+    return released
+
+
+def purge_blobs(blob_ids):
+    # Called after commit: deletes blobs nobody references any more, and their files
+    for blob_id in set(blob_ids):
+        blob = db.session.get(MediaBlob, blob_id)
+        if blob is None or blob.ref_count > 0:
+            continue
+        path = blob.path
+        deleted = MediaBlob.query.filter(
+            MediaBlob.id == blob_id,
+            MediaBlob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        if not deleted:
+            db.session.commit()
+            continue
+        remove_renditions(path)
+
+        # Move the file aside while the row delete is still uncommitted. A concurrent
+        # store_temp_file of the same content waits for the row, finds it gone and
+        # writes a new file to `path`, which must not be the one removed below.
+        tombstone = None
+        if os.path.exists(path):
+            tombstone = f'{path}.{uuid.uuid4().hex}.deleted'
+            os.replace(path, tombstone)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if tombstone is not None and not os.path.exists(path):
+                os.replace(tombstone, path)
+            raise
+        if tombstone is not None:
+            os.remove(tombstone)
+
+
+def instruction_manifest(instruction_id):
+    """Manifest entries of an instruction grouped by category, read without touching the filesystem."""
+    rows = db.session.query(InstructionFile, MediaBlob).join(
+        MediaBlob, MediaBlob.id == InstructionFile.blob_id
+    ).filter(
+        InstructionFile.instruction_id == instruction_id
+    ).order_by(InstructionFile.name).all()
+
+    manifest = {category: [] for category in CATEGORIES}
+    for entry, blob in rows:
+        manifest.setdefault(entry.category, []).append({
+            'name': entry.name,
+            'path': blob.path,
+            'url': media_url(blob.path),
+            'size': blob.size,
+            'sha256': blob.sha256,
+            'mime_type': blob.mime_type,
+            'width': blob.width,
+            'height': blob.height,
+        })
+    return manifest
+
+
+def import_folder(instruction_id, category, folder):
+    # Moves the files of a pre-media-store instruction folder into the manifest
+    for filename in sorted(os.listdir(folder)):
+        file_path = os.path.join(folder, filename)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            blob_id = store_stream(f, filename)
+        db.session.add(InstructionFile(
+            instruction_id=instruction_id,
+            category=category,
+            name=filename,
+            blob_id=blob_id
+        ))
@@ -0,0 +1,325 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import Response, g, request
+from sqlalchemy import func
+
+from dashboard import ALARM_STATUS, IN_PROGRESS_STATUS
+from extensions import db
+from models import MediaUpload, TaskStatusSummary
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 1.0
+UPLOAD_MIMETYPES = ('multipart/form-data', 'application/octet-stream')
+
+HELP = {
+    'virtfact_http_requests_total': ('counter', 'HTTP requests by route, method and status code.'),
+    'virtfact_http_request_duration_seconds': ('histogram', 'HTTP request latency by route.'),
+    'virtfact_http_requests_in_flight': ('gauge', 'HTTP requests being handled, by route.'),
+    'virtfact_socketio_events_total': ('counter', 'Socket.IO events by event and outcome.'),
+    'virtfact_socketio_event_duration_seconds': ('histogram', 'Socket.IO handler latency by event.'),
+    'virtfact_socketio_events_in_flight': ('gauge', 'Socket.IO handlers running, by event.'),
+    'virtfact_upload_bytes_total': ('counter', 'Request body bytes of file uploads, by route.'),
+    'virtfact_upload_pending_bytes': ('gauge', 'Bytes received for chunked uploads that are not finished yet.'),
+    'virtfact_active_alarms': ('gauge', 'Tasks in Alarm status, by company.'),
+    'virtfact_tasks_in_progress': ('gauge', 'Tasks in progress, by company.'),
+}
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Metrics:
+    """Request, Socket.IO and upload metrics of this process, served as /metrics.
+
+    Recording is a dict update under a lock per request. With METRICS_DIR
+    set, every worker writes its numbers to METRICS_DIR/<pid>.json about
+    once a second and /metrics adds up the files of all workers, so any
+    worker answers the scrape for the whole server. Counters of workers
+    that exited are kept, in-flight gauges only count live workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self.directory = None
+        self.requests = {}   # (route, method, status) -> count
+        self.latency = {}    # route -> _Histogram
+        self.in_flight = {}  # route -> count
+        self.events = {}     # (event, outcome) -> count
+        self.event_latency = {}
+        self.events_in_flight = {}
+        self.upload_bytes = {}  # route -> bytes
+
+    def init_app(self, app):
+        self.directory = app.config.setdefault('METRICS_DIR', None)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        @app.before_request
+        def start_request_metrics():
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            g.metrics_route = route
+            g.metrics_started = time.perf_counter()
+            with self._lock:
+                self.in_flight[route] = self.in_flight.get(route, 0) + 1
+            if self.directory and self._flusher_pid != os.getpid():
+                self._start_flusher()
+
+        @app.after_request
+        def remember_status(response):
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def finish_request_metrics(exc):
+            started = g.pop('metrics_started', None)
+            if started is None:
+                return
+            elapsed = time.perf_counter() - started
+            route = g.pop('metrics_route')
+            status = 500 if exc is not None else g.pop('metrics_status', 500)
+            key = (route, request.method, str(status))
+            uploaded = request.content_length if request.method in ('POST', 'PUT') else None
+            if uploaded and request.mimetype not in UPLOAD_MIMETYPES:
+                uploaded = None
+            with self._lock:
+                self.in_flight[route] -= 1
+                self.requests[key] = self.requests.get(key, 0) + 1
+                histogram = self.latency.get(route)
+                if histogram is None:
+                    histogram = self.latency[route] = _Histogram()
+                histogram.observe(elapsed)
+                if uploaded:
+                    self.upload_bytes[route] = self.upload_bytes.get(route, 0) + uploaded
+
+    def socket_event(self, name):
+        """Count and time a Socket.IO handler: @metrics.socket_event('check_alarm')."""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                with self._lock:
+                    self.events_in_flight[name] = self.events_in_flight.get(name, 0) + 1
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = f(*args, **kwargs)
+                    # connect handlers refuse a client by returning False
+                    outcome = 'rejected' if result is False else 'ok'
+                    return result
+                finally:
+                    elapsed = time.perf_counter() - started
+                    with self._lock:
+                        self.events_in_flight[name] -= 1
+                        self.events[(name, outcome)] = self.events.get((name, outcome), 0) + 1
+                        histogram = self.event_latency.get(name)
+                        if histogram is None:
+                            histogram = self.event_latency[name] = _Histogram()
+                        histogram.observe(elapsed)
+            return decorated_function
+        return decorator
+
+    # --- sharing between workers ------------------------------------------------
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': {
+                    'virtfact_http_requests_total': [
+                        [{'route': r, 'method': m, 'status': s}, n] for (r, m, s), n in self.requests.items()
+                    ],
+                    'virtfact_socketio_events_total': [
+                        [{'event': e, 'outcome': o}, n] for (e, o), n in self.events.items()
+                    ],
+                    'virtfact_upload_bytes_total': [
+                        [{'route': r}, n] for r, n in self.upload_bytes.items()
+                    ],
+                },
+                'histograms': {
+                    'virtfact_http_request_duration_seconds': [
+                        [{'route': r}, h.buckets, h.sum, h.count] for r, h in self.latency.items()
+                    ],
+                    'virtfact_socketio_event_duration_seconds': [
+                        [{'event': e}, h.buckets, h.sum, h.count] for e, h in self.event_latency.items()
+                    ],
+                },
+                'gauges': {
+                    'virtfact_http_requests_in_flight': [[{'route': r}, n] for r, n in self.in_flight.items()],
+                    'virtfact_socketio_events_in_flight': [[{'event': e}, n] for e, n in self.events_in_flight.items()],
+                },
+            }
+
+    def flush(self):
+        snapshot = self.snapshot()
+        path = os.path.join(self.directory, f'{snapshot["pid"]}.json')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+        # Readers never see a half-written file
+        os.replace(temp_path, path)
+
+    def _start_flusher(self):
+        # Started on the first request of each process, so it also runs in forked workers
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(FLUSH_INTERVAL)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        own = self.snapshot()
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get('pid') == own['pid']:
+                continue
+            if not _alive(snapshot['pid']):
+                snapshot['gauges'] = {}
+            snapshots.append(snapshot)
+        return snapshots
+
+    # --- exposition ---------------------------------------------------------------
+
+    def render(self, db_gauges=None):
+        """The Prometheus text format (version 0.0.4) for all workers."""
+        counters, histograms, gauges = {}, {}, {}
+        for snapshot in self._snapshots():
+            for name, samples in snapshot['counters'].items():
+                series = counters.setdefault(name, {})
+                for labels, value in samples:
+                    key = _label_key(labels)
+                    series[key] = series.get(key, 0) + value
+            for name, samples in snapshot['histograms'].items():
+                series = histograms.setdefault(name, {})
+                for labels, buckets, total, count in samples:
+                    key = _label_key(labels)
+                    merged = series.setdefault(key, [[0] * len(buckets), 0.0, 0])
+                    merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                    merged[1] += total
+                    merged[2] += count
+            for name, samples in snapshot['gauges'].items():
+                series = gauges.setdefault(name, {})
+                for labels, value in samples:
+                    key = _label_key(labels)
+                    series[key] = series.get(key, 0) + value
+        for name, samples in (db_gauges or {}).items():
+            gauges[name] = {_label_key(labels): value for labels, value in samples}
+
+        lines = []
+        for name, series in list(counters.items()) + list(gauges.items()):
+            _header(lines, name)
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+        for name, series in histograms.items():
+            _header(lines, name)
+            for key, (buckets, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + (float('inf'),), buckets):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{_format_labels(key + (("le", _format_value(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def response(self, db_gauges=None):
+        return Response(self.render(db_gauges), mimetype='text/plain; version=0.0.4')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _label_key(labels):
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in key) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def _header(lines, name):
+    kind, text = HELP[name]
+    lines.append(f'# HELP {name} {text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def database_gauges(company_id=None):
+    """Gauges read from the database at scrape time; the summary table keeps them cheap.
+
+    With company_id only that company's series are returned, and the
+    server-wide pending upload bytes are left out.
+    """
+    query = db.session.query(
+        TaskStatusSummary.company_id, TaskStatusSummary.status, func.sum(TaskStatusSummary.count)
+    ).filter(
+        TaskStatusSummary.status.in_((ALARM_STATUS, IN_PROGRESS_STATUS))
+    )
+    if company_id is not None:
+        query = query.filter(TaskStatusSummary.company_id == company_id)
+    alarms, in_progress = [], []
+    for row_company_id, status, count in query.group_by(TaskStatusSummary.company_id, TaskStatusSummary.status):
+        target = alarms if status == ALARM_STATUS else in_progress
+        target.append([{'company_id': row_company_id}, int(count or 0)])
+    gauges = {
+        'virtfact_active_alarms': alarms,
+        'virtfact_tasks_in_progress': in_progress,
+    }
+    if company_id is None:
+        pending = db.session.query(func.coalesce(func.sum(MediaUpload.received), 0)).scalar()
+        gauges['virtfact_upload_pending_bytes'] = [[{}, int(pending)]]
+    return gauges
+
+metrics = Metrics()
@@ -0,0 +1,103 @@
+"""indexes and foreign keys for hot lookup columns
+
+Revision ID: 3c1f9a7b2d4e
+Revises: e87ea247d44e
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a7b2d4e'
+down_revision = 'e87ea247d44e'
+branch_labels = None
+depends_on = None
+
+OPERATION_CHILD_TABLES = [
+    'tools_for_operation',
+    'materials_for_operation',
+    'locations_for_operation',
+    'dependent_components',
+    'instructions',
+]
+
+
+def _orphans():
+    """(table, column, referenced table, rows) of rows the new foreign keys would reject."""
+    checks = [(table, 'operation_id', 'operations') for table in OPERATION_CHILD_TABLES]
+    checks.append(('tasks', 'admin_task_id', 'admin_tasks'))
+    if context.is_offline_mode():
+        # --sql: nothing to count, the generated script assumes a clean database
+        return []
+    connection = op.get_bind()
+    found = []
+    for table, column, target in checks:
+        count = connection.execute(sa.text(
+            f'SELECT COUNT(*) FROM {table} WHERE {column} NOT IN (SELECT id FROM {target})'
+        )).scalar()
+        if count:
+            found.append((table, column, target, count))
+    return found
+
+
+def upgrade():
+    # Rows pointing at deleted operations / admin tasks would block the new foreign keys.
+    # They are task history and resource links, so they are only deleted on request:
+    #   flask db upgrade -x delete_orphans=true
+    orphans = _orphans()
+    if orphans:
+        if context.get_x_argument(as_dictionary=True).get('delete_orphans') != 'true':
+            raise RuntimeError(
+                'Rows reference rows that no longer exist: '
+                + ', '.join(f'{table}.{column} -> {target}: {count}' for table, column, target, count in orphans)
+                + '. Back them up, then run "flask db upgrade -x delete_orphans=true" to delete them.'
+            )
+        for table, column, target, count in orphans:
+            print(f'Deleting {count} rows of {table} whose {column} is not in {target}')
+            op.execute(sa.text(f'DELETE FROM {table} WHERE {column} NOT IN (SELECT id FROM {target})'))
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.create_index('ix_tasks_responsible_id_status', ['responsible_id', 'status'], unique=False)
+        batch_op.create_index('ix_tasks_company_id_admin_task_id', ['company_id', 'admin_task_id'], unique=False)
+        batch_op.create_index('ix_tasks_company_id_status', ['company_id', 'status'], unique=False)
+        batch_op.create_index('ix_tasks_admin_task_id', ['admin_task_id'], unique=False)
+        batch_op.create_foreign_key('fk_tasks_admin_task_id_admin_tasks', 'admin_tasks', ['admin_task_id'], ['id'])
+
+    with op.batch_alter_table('operations', schema=None) as batch_op:
+        batch_op.create_index('ix_operations_component_id_product_type', ['component_id', 'product_type'], unique=False)
+
+    for table in OPERATION_CHILD_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(f'ix_{table}_operation_id', ['operation_id'], unique=False)
+            batch_op.create_foreign_key(f'fk_{table}_operation_id_operations', 'operations', ['operation_id'], ['id'])
+
+    with op.batch_alter_table('alarms', schema=None) as batch_op:
+        batch_op.create_index('ix_alarms_task_id', ['task_id'], unique=False)
+
+    with op.batch_alter_table('admin_tasks', schema=None) as batch_op:
+        batch_op.create_index('ix_admin_tasks_company_id', ['company_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('admin_tasks', schema=None) as batch_op:
+        batch_op.drop_index('ix_admin_tasks_company_id')
+
+    with op.batch_alter_table('alarms', schema=None) as batch_op:
+        batch_op.drop_index('ix_alarms_task_id')
+
+    for table in reversed(OPERATION_CHILD_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{table}_operation_id_operations', type_='foreignkey')
+            batch_op.drop_index(f'ix_{table}_operation_id')
+
+    with op.batch_alter_table('operations', schema=None) as batch_op:
+        batch_op.drop_index('ix_operations_component_id_product_type')
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_tasks_admin_task_id_admin_tasks', type_='foreignkey')
+        batch_op.drop_index('ix_tasks_admin_task_id')
+        batch_op.drop_index('ix_tasks_company_id_status')
+        batch_op.drop_index('ix_tasks_company_id_admin_task_id')
+        batch_op.drop_index('ix_tasks_responsible_id_status')
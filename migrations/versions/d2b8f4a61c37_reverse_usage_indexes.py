@@ -0,0 +1,73 @@
+"""reverse usage indexes for tools, materials and locations
+
+Revision ID: d2b8f4a61c37
+Revises: a7d3e1f05b82
+Create Date: 2026-10-18 15:48:09.562117
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b8f4a61c37'
+down_revision = 'a7d3e1f05b82'
+branch_labels = None
+depends_on = None
+
+# link table -> (column, referenced table)
+RESOURCE_LINK_TABLES = {
+    'tools_for_operation': ('tool_id', 'tools'),
+    'materials_for_operation': ('material_id', 'materials'),
+    'locations_for_operation': ('location_id', 'locations'),
+}
+
+
+def _orphans():
+    """(table, column, referenced table, rows) of links the new foreign keys would reject."""
+    if context.is_offline_mode():
+        # --sql: nothing to count, the generated script assumes a clean database
+        return []
+    connection = op.get_bind()
+    found = []
+    for table, (column, target) in RESOURCE_LINK_TABLES.items():
+        count = connection.execute(sa.text(
+            f'SELECT COUNT(*) FROM {table} WHERE {column} NOT IN (SELECT id FROM {target})'
+        )).scalar()
+        if count:
+            found.append((table, column, target, count))
+    return found
+
+
+def upgrade():
+    # Links to tools / materials / locations deleted before this revision would block the
+    # foreign keys. They are only deleted on request: flask db upgrade -x delete_orphans=true
+    orphans = _orphans()
+    if orphans:
+        if context.get_x_argument(as_dictionary=True).get('delete_orphans') != 'true':
+            raise RuntimeError(
+                'Links reference rows that no longer exist: '
+                + ', '.join(f'{table}.{column} -> {target}: {count}' for table, column, target, count in orphans)
+                + '. Back them up, then run "flask db upgrade -x delete_orphans=true" to delete them.'
+            )
+        for table, column, target, count in orphans:
+            print(f'Deleting {count} rows of {table} whose {column} is not in {target}')
+            op.execute(sa.text(f'DELETE FROM {table} WHERE {column} NOT IN (SELECT id FROM {target})'))
+
+    for table, (column, target) in RESOURCE_LINK_TABLES.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(f'ix_{table}_{column}', [column], unique=False)
+            batch_op.create_foreign_key(f'fk_{table}_{column}_{target}', target, [column], ['id'])
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.create_index('ix_tasks_operation_id_status', ['operation_id', 'status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_index('ix_tasks_operation_id_status')
+
+    for table, (column, target) in reversed(list(RESOURCE_LINK_TABLES.items())):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{table}_{column}_{target}', type_='foreignkey')
+            batch_op.drop_index(f'ix_{table}_{column}')
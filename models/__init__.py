@@ -15,4 +15,12 @@ from .materials_for_operation import *
 from .dependent_components import *
 from .tasks import *
 from .admin_tasks import *
-from .alarms import *
\ No newline at end of file
+from .alarms import *
+from .media_blobs import *
+from .instruction_files import *
+from .media_uploads import *
+from .media_jobs import *
+from .media_renditions import *
+from .duration_histograms import *
+from .shift_throughput import *
+from .task_status_summaries import *
\ No newline at end of file
@@ -5,7 +5,7 @@ class aTask(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     product_id = db.Column(db.Integer, nullable=False)
-    company_id = db.Column(db.Integer, nullable=False)
+    company_id = db.Column(db.Integer, nullable=False, index=True)
 
     def __init__(self, product_id, company_id):
         self.product_id = product_id
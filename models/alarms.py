@@ -4,7 +4,7 @@ class Alarm(db.Model):
     __tablename__ = 'alarms'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    task_id = db.Column(db.Integer, nullable=False)
+    task_id = db.Column(db.Integer, nullable=False, index=True)
     text = db.Column(db.Text, nullable=False)
 
     def __init__(self, task_id, text):
@@ -7,7 +7,7 @@ class dComponent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     component_id = db.Column(db.Integer, nullable=False)
     product_type = db.Column(db.String(128), nullable=False)
-    operation_id = db.Column(db.Integer, nullable=False)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False, index=True)
 
     def __init__(self, component_id, product_type, operation_id):
         self.component_id = component_id
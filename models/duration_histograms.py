@@ -0,0 +1,23 @@
+from extensions import db
+
+class DurationHistogram(db.Model):
+    __tablename__ = 'duration_histograms'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'dimension', 'key_id', 'bucket', name='uq_duration_histograms_key_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    company_id = db.Column(db.Integer, nullable=False)
+    dimension = db.Column(db.String(16), nullable=False)
+    key_id = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __init__(self, company_id, dimension, key_id, bucket, count=0, total_seconds=0.0):
+        self.company_id = company_id
+        self.dimension = dimension
+        self.key_id = key_id
+        self.bucket = bucket
+        self.count = count
+        self.total_seconds = total_seconds
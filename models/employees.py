@@ -2,6 +2,10 @@ from extensions import db
 
 class Employee(db.Model):
     __tablename__ = 'employees'
+    __table_args__ = (
+        # Keyset pagination of the company list pages
+        db.Index('ix_employees_company_id_surname', 'company_id', 'surname', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
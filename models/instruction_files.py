@@ -0,0 +1,16 @@
+from extensions import db
+
+class InstructionFile(db.Model):
+    __tablename__ = 'instruction_files'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    instruction_id = db.Column(db.Integer, db.ForeignKey('instructions.id'), nullable=False, index=True)
+    category = db.Column(db.String(16), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    blob_id = db.Column(db.Integer, db.ForeignKey('media_blobs.id'), nullable=False, index=True)
+
+    def __init__(self, instruction_id, category, name, blob_id):
+        self.instruction_id = instruction_id
+        self.category = category
+        self.name = name
+        self.blob_id = blob_id
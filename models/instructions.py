@@ -4,7 +4,7 @@ class Instruction(db.Model):
     __tablename__ = 'instructions'
 
     id = db.Column(db.Integer, primary_key=True)
-    operation_id = db.Column(db.Integer, nullable=False)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False, index=True)
     photo_path = db.Column(db.String(255))
     video_path = db.Column(db.String(255))
     text_path = db.Column(db.String(255))
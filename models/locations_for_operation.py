@@ -5,8 +5,8 @@ class LocationO(db.Model):
     __tablename__ = 'locations_for_operation'
 
     id = db.Column(db.Integer, primary_key=True)
-    location_id = db.Column(db.Integer,  nullable=False)
-    operation_id = db.Column(db.Integer,  nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False, index=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False, index=True)
 
     def __init__(self, location_id, operation_id):
         self.location_id = location_id
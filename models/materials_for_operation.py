@@ -5,8 +5,8 @@ class MaterialO(db.Model):
     __tablename__ = 'materials_for_operation'
 
     id = db.Column(db.Integer, primary_key=True)
-    material_id = db.Column(db.Integer, nullable=False)
-    operation_id = db.Column(db.Integer, nullable=False)
+    material_id = db.Column(db.Integer, db.ForeignKey('materials.id'), nullable=False, index=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False, index=True)
 
     def __init__(self, material_id, operation_id):
         self.material_id = material_id
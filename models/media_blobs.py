@@ -0,0 +1,22 @@
+from extensions import db
+
+class MediaBlob(db.Model):
+    __tablename__ = 'media_blobs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    mime_type = db.Column(db.String(128))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    path = db.Column(db.String(255), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, sha256, size, mime_type, width, height, path, ref_count=0):
+        self.sha256 = sha256
+        self.size = size
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.path = path
+        self.ref_count = ref_count
@@ -0,0 +1,29 @@
+from extensions import db
+from datetime import datetime
+
+class MediaJob(db.Model):
+    __tablename__ = 'media_jobs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    source_path = db.Column(db.String(255), nullable=False)
+    # Company whose upload created the job; only its admins see it in /media_jobs
+    company_id = db.Column(db.Integer, index=True)
+    kind = db.Column(db.String(16), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # Set when a worker claims the job and on every progress report; a running
+    # job whose claim is older than MEDIA_JOB_TIMEOUT is taken as lost
+    claimed_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime)
+
+    def __init__(self, source_path, kind, company_id=None):
+        self.source_path = source_path
+        self.kind = kind
+        self.company_id = company_id
+        self.status = 'queued'
+        self.progress = 0
+        self.attempts = 0
@@ -0,0 +1,20 @@
+from extensions import db
+
+class MediaRendition(db.Model):
+    __tablename__ = 'media_renditions'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    source_path = db.Column(db.String(255), nullable=False, index=True)
+    kind = db.Column(db.String(16), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(64), nullable=False)
+    path = db.Column(db.String(255), nullable=False)
+
+    def __init__(self, source_path, kind, width, height, mime_type, path):
+        self.source_path = source_path
+        self.kind = kind
+        self.width = width
+        self.height = height
+        self.mime_type = mime_type
+        self.path = path
@@ -0,0 +1,25 @@
+from extensions import db
+from datetime import datetime
+
+class MediaUpload(db.Model):
+    __tablename__ = 'media_uploads'
+
+    id = db.Column(db.String(32), primary_key=True)
+    instruction_id = db.Column(db.Integer, db.ForeignKey('instructions.id'), nullable=False, index=True)
+    category = db.Column(db.String(16), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    sha256 = db.Column(db.String(64))
+    temp_path = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __init__(self, id, instruction_id, category, filename, size, sha256, temp_path):
+        self.id = id
+        self.instruction_id = instruction_id
+        self.category = category
+        self.filename = filename
+        self.size = size
+        self.received = 0
+        self.sha256 = sha256
+        self.temp_path = temp_path
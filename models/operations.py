@@ -2,6 +2,9 @@ from extensions import db
 
 class Operation(db.Model):
     __tablename__ = 'operations'
+    __table_args__ = (
+        db.Index('ix_operations_component_id_product_type', 'component_id', 'product_type'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(128), nullable=False)
@@ -0,0 +1,19 @@
+from extensions import db
+
+class ShiftThroughput(db.Model):
+    __tablename__ = 'shift_throughput'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'shift_start', name='uq_shift_throughput_company_id_shift_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    company_id = db.Column(db.Integer, nullable=False)
+    shift_start = db.Column(db.DateTime, nullable=False)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __init__(self, company_id, shift_start, completed=0, total_seconds=0.0):
+        self.company_id = company_id
+        self.shift_start = shift_start
+        self.completed = completed
+        self.total_seconds = total_seconds
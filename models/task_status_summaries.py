@@ -0,0 +1,19 @@
+from extensions import db
+
+class TaskStatusSummary(db.Model):
+    __tablename__ = 'task_status_summary'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'admin_task_id', 'status', name='uq_task_status_summary_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    company_id = db.Column(db.Integer, nullable=False)
+    admin_task_id = db.Column(db.Integer, db.ForeignKey('admin_tasks.id'), nullable=False, index=True)
+    status = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, company_id, admin_task_id, status, count=0):
+        self.company_id = company_id
+        self.admin_task_id = admin_task_id
+        self.status = status
+        self.count = count
@@ -2,6 +2,12 @@ from extensions import db
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_responsible_id_status', 'responsible_id', 'status'),
+        db.Index('ix_tasks_company_id_admin_task_id', 'company_id', 'admin_task_id'),
+        db.Index('ix_tasks_company_id_status', 'company_id', 'status'),
+        db.Index('ix_tasks_operation_id_status', 'operation_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     product_id = db.Column(db.Integer, nullable=False)
@@ -10,7 +16,7 @@ class Task(db.Model):
     status = db.Column(db.String(50))
     company_id = db.Column(db.Integer, nullable=False)
     component_type = db.Column(db.String(50))
-    admin_task_id = db.Column(db.Integer, nullable=False)
+    admin_task_id = db.Column(db.Integer, db.ForeignKey('admin_tasks.id'), nullable=False, index=True)
     start_time = db.Column(db.DateTime)
     end_time = db.Column(db.DateTime)
 
@@ -2,6 +2,10 @@ from extensions import db
 
 class Tool(db.Model):
     __tablename__ = 'tools'
+    __table_args__ = (
+        # Keyset pagination of the company list pages
+        db.Index('ix_tools_company_id_name', 'company_id', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(128), unique=True, nullable=False)
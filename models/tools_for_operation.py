@@ -4,8 +4,8 @@ class ToolO(db.Model):
     __tablename__ = 'tools_for_operation'
 
     id = db.Column(db.Integer, primary_key=True)
-    tool_id = db.Column(db.Integer, nullable=False)
-    operation_id = db.Column(db.Integer, nullable=False)
+    tool_id = db.Column(db.Integer, db.ForeignKey('tools.id'), nullable=False, index=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False, index=True)
 
     def __init__(self, tool_id, operation_id):
         self.tool_id = tool_id
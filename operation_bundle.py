@@ -0,0 +1,149 @@
+import os
+
+from extensions import db
+from media_pipeline import load_renditions
+from media_serving import media_url
+from media_store import instruction_manifest
+from product_tree import component_company_id
+from models import (Block, Detail, Instruction, Location, LocationO, Material, MaterialO,
+                    Operation, Product, Tool, ToolO, dComponent)
+
+
+def normalize_path_for_url(path):
+    if path:
+        return path.replace('\\', '/')
+    return path
+
+
+def _static_relative(url_path):
+    # Paths are stored relative to the project root ("static/uploads/...")
+    if url_path.startswith('static/'):
+        return url_path[len('static/'):]
+    return url_path
+
+
+def list_legacy_files(url_path):
+    if not url_path:
+        return []
+    folder = os.path.join(os.getcwd(), 'static', _static_relative(url_path))
+    if not os.path.isdir(folder):
+        return []
+    with os.scandir(folder) as entries:
+        return sorted(entry.name for entry in entries if entry.is_file())
+
+
+def load_instruction_files(instruction):
+    """Files of an instruction per category: the media store manifest plus,
+    for instructions uploaded before it, whatever is left in their folders."""
+    if instruction is None:
+        return {'photo': [], 'video': [], 'text': []}
+
+    files = instruction_manifest(instruction.id)
+    for category, path in [('photo', instruction.photo_path),
+                           ('video', instruction.video_path),
+                           ('text', instruction.text_path)]:
+        url_path = normalize_path_for_url(path)
+        for filename in list_legacy_files(url_path):
+            path = 'static/' + _static_relative(url_path) + '/' + filename
+            files[category].append({'name': filename, 'path': path, 'url': media_url(path)})
+
+    # Thumbnails / web renditions / video posters made by the media pipeline
+    entries = [entry for category in files.values() for entry in category]
+    renditions = load_renditions(entry['path'] for entry in entries)
+    for entry in entries:
+        entry['renditions'] = renditions.get(entry['path'], [])
+    return files
+
+
+def _resolve_dependencies(dependent_components):
+    ids_by_type = {'product': set(), 'block': set(), 'detail': set()}
+    for dc in dependent_components:
+        if dc.product_type in ids_by_type:
+            ids_by_type[dc.product_type].add(dc.component_id)
+
+    details = {}
+    if ids_by_type['detail']:
+        details = {d.id: d for d in Detail.query.filter(Detail.id.in_(ids_by_type['detail'])).all()}
+
+    block_ids = ids_by_type['block'] | {d.block_id for d in details.values()}
+    blocks = {}
+    if block_ids:
+        blocks = {b.id: b for b in Block.query.filter(Block.id.in_(block_ids)).all()}
+
+    products = {}
+    if ids_by_type['product']:
+        products = {p.id: p for p in Product.query.filter(Product.id.in_(ids_by_type['product'])).all()}
+
+    dependencies = []
+    for dc in dependent_components:
+        component_name = "Невідомо"
+        product_id = None
+
+        if dc.product_type == "product" and dc.component_id in products:
+            product = products[dc.component_id]
+            component_name = product.name
+            product_id = product.id
+        elif dc.product_type == "block" and dc.component_id in blocks:
+            block = blocks[dc.component_id]
+            component_name = block.name
+            product_id = block.product_id
+        elif dc.product_type == "detail" and dc.component_id in details:
+            detail = details[dc.component_id]
+            component_name = detail.name
+            block = blocks.get(detail.block_id)
+            if block:
+                product_id = block.product_id
+
+        dependencies.append({
+            'type': dc.product_type,
+            'id': dc.component_id,
+            'name': component_name,
+            'product_id': product_id
+        })
+    return dependencies
+
+
+def load_operation_bundle(operation_id, company_id=None):
+    """Everything needed to show an operation, as plain JSON-serializable data.
+
+    Returns None if the operation does not exist or, with company_id, if it
+    belongs to another company.
+    """
+    row = db.session.query(Operation, Instruction).outerjoin(
+        Instruction, Instruction.operation_id == Operation.id
+    ).filter(Operation.id == operation_id).first()
+    if row is None:
+        return None
+    operation, instruction = row
+    if company_id is not None and component_company_id(operation.product_type, operation.component_id) != company_id:
+        return None
+
+    tools = db.session.query(Tool.id, Tool.name).join(
+        ToolO, ToolO.tool_id == Tool.id
+    ).filter(ToolO.operation_id == operation_id).order_by(Tool.id).all()
+
+    materials = db.session.query(Material.id, Material.name).join(
+        MaterialO, MaterialO.material_id == Material.id
+    ).filter(MaterialO.operation_id == operation_id).order_by(Material.id).all()
+
+    location = db.session.query(Location.id, Location.name).join(
+        LocationO, LocationO.location_id == Location.id
+    ).filter(LocationO.operation_id == operation_id).order_by(LocationO.id).first()
+
+    dependent_components = dComponent.query.filter_by(operation_id=operation_id).order_by(dComponent.id).all()
+
+    files = load_instruction_files(instruction)
+
+    return {
+        'id': operation.id,
+        'name': operation.name,
+        'component_id': operation.component_id,
+        'component_type': operation.product_type,
+        'tools': [{'id': t.id, 'name': t.name} for t in tools],
+        'materials': [{'id': m.id, 'name': m.name} for m in materials],
+        'location': {'id': location.id, 'name': location.name} if location else None,
+        'dependencies': _resolve_dependencies(dependent_components),
+        'photos': files['photo'],
+        'videos': files['video'],
+        'texts': files['text'],
+    }
@@ -0,0 +1,97 @@
+import base64
+import json
+
+from flask import abort, request
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(value, row_id):
+    raw = json.dumps([value, row_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw.decode('utf-8'))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class ListPage:
+    def __init__(self, items, next_cursor, sort, q, limit):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.sort = sort
+        self.q = q
+        self.limit = limit
+
+    def to_dict(self, serialize):
+        return {
+            'items': [serialize(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'sort': self.sort,
+            'q': self.q,
+        }
+
+
+def keyset_page(query, id_column, sort_columns, search_columns=(), sort='name', q=None,
+                cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of `query` ordered by a sort column with the id as tie-breaker.
+
+    sort is a key of sort_columns, prefixed with "-" for descending order.
+    The cursor holds the (sort value, id) of the last row of the previous
+    page, so every page costs the same index range scan however deep it is.
+    """
+    descending = sort.startswith('-')
+    column = sort_columns[sort.lstrip('-')]
+
+    if q:
+        pattern = f'%{escape_like(q)}%'
+        query = query.filter(or_(*[c.ilike(pattern, escape='\\') for c in search_columns]))
+
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, id_column < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, id_column > last_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, column.key), last.id)
+    return ListPage(rows, next_cursor, sort, q, limit)
+
+
+def page_from_request(query, id_column, sort_columns, search_columns=(), default_sort='name'):
+    # ?q=<search>&sort=<name|-name|...>&cursor=<opaque>&limit=<n>
+    sort = request.args.get('sort', default_sort)
+    if sort.lstrip('-') not in sort_columns:
+        sort = default_sort
+    q = request.args.get('q', '').strip() or None
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        return keyset_page(query, id_column, sort_columns, search_columns, sort, q,
+                           request.args.get('cursor'), limit)
+    except ValueError:
+        abort(400)
+
+
+def wants_json():
+    return request.args.get('format') == 'json'
@@ -0,0 +1,159 @@
+from sqlalchemy import and_, or_
+
+from models import Block, Detail, Operation, Product, Task
+
+
+def task_to_dict(t):
+    return {
+        "component_type": t.component_type,
+        "product_id": t.product_id,
+        "operation_id": t.operation_id,
+        "id": t.id,
+        "responsible_id": t.responsible_id,
+        "status": t.status,
+    }
+
+
+def component_company_id(component_type, component_id):
+    """Company owning a product, block or detail; None if there is no such component."""
+    query = Product.query.with_entities(Product.company_id)
+    if component_type == 'product':
+        query = query.filter(Product.id == component_id)
+    elif component_type == 'block':
+        query = query.join(Block, Block.product_id == Product.id).filter(Block.id == component_id)
+    elif component_type == 'detail':
+        query = query.join(Block, Block.product_id == Product.id).join(
+            Detail, Detail.block_id == Block.id).filter(Detail.id == component_id)
+    else:
+        return None
+    row = query.first()
+    return row[0] if row else None
+
+
+def load_product_tree(product_id, company_id, admin_task_id=None):
+    """Product -> blocks -> details with their operations (and the admin task's
+    assignments) in at most five queries, whatever the size of the tree.
+
+    Returns None if the product does not belong to the company.
+    """
+    product = Product.query.filter_by(id=product_id, company_id=company_id).first()
+    if product is None:
+        return None
+
+    blocks = Block.query.filter_by(product_id=product.id).order_by(Block.id).all()
+    block_ids = [b.id for b in blocks]
+
+    details = []
+    if block_ids:
+        details = Detail.query.filter(Detail.block_id.in_(block_ids)).order_by(Detail.id).all()
+    detail_ids = [d.id for d in details]
+
+    conditions = [and_(Operation.product_type == 'product', Operation.component_id == product.id)]
+    if block_ids:
+        conditions.append(and_(Operation.product_type == 'block', Operation.component_id.in_(block_ids)))
+    if detail_ids:
+        conditions.append(and_(Operation.product_type == 'detail', Operation.component_id.in_(detail_ids)))
+    operations = Operation.query.filter(or_(*conditions)).order_by(Operation.id).all()
+
+    operations_by_component = {}
+    for op in operations:
+        operations_by_component.setdefault((op.product_type, op.component_id), []).append(
+            {'id': op.id, 'name': op.name}
+        )
+
+    details_by_block = {}
+    for d in details:
+        details_by_block.setdefault(d.block_id, []).append({
+            'id': d.id,
+            'name': d.name,
+            'type': 'detail',
+            'operations': operations_by_component.get(('detail', d.id), []),
+        })
+
+    tasks = []
+    if admin_task_id is not None:
+        tasks = [task_to_dict(t) for t in Task.query.filter_by(admin_task_id=admin_task_id).order_by(Task.id).all()]
+
+    return {
+        'id': product.id,
+        'name': product.name,
+        'type': 'product',
+        'operations': operations_by_component.get(('product', product.id), []),
+        'blocks': [{
+            'id': b.id,
+            'name': b.name,
+            'type': 'block',
+            'operations': operations_by_component.get(('block', b.id), []),
+            'details': details_by_block.get(b.id, []),
+        } for b in blocks],
+        'tasks': tasks,
+    }
+
+
+def _component_entry(component_type, component_id, name, operations):
+    # Same shape as the /get_operations response
+    return {
+        'component_id': component_id,
+        'type_name': component_type.capitalize(),
+        'component_name': name,
+        'operations': operations,
+    }
+
+
+def tree_operations(tree):
+    """Flatten a product tree into {"<type>:<id>": component entry}."""
+    components = {}
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        components[f"{node['type']}:{node['id']}"] = _component_entry(
+            node['type'], node['id'], node['name'], node['operations']
+        )
+        nodes.extend(node.get('blocks', []))
+        nodes.extend(node.get('details', []))
+    return components
+
+
+def load_operations_batch(pairs, company_id):
+    """Operations of arbitrary (component_type, component_id) pairs of one company.
+
+    One query per component type for the names and one for all operations.
+    """
+    ids_by_type = {'product': set(), 'block': set(), 'detail': set()}
+    for component_type, component_id in pairs:
+        if component_type in ids_by_type:
+            ids_by_type[component_type].add(component_id)
+
+    names = {}
+    if ids_by_type['product']:
+        for p in Product.query.filter(Product.id.in_(ids_by_type['product']),
+                                      Product.company_id == company_id).all():
+            names[('product', p.id)] = p.name
+    if ids_by_type['block']:
+        for b in Block.query.join(Product, Product.id == Block.product_id).filter(
+                Block.id.in_(ids_by_type['block']), Product.company_id == company_id).all():
+            names[('block', b.id)] = b.name
+    if ids_by_type['detail']:
+        for d in Detail.query.join(Block, Block.id == Detail.block_id).join(
+                Product, Product.id == Block.product_id).filter(
+                Detail.id.in_(ids_by_type['detail']), Product.company_id == company_id).all():
+            names[('detail', d.id)] = d.name
+
+    operations_by_component = {key: [] for key in names}
+    conditions = [
+        and_(Operation.product_type == component_type, Operation.component_id.in_(
+            [cid for t, cid in names if t == component_type]))
+        for component_type in ids_by_type
+        if any(t == component_type for t, _ in names)
+    ]
+    if conditions:
+        for op in Operation.query.filter(or_(*conditions)).order_by(Operation.id).all():
+            operations_by_component[(op.product_type, op.component_id)].append({'id': op.id, 'name': op.name})
+
+    return {
+        f'{component_type}:{component_id}': _component_entry(
+            component_type, component_id, names[(component_type, component_id)],
+            operations_by_component[(component_type, component_id)]
+        )
+        for component_type, component_id in names
+    }
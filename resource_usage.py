@@ -0,0 +1,200 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from extensions import db
+from models import (Block, Detail, Employee, Location, LocationO, Material, MaterialO, Operation,
+                    Product, Task, Tool, ToolO)
+
+# kind -> (resource model, link model, link column)
+RESOURCES = {
+    'tool': (Tool, ToolO, ToolO.tool_id),
+    'material': (Material, MaterialO, MaterialO.material_id),
+    'location': (Location, LocationO, LocationO.location_id),
+}
+# Tasks that still need their operation's tools, materials and location
+OPEN_STATUSES = ('Не активне', 'У роботі', 'Alarm')
+
+
+def get_resource(kind, resource_id, company_id):
+    model = RESOURCES[kind][0]
+    return model.query.filter_by(id=resource_id, company_id=company_id).first()
+
+
+def _components(operations):
+    """Names and products of the components the operations belong to, three queries at most."""
+    ids_by_type = {'product': set(), 'block': set(), 'detail': set()}
+    for op in operations:
+        if op.product_type in ids_by_type:
+            ids_by_type[op.product_type].add(op.component_id)
+
+    details = {}
+    if ids_by_type['detail']:
+        details = {d.id: d for d in Detail.query.filter(Detail.id.in_(ids_by_type['detail'])).all()}
+    block_ids = ids_by_type['block'] | {d.block_id for d in details.values()}
+    blocks = {}
+    if block_ids:
+        blocks = {b.id: b for b in Block.query.filter(Block.id.in_(block_ids)).all()}
+    product_ids = ids_by_type['product'] | {b.product_id for b in blocks.values()}
+    products = {}
+    if product_ids:
+        products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+
+    components = {}
+    for component_type, component_id in {(op.product_type, op.component_id) for op in operations}:
+        name, product_id = "Невідомо", None
+        if component_type == 'product' and component_id in products:
+            name, product_id = products[component_id].name, component_id
+        elif component_type == 'block' and component_id in blocks:
+            name, product_id = blocks[component_id].name, blocks[component_id].product_id
+        elif component_type == 'detail' and component_id in details:
+            detail = details[component_id]
+            name = detail.name
+            product_id = blocks[detail.block_id].product_id if detail.block_id in blocks else None
+        product = products.get(product_id)
+        components[(component_type, component_id)] = {
+            'component_name': name,
+            'product_id': product_id,
+            'product_name': product.name if product else None,
+        }
+    return components
+
+
+def resource_usage(kind, resource):
+    """Operations that use a tool / material / location, their components and open tasks."""
+    link_model, link_column = RESOURCES[kind][1:]
+    operations = db.session.query(Operation).join(
+        link_model, link_model.operation_id == Operation.id
+    ).filter(link_column == resource.id).distinct().order_by(Operation.id).all()
+
+    components = _components(operations)
+    operation_ids = [op.id for op in operations]
+
+    tasks = []
+    if operation_ids:
+        tasks = db.session.query(Task, Employee).outerjoin(
+            Employee, Employee.id == Task.responsible_id
+        ).filter(
+            Task.operation_id.in_(operation_ids),
+            Task.status.in_(OPEN_STATUSES),
+            Task.company_id == resource.company_id
+        ).order_by(Task.id).all()
+
+    return {
+        'type': kind,
+        'id': resource.id,
+        'name': resource.name,
+        'operations': [dict(
+            components[(op.product_type, op.component_id)],
+            id=op.id,
+            name=op.name,
+            component_type=op.product_type,
+            component_id=op.component_id,
+        ) for op in operations],
+        'active_tasks': [{
+            'id': task.id,
+            'status': task.status,
+            'operation_id': task.operation_id,
+            'admin_task_id': task.admin_task_id,
+            'responsible_id': task.responsible_id,
+            'responsible_name': f'{employee.surname} {employee.name}' if employee else None,
+            'start_time': task.start_time.isoformat() if task.start_time else None,
+        } for task, employee in tasks],
+    }
+
+
+def usage_summary(kind, resource_id):
+    # What deleting the resource would affect: linked operations and their open tasks
+    link_model, link_column = RESOURCES[kind][1:]
+    operations = db.session.query(func.count(func.distinct(link_model.operation_id))).filter(
+        link_column == resource_id
+    ).scalar()
+    active_tasks = db.session.query(func.count(Task.id)).join(
+        link_model, link_model.operation_id == Task.operation_id
+    ).filter(link_column == resource_id, Task.status.in_(OPEN_STATUSES)).scalar()
+    return {'operations': operations or 0, 'active_tasks': active_tasks or 0}
+
+
+def unlink_resource(kind, resource_id):
+    link_model, link_column = RESOURCES[kind][1:]
+    link_model.query.filter(link_column == resource_id).delete(synchronize_session=False)
+
+
+def demand_report(company_id):
+    """Open tasks per tool / material / location of a company, one grouped query per kind.
+
+    Tasks have no due date, so every open task is work for today: the ones
+    running or in alarm need their resources now, the inactive ones are
+    the backlog of the shift.
+    """
+    report = {'generated_at': datetime.utcnow().isoformat(timespec='seconds')}
+    for kind, (model, link_model, link_column) in RESOURCES.items():
+        rows = db.session.query(
+            model.id,
+            model.name,
+            func.count(func.distinct(Task.id)),
+            func.count(func.distinct(Task.operation_id)),
+            func.count(func.distinct(Task.responsible_id)),
+        ).join(
+            link_model, link_column == model.id
+        ).join(
+            Task, Task.operation_id == link_model.operation_id
+        ).filter(
+            model.company_id == company_id,
+            Task.company_id == company_id,
+            Task.status.in_(OPEN_STATUSES)
+        ).group_by(model.id, model.name).all()
+
+        status_rows = db.session.query(
+            link_column, Task.status, func.count(func.distinct(Task.id))
+        ).join(
+            Task, Task.operation_id == link_model.operation_id
+        ).join(
+            model, model.id == link_column
+        ).filter(
+            model.company_id == company_id,
+            Task.company_id == company_id,
+            Task.status.in_(OPEN_STATUSES)
+        ).group_by(link_column, Task.status).all()
+        by_status = {}
+        for resource_id, status, count in status_rows:
+            by_status.setdefault(resource_id, {})[status] = count
+
+        report[kind] = sorted(({
+            'id': resource_id,
+            'name': name,
+            'open_tasks': open_tasks,
+            'operations': operations,
+            'employees': employees,
+            'by_status': by_status.get(resource_id, {}),
+        } for resource_id, name, open_tasks, operations, employees in rows),
+            key=lambda r: (-r['open_tasks'], r['name']))
+    return report
+
+
+class DemandReports:
+    """Demand reports per company, built once and shared by every request until ttl runs out."""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._reports = {}  # company_id -> (report, time.monotonic() it was built)
+
+    def get(self, company_id):
+        with self._lock:
+            entry = self._reports.get(company_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                return entry[0]
+        report = demand_report(company_id)
+        with self._lock:
+            self._reports[company_id] = (report, time.monotonic())
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._reports.clear()
+
+
+demand_reports = DemandReports()
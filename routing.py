@@ -0,0 +1,188 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+from connections import REPLICA_BIND
+
+# Key in the Flask session: until when (time.time()) this user's reads stay on the primary
+PRIMARY_UNTIL_KEY = 'db_primary_until'
+
+
+_force_primary = contextvars.ContextVar('db_force_primary', default=False)
+
+
+def read_only(f):
+    """Mark a view as read-only: its SELECTs may go to the read replica."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@contextmanager
+def on_primary():
+    """Run the block's queries on the primary, also inside @read_only views.
+
+    For loaders of process-wide caches: what they read is served to every
+    user for the cache's lifetime, so it must not be a lagging replica's.
+    Works as a decorator too.
+    """
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def _mysql_lag(connection):
+    for statement in ('SHOW REPLICA STATUS', 'SHOW SLAVE STATUS'):
+        try:
+            row = connection.execute(text(statement)).mappings().first()
+        except Exception:
+            continue
+        if row is None:
+            return 0.0
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        # NULL means replication is stopped
+        return float(lag) if lag is not None else None
+    return None
+
+
+def _postgresql_lag(connection):
+    return connection.execute(text(
+        'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+    )).scalar()
+
+
+LAG_PROBES = {
+    'mysql': _mysql_lag,
+    'postgresql': _postgresql_lag,
+}
+
+
+class ReplicaMonitor:
+    """Replica lag, re-measured at most every check_interval seconds, and routing counters.
+
+    A replica that cannot be measured counts as lagging, so reads fall back
+    to the primary instead of serving data of unknown age.
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._lag = None
+        self._checked_at = 0.0
+        self._checking = False
+        self.replica_reads = 0
+        self.lag_fallbacks = 0
+        self.sticky_reads = 0
+
+    def lag(self, engine):
+        with self._lock:
+            stale = time.monotonic() - self._checked_at >= self.check_interval
+            if not stale or self._checking:
+                return self._lag
+            self._checking = True
+
+        lag = None
+        try:
+            probe = LAG_PROBES.get(make_url(str(engine.url)).get_backend_name())
+            if probe is None:
+                # Local stand-ins (SQLite files) have no replication to lag behind
+                lag = 0.0
+            else:
+                with engine.connect() as connection:
+                    lag = probe(connection)
+        except Exception:
+            current_app.logger.exception('Could not measure replica lag')
+        finally:
+            with self._lock:
+                self._lag = lag
+                self._checked_at = time.monotonic()
+                self._checking = False
+        return lag
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lag_seconds': self._lag,
+                'replica_reads': self.replica_reads,
+                'lag_fallbacks': self.lag_fallbacks,
+                'sticky_reads': self.sticky_reads,
+            }
+
+
+replica_monitor = ReplicaMonitor()
+
+
+class RoutingSession(Session):
+    """Sends SELECTs of read-only views to the 'replica' bind.
+
+    Everything else goes to the primary. That covers writes, views not
+    marked with @read_only, and sessions that wrote something. It also
+    covers users who committed within REPLICA_STICKY_SECONDS, so they read
+    their own writes after a redirect. The primary is also used while the
+    replica lags more than REPLICA_MAX_LAG_SECONDS.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and self._may_use_replica():
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                if self._replica_fresh(replica):
+                    replica_monitor.count('replica_reads')
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _may_use_replica(self):
+        if not has_request_context() or not g.get('db_read_only') or _force_primary.get():
+            return False
+        if REPLICA_BIND not in current_app.config.get('SQLALCHEMY_BINDS', {}):
+            return False
+        if self.info.get('wrote') or flask_session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+            replica_monitor.count('sticky_reads')
+            return False
+        return True
+
+    def _replica_fresh(self, replica):
+        lag = replica_monitor.lag(replica)
+        if lag is None or lag > current_app.config['REPLICA_MAX_LAG_SECONDS']:
+            replica_monitor.count('lag_fallbacks')
+            return False
+        return True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if not session.info.pop('wrote', False):
+        return
+    if has_request_context():
+        sticky = current_app.config['REPLICA_STICKY_SECONDS']
+        if sticky and REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {}):
+            flask_session[PRIMARY_UNTIL_KEY] = time.time() + sticky
+            # Later reads of this request stay on the primary as well
+            session.info['wrote'] = True
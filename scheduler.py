@@ -0,0 +1,169 @@
+import heapq
+from datetime import datetime
+
+from extensions import db
+from dependency_graph import DONE_STATUS, load_dependency_graph
+from models import Employee, Task
+
+# Tasks that keep their employee busy; the scheduler does not move them
+RUNNING_STATUSES = ('У роботі', 'Alarm')
+
+
+def _employee_factors(operation_ids, operation_means):
+    """How much slower (>1) or faster (<1) than average each employee has been on these operations."""
+    if not operation_ids:
+        return {}
+    rows = db.session.query(Task.responsible_id, Task.operation_id, Task.start_time, Task.end_time).filter(
+        Task.operation_id.in_(operation_ids),
+        Task.status == DONE_STATUS,
+        Task.start_time.isnot(None),
+        Task.end_time.isnot(None)
+    ).all()
+    ratios = {}
+    for employee_id, operation_id, start, end in rows:
+        mean = operation_means.get(operation_id)
+        if mean:
+            ratios.setdefault(employee_id, []).append(max((end - start).total_seconds(), 0.0) / mean)
+    # A few tasks say little, so pull the factor towards 1
+    return {
+        employee_id: (sum(values) + 3) / (len(values) + 3)
+        for employee_id, values in ratios.items()
+    }
+
+
+def schedule_admin_task(admin_task, employee_ids=None, now=None):
+    """List-schedule the admin task's operations over the company's employees.
+
+    Operations are taken in order of their longest remaining chain (upward
+    rank) as soon as everything they depend on is scheduled. Each one goes
+    to the employee who would finish it first. An employee works on one task
+    at a time. Finished tasks count as done, and running ones keep their
+    employee busy for the rest of their expected duration.
+
+    Returns the plan dict; raises DependencyCycleError for cyclic plans.
+    """
+    now = now or datetime.utcnow()
+    graph = load_dependency_graph(admin_task)
+    if graph is None:
+        return None
+
+    employees_query = Employee.query.filter_by(company_id=admin_task.company_id)
+    if employee_ids:
+        employees_query = employees_query.filter(Employee.id.in_(employee_ids))
+    employees = employees_query.order_by(Employee.id).all()
+
+    existing = {}
+    for task in Task.query.filter_by(admin_task_id=admin_task.id).all():
+        existing.setdefault(task.operation_id, task)
+
+    factors = _employee_factors(list(graph.operations), graph.durations)
+    order = graph.topological_order()
+
+    # Upward rank: the operation's own duration plus the longest chain after it
+    rank = {}
+    for node in reversed(order):
+        own = graph.durations[node[1]] if node[0] == 'operation' else 0.0
+        rank[node] = own + max((rank[t] for t in graph.edges[node]), default=0.0)
+
+    free_at = {e.id: 0.0 for e in employees}
+    busy = {e.id: 0.0 for e in employees}
+    finish = {}
+    assignments = []
+
+    indegree = {node: 0 for node in graph.edges}
+    for targets in graph.edges.values():
+        for target in targets:
+            indegree[target] += 1
+    ready_at = {node: 0.0 for node in graph.edges}
+    ready = []
+
+    # Running tasks stay with their employee, also one left out of the pool. Book
+    # them before anything is placed, or an employee whose running task is
+    # released late could already have been given work that overlaps it
+    running = {}  # operation id -> expected seconds left
+    for operation_id, task in existing.items():
+        if operation_id not in graph.operations or task.status not in RUNNING_STATUSES:
+            continue
+        elapsed = (now - task.start_time).total_seconds() if task.start_time else 0.0
+        remaining = max(graph.durations[operation_id] * factors.get(task.responsible_id, 1.0) - elapsed, 0.0)
+        running[operation_id] = remaining
+        if task.responsible_id in free_at:
+            free_at[task.responsible_id] = max(free_at[task.responsible_id], remaining)
+            busy[task.responsible_id] += remaining
+
+    def release(node, at):
+        # Component nodes take no time: pass their finish straight on
+        finish[node] = at
+        for target in graph.edges[node]:
+            ready_at[target] = max(ready_at[target], at)
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                push(target)
+
+    def push(node):
+        if node[0] == 'component':
+            release(node, ready_at[node])
+            return
+        operation_id = node[1]
+        task = existing.get(operation_id)
+        if task is not None and task.status == DONE_STATUS:
+            release(node, ready_at[node])
+        elif operation_id in running:
+            release(node, max(ready_at[node], running[operation_id]))
+        else:
+            heapq.heappush(ready, (-rank[node], operation_id))
+
+    for node in [n for n, d in indegree.items() if d == 0]:
+        push(node)
+
+    while ready and employees:
+        _, operation_id = heapq.heappop(ready)
+        node = ('operation', operation_id)
+        duration = graph.durations[operation_id]
+
+        best = None
+        for employee in employees:
+            start = max(free_at[employee.id], ready_at[node])
+            end = start + duration * factors.get(employee.id, 1.0)
+            if best is None or end < best[0]:
+                best = (end, start, employee)
+        end, start, employee = best
+
+        free_at[employee.id] = end
+        busy[employee.id] += end - start
+        _, component_type, component_id = graph.operations[operation_id]['component']
+        assignments.append({
+            'operation_id': operation_id,
+            'operation_name': graph.operations[operation_id]['name'],
+            'component_type': component_type,
+            'component_id': component_id,
+            'employee_id': employee.id,
+            'employee_name': f'{employee.surname} {employee.name}',
+            'start_seconds': start,
+            'finish_seconds': end,
+        })
+        release(node, end)
+
+    makespan = max(finish.values(), default=0.0)
+    return {
+        'admin_task_id': admin_task.id,
+        'makespan_seconds': makespan,
+        'critical_path_seconds': max(rank.values(), default=0.0),
+        'assignments': assignments,
+        'employees': [{
+            'id': e.id,
+            'name': f'{e.surname} {e.name}',
+            'busy_seconds': busy[e.id],
+            'utilization': busy[e.id] / makespan if makespan else 0.0,
+        } for e in employees],
+    }
+
+
+def plan_rows(plan):
+    # Assignment rows in the format of bulk_assign
+    return [{
+        'operation_id': a['operation_id'],
+        'component_type': a['component_type'],
+        'component_id': a['component_id'],
+        'employee_id': a['employee_id'],
+    } for a in plan['assignments']]
@@ -0,0 +1,463 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+
+from flask import current_app
+
+from extensions import db
+from models import (Block, Detail, Instruction, InstructionFile, Location, Material, MediaBlob,
+                    Operation, Product, Tool)
+from routing import on_primary
+
+TOKEN_RE = re.compile(r'\w+')
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv')
+MAX_TEXT_BYTES = 1024 * 1024
+# Typo tolerance (one edit) only for tokens long enough for it to make sense
+FUZZY_MIN_LENGTH = 4
+FUZZY_MAX_LENGTH = 24
+MAX_PREFIX_TOKENS = 500
+MAX_FUZZY_CANDIDATES = 2000
+
+# Scores of a query token matching an indexed token
+EXACT, PREFIX, FUZZY = 3, 2, 1
+KIND_ORDER = {'product': 0, 'block': 1, 'detail': 2, 'operation': 3,
+              'tool': 4, 'material': 5, 'location': 6, 'instruction': 7}
+
+
+def tokenize(text):
+    tokens = TOKEN_RE.findall((text or '').lower())
+    if len(tokens) <= 8:
+        # Names: "T-12" is also findable as "t12"
+        tokens += [a + b for a, b in zip(tokens, tokens[1:])]
+    return tokens
+
+
+def _within_one_edit(a, b):
+    # Levenshtein distance <= 1, plus adjacent transpositions
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        return len(diff) == 1 or (
+            len(diff) == 2 and diff[1] == diff[0] + 1
+            and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+        )
+    if la > lb:
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+def read_text_file(path):
+    if os.path.splitext(path)[1].lower() not in TEXT_EXTENSIONS or not os.path.isfile(path):
+        return ''
+    with open(path, 'rb') as f:
+        return f.read(MAX_TEXT_BYTES).decode('utf-8', errors='ignore')
+
+
+class _SortedTokens:
+    """Sorted token list for prefix scans; writes append, the next read sorts."""
+
+    def __init__(self):
+        self.tokens = []
+        self.added = []
+        self.stale = 0  # removed tokens still in self.tokens
+
+    def add(self, token):
+        self.added.append(token)
+
+    def discard(self, token):
+        self.stale += 1
+
+    def compact(self, live):
+        if self.stale > len(self.tokens) // 4:
+            self.tokens = sorted(t for t in set(self.tokens + self.added) if t in live)
+            self.added, self.stale = [], 0
+        elif self.added:
+            # Timsort merges the appended run in about linear time
+            self.tokens += self.added
+            self.tokens.sort()
+            self.added = []
+
+    def scan(self, prefix, live, limit):
+        self.compact(live)
+        found = []
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and len(found) < limit:
+            token = self.tokens[i]
+            if not token.startswith(prefix):
+                break
+            if token in live and (not found or found[-1] != token):
+                found.append(token)
+            i += 1
+        return found
+
+
+class _CompanyIndex:
+    def __init__(self):
+        self.docs = {}        # (kind, id) -> doc dict
+        self.doc_tokens = {}  # (kind, id) -> set of tokens
+        self.order = {}       # (kind, id) -> sort key of results with the same score
+        self.postings = {}    # token -> set of (kind, id)
+        self.forward = _SortedTokens()
+        self.backward = _SortedTokens()  # reversed tokens, for fuzzy matches on the suffix
+        self.reversed_live = {}          # reversed token -> token
+
+    def compact(self):
+        self.forward.compact(self.postings)
+        self.backward.compact(self.reversed_live)
+
+    def upsert(self, doc, text):
+        key = (doc['type'], doc['id'])
+        self.remove(key)
+        tokens = set(tokenize(text))
+        self.docs[key] = doc
+        self.doc_tokens[key] = tokens
+        self.order[key] = (KIND_ORDER.get(key[0], 99), doc['name'].lower(), key[1])
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = set()
+                self.forward.add(token)
+                if FUZZY_MIN_LENGTH - 1 <= len(token) <= FUZZY_MAX_LENGTH + 1:
+                    self.reversed_live[token[::-1]] = token
+                    self.backward.add(token[::-1])
+            posting.add(key)
+
+    def remove(self, key):
+        self.docs.pop(key, None)
+        self.order.pop(key, None)
+        for token in self.doc_tokens.pop(key, ()):
+            posting = self.postings[token]
+            posting.discard(key)
+            if posting:
+                continue
+            del self.postings[token]
+            self.forward.discard(token)
+            if self.reversed_live.pop(token[::-1], None) is not None:
+                self.backward.discard(token[::-1])
+
+    def _fuzzy_candidates(self, query_token):
+        # One edit leaves either the first or the last half of the word intact
+        half = len(query_token) // 2
+        candidates = set(self.forward.scan(query_token[:half], self.postings, MAX_FUZZY_CANDIDATES))
+        for reversed_token in self.backward.scan(query_token[::-1][:half], self.reversed_live,
+                                                 MAX_FUZZY_CANDIDATES):
+            candidates.add(self.reversed_live[reversed_token])
+        return candidates
+
+    def _matching_tokens(self, query_token):
+        matches = {}
+        if query_token in self.postings:
+            matches[query_token] = EXACT
+
+        for token in self.forward.scan(query_token, self.postings, MAX_PREFIX_TOKENS):
+            matches.setdefault(token, PREFIX)
+
+        if FUZZY_MIN_LENGTH <= len(query_token) <= FUZZY_MAX_LENGTH:
+            for token in self._fuzzy_candidates(query_token):
+                if token not in matches and _within_one_edit(query_token, token):
+                    matches[token] = FUZZY
+        return matches
+
+    def search(self, query, kinds=None, limit=20):
+        query_tokens = TOKEN_RE.findall((query or '').lower())
+        if not query_tokens:
+            return []
+
+        matched = [self._matching_tokens(t) for t in dict.fromkeys(query_tokens)]
+        if not all(matched):
+            return []
+        # Start from the rarest query word, then only check the documents still in the running
+        matched.sort(key=lambda m: sum(len(self.postings[t]) for t in m))
+
+        scores = {}
+        # Lowest scores first, so a document keeps the best of its matching words
+        for token, score in sorted(matched[0].items(), key=lambda item: item[1]):
+            scores.update(dict.fromkeys(self.postings[token], score))
+
+        for matches in matched[1:]:
+            narrowed = {}
+            for token, score in sorted(matches.items(), key=lambda item: item[1]):
+                # The dict view intersects by walking the smaller side
+                narrowed.update((key, scores[key] + score) for key in scores.keys() & self.postings[token])
+            scores = narrowed
+            if not scores:
+                return []
+
+        by_score = {}
+        for key, score in scores.items():
+            if kinds is None or key[0] in kinds:
+                by_score.setdefault(score, []).append(key)
+        # A short word can match most of the index: only order the page that is returned
+        results = []
+        for score in sorted(by_score, reverse=True):
+            for key in heapq.nsmallest(limit - len(results), by_score[score], key=self.order.__getitem__):
+                results.append(dict(self.docs[key], score=score))
+            if len(results) >= limit:
+                break
+        return results
+
+
+class SearchIndex:
+    """In-process inverted index of names (and text instructions) per company.
+
+    Companies are loaded lazily, kept up to date by the add/edit/delete routes
+    and rebuilt every reload_interval seconds to pick up changes made by other
+    processes. A stale index keeps serving while a background thread builds
+    its replacement. Each company has its own lock, so a slow search or
+    rebuild in one company does not hold up the others.
+    """
+
+    def __init__(self, reload_interval=300):
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()  # guards the dicts below, never held while searching
+        self._locks = {}      # company_id -> lock of that company's index
+        self._indexes = {}    # company_id -> _CompanyIndex
+        self._loaded_at = {}  # company_id -> time.monotonic() of last load
+        self._pending = {}    # company_id -> changes made while a load is in flight
+        self._loading = {}    # company_id -> event set when that load is done
+        self._rebuilding = set()
+        self.loads = 0
+        self.last_load_seconds = 0.0
+
+    def _company_lock(self, company_id):
+        with self._lock:
+            lock = self._locks.get(company_id)
+            if lock is None:
+                lock = self._locks[company_id] = threading.Lock()
+            return lock
+
+    # --- loading ---------------------------------------------------------------
+
+    def _documents(self, company_id):
+        products = Product.query.filter_by(company_id=company_id).all()
+        yield from ((_doc('product', p.id, p.name, product_id=p.id), p.name) for p in products)
+
+        blocks = db.session.query(Block).join(Product, Product.id == Block.product_id).filter(
+            Product.company_id == company_id).all()
+        yield from ((_doc('block', b.id, b.name, product_id=b.product_id), b.name) for b in blocks)
+
+        details = db.session.query(Detail, Block.product_id).join(Block, Block.id == Detail.block_id).join(
+            Product, Product.id == Block.product_id).filter(Product.company_id == company_id).all()
+        yield from ((_doc('detail', d.id, d.name, product_id=product_id), d.name) for d, product_id in details)
+
+        operations = {}
+        for query in _operation_queries(company_id):
+            for op, product_id in query.all():
+                operations[op.id] = (op.name, product_id)
+                yield _doc('operation', op.id, op.name, product_id=product_id), op.name
+
+        for model, kind in ((Tool, 'tool'), (Material, 'material'), (Location, 'location')):
+            for row in model.query.filter_by(company_id=company_id).all():
+                yield _doc(kind, row.id, row.name), row.name
+
+        texts = {}
+        if operations:
+            rows = db.session.query(Instruction.operation_id, MediaBlob.path).join(
+                InstructionFile, InstructionFile.instruction_id == Instruction.id
+            ).join(MediaBlob, MediaBlob.id == InstructionFile.blob_id).filter(
+                Instruction.operation_id.in_(operations), InstructionFile.category == 'text'
+            ).all()
+            for operation_id, path in rows:
+                texts.setdefault(operation_id, []).append(read_text_file(path))
+        for operation_id, parts in texts.items():
+            name, product_id = operations[operation_id]
+            yield _doc('instruction', operation_id, name, product_id=product_id), '\n'.join(parts)
+
+    def _load(self, company_id):
+        lock = self._company_lock(company_id)
+        with lock:
+            loaded = self._loading.get(company_id)
+            if loaded is None:
+                self._pending[company_id] = []
+                loaded = self._loading[company_id] = threading.Event()
+                building = True
+            else:
+                building = False
+                with self._lock:
+                    current = self._indexes.get(company_id)
+        if not building:
+            if current is not None:
+                # Another thread is already rebuilding it; serve the old one meanwhile
+                return current
+            # The company's first load runs in another thread, an empty index would find nothing
+            loaded.wait()
+            with self._lock:
+                return self._indexes.get(company_id) or _CompanyIndex()
+
+        started = time.perf_counter()
+        index = _CompanyIndex()
+        try:
+            # The index is served to the whole company until the next reload
+            with on_primary():
+                for doc, text in self._documents(company_id):
+                    index.upsert(doc, text)
+            index.compact()
+        except Exception:
+            with lock:
+                self._pending.pop(company_id, None)
+                self._loading.pop(company_id).set()
+            raise
+
+        with lock:
+            # Replay changes committed while the documents were being read
+            for change in self._pending.pop(company_id):
+                _apply_change(index, change)
+            with self._lock:
+                self._indexes[company_id] = index
+                self._loaded_at[company_id] = time.monotonic()
+                self.loads += 1
+                self.last_load_seconds = time.perf_counter() - started
+            self._loading.pop(company_id).set()
+        return index
+
+    def _reload_in_background(self, company_id):
+        with self._lock:
+            if company_id in self._rebuilding:
+                return
+            self._rebuilding.add(company_id)
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    self._load(company_id)
+            except Exception:
+                # The old index stays; the next search after the failure tries again
+                app.logger.exception('Search index reload failed for company %s', company_id)
+            finally:
+                with self._lock:
+                    self._rebuilding.discard(company_id)
+
+        threading.Thread(target=run, name=f'search-index-{company_id}', daemon=True).start()
+
+    def _index(self, company_id):
+        with self._lock:
+            index = self._indexes.get(company_id)
+            fresh = time.monotonic() - self._loaded_at.get(company_id, 0) < self.reload_interval
+        if index is None:
+            # Nothing to serve yet: the first search of a company waits for the load
+            return self._load(company_id)
+        if not fresh:
+            self._reload_in_background(company_id)
+        return index
+
+    # --- queries ---------------------------------------------------------------
+
+    def search(self, company_id, query, kinds=None, limit=20):
+        index = self._index(company_id)
+        # Searching compacts the sorted token lists, so it is a write as well
+        with self._company_lock(company_id):
+            return index.search(query, kinds, limit)
+
+    # --- write-through from the routes ----------------------------------------
+
+    def _change(self, company_id, change):
+        with self._company_lock(company_id):
+            if company_id in self._pending:
+                self._pending[company_id].append(change)
+            with self._lock:
+                index = self._indexes.get(company_id)
+            if index is not None:
+                _apply_change(index, change)
+
+    def upsert(self, company_id, kind, doc_id, name, text=None, **extra):
+        doc = _doc(kind, doc_id, name, **extra)
+        self._change(company_id, ('upsert', doc, name if text is None else text))
+
+    def remove(self, company_id, kind, doc_id):
+        self._change(company_id, ('remove', (kind, doc_id)))
+
+    def remove_product(self, company_id, product_id):
+        # The product with its blocks, details and their operations
+        self._change(company_id, ('remove_product', product_id))
+
+    def index_operation(self, company_id, operation):
+        """Re-index an operation's name and its text instructions."""
+        product_id = component_product_id(operation.product_type, operation.component_id)
+        self.upsert(company_id, 'operation', operation.id, operation.name, product_id=product_id)
+
+        paths = [row[0] for row in db.session.query(MediaBlob.path).join(
+            InstructionFile, InstructionFile.blob_id == MediaBlob.id
+        ).join(Instruction, Instruction.id == InstructionFile.instruction_id).filter(
+            Instruction.operation_id == operation.id, InstructionFile.category == 'text'
+        ).all()]
+        text = '\n'.join(read_text_file(path) for path in paths)
+        if text.strip():
+            self.upsert(company_id, 'instruction', operation.id, operation.name,
+                        text=text, product_id=product_id)
+        else:
+            self.remove(company_id, 'instruction', operation.id)
+
+    def remove_operation(self, company_id, operation_id):
+        self.remove(company_id, 'operation', operation_id)
+        self.remove(company_id, 'instruction', operation_id)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._loaded_at.clear()
+
+    def stats(self, company_id):
+        # Load counters are process-wide, sizes only those of the company's index
+        with self._lock:
+            index = self._indexes.get(company_id)
+            return {
+                'loaded': index is not None,
+                'documents': len(index.docs) if index is not None else 0,
+                'tokens': len(index.postings) if index is not None else 0,
+                'loads': self.loads,
+                'last_load_seconds': self.last_load_seconds,
+            }
+
+
+def _doc(kind, doc_id, name, **extra):
+    return dict(extra, type=kind, id=doc_id, name=name or '')
+
+
+def _apply_change(index, change):
+    action = change[0]
+    if action == 'upsert':
+        index.upsert(change[1], change[2])
+    elif action == 'remove':
+        index.remove(change[1])
+    elif action == 'remove_product':
+        for key in [key for key, doc in index.docs.items() if doc.get('product_id') == change[1]]:
+            index.remove(key)
+
+
+def _operation_queries(company_id):
+    yield db.session.query(Operation, Product.id).join(
+        Product, Product.id == Operation.component_id
+    ).filter(Operation.product_type == 'product', Product.company_id == company_id)
+    yield db.session.query(Operation, Block.product_id).join(
+        Block, Block.id == Operation.component_id
+    ).join(Product, Product.id == Block.product_id).filter(
+        Operation.product_type == 'block', Product.company_id == company_id)
+    yield db.session.query(Operation, Block.product_id).join(
+        Detail, Detail.id == Operation.component_id
+    ).join(Block, Block.id == Detail.block_id).join(Product, Product.id == Block.product_id).filter(
+        Operation.product_type == 'detail', Product.company_id == company_id)
+
+
+def component_product_id(component_type, component_id):
+    if component_type == 'product':
+        return component_id
+    if component_type == 'block':
+        row = db.session.query(Block.product_id).filter(Block.id == component_id).first()
+    else:
+        row = db.session.query(Block.product_id).join(Detail, Detail.block_id == Block.id).filter(
+            Detail.id == component_id).first()
+    return row[0] if row else None
+
+
+search_index = SearchIndex()
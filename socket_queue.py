@@ -0,0 +1,172 @@
+import atexit
+import contextlib
+import logging
+import os
+import queue
+import socket
+import threading
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+# Largest room broadcast a Unix datagram carries; alarm and dashboard events are far below it
+MAX_DATAGRAM = 64 * 1024
+# Emits to this namespace carry cache invalidations between workers and never reach a client
+CACHE_NAMESPACE = '/cache-sync'
+
+
+class CacheSync:
+    """Invalidations of in-process caches, passed to the other workers over the message queue.
+
+    A cache applies a change to itself and publish()es it; every other worker
+    hands it to the handler registered under the same name. Without a message
+    queue there is only one process and publish() does nothing.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self.socketio = None
+
+    def init_app(self, socketio):
+        self.socketio = socketio
+
+    def handler(self, name):
+        def decorator(f):
+            self._handlers[name] = f
+            return f
+        return decorator
+
+    def publish(self, name, **payload):
+        if self.socketio is None or not isinstance(self.socketio.server.manager, socketio.PubSubManager):
+            return
+        self.socketio.emit(name, payload, namespace=CACHE_NAMESPACE)
+
+    def receive(self, name, payload):
+        handler = self._handlers.get(name)
+        if handler is None:
+            logger.warning('No cache sync handler for %s', name)
+            return
+        handler(**payload)
+
+
+cache_sync = CacheSync()
+
+
+class CacheSyncMixin:
+    """Delivers messages of CACHE_NAMESPACE to cache_sync instead of Socket.IO clients."""
+
+    def _handle_emit(self, message):
+        if message.get('namespace') != CACHE_NAMESPACE:
+            return super()._handle_emit(message)
+        # The publishing worker has applied the change already
+        if message.get('host_id') != self.host_id:
+            data = message.get('data') or [{}]
+            cache_sync.receive(message['event'], data[0])
+
+
+class LocalQueueManager(CacheSyncMixin, socketio.PubSubManager):
+    """message_queue='memory://': servers in one process share broadcasts.
+
+    Stands in for Redis when several SocketIO instances run in one test
+    process. Messages still go through JSON, like on a real queue.
+    """
+    name = 'memory'
+    _lock = threading.Lock()
+    _subscribers = {}  # channel -> list of queue.Queue
+
+    def __init__(self, url='memory://', channel='flask-socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self._inbox = None
+
+    def _publish(self, data):
+        message = self.json.dumps(data)
+        with self._lock:
+            subscribers = list(self._subscribers.get(self.channel, ()))
+        for inbox in subscribers:
+            if inbox is not self._inbox:
+                inbox.put(message)
+
+    def _listen(self):
+        self._inbox = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(self.channel, []).append(self._inbox)
+        while True:
+            yield self._inbox.get()
+
+
+class UnixSocketManager(CacheSyncMixin, socketio.PubSubManager):
+    """message_queue='unix:///run/virtfact': workers on one host share broadcasts.
+
+    Every listening worker binds a datagram socket named after its host id in
+    <path>/<channel>/, and a broadcast is sent to each socket found there.
+    Sockets of workers that have died are removed on the first failed send.
+    """
+    name = 'unix'
+
+    def __init__(self, url='unix:///tmp/virtfact-socketio', channel='flask-socketio', write_only=False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.directory = os.path.join(url[len('unix://'):], channel)
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{self.host_id}.sock')
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender_lock = threading.Lock()
+
+    def _publish(self, data):
+        message = self.json.dumps(data).encode('utf-8')
+        if len(message) > MAX_DATAGRAM:
+            self._get_logger().error('Socket.IO message of %d bytes is too large for the unix queue', len(message))
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.sock') or path == self.path:
+                continue
+            try:
+                with self._sender_lock:
+                    self._sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker that owned this socket is gone
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+
+    def _listen(self):
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        receiver.bind(self.path)
+        atexit.register(self._unlink)
+        while True:
+            yield receiver.recv(MAX_DATAGRAM)
+
+    def _unlink(self):
+        with contextlib.suppress(OSError):
+            os.unlink(self.path)
+
+
+def _queue_class(message_queue):
+    # The manager Flask-SocketIO would pick for the URL, with cache sync mixed in
+    if message_queue.startswith('memory://'):
+        return LocalQueueManager
+    if message_queue.startswith('unix://'):
+        return UnixSocketManager
+    if message_queue.startswith(('redis://', 'rediss://')):
+        base = socketio.RedisManager
+    elif message_queue.startswith('kafka://'):
+        base = socketio.KafkaManager
+    elif message_queue.startswith('zmq'):
+        base = socketio.ZmqManager
+    else:
+        base = socketio.KombuManager
+    return type(base.__name__, (CacheSyncMixin, base), {})
+
+
+def socketio_options(message_queue, channel='flask-socketio'):
+    """SocketIO() keyword arguments for a message queue URL.
+
+    memory:// and unix:// use the managers above; redis://, amqp://,
+    kafka:// and zmq+tcp:// use python-socketio's. Either way the manager
+    also carries cache_sync messages. None keeps the single-process default.
+    """
+    if not message_queue:
+        return {}
+    return {'client_manager': _queue_class(message_queue)(message_queue, channel=channel)}
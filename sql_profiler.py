@@ -0,0 +1,237 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event
+
+logger = logging.getLogger('sql_profiler')
+
+# The same SELECT this many times in one request or event is reported as N+1
+N_PLUS_ONE_THRESHOLD = 5
+RECENT_PROFILES = 200
+
+_active = contextvars.ContextVar('sql_profiles', default=())
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    """Statement with literals and IN lists collapsed, so repeats of one query compare equal."""
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    return _IN_LIST.sub('IN (...)', statement)
+
+
+class QueryProfile:
+    """Queries of one request, Socket.IO event or query_budget() block."""
+
+    def __init__(self, label, company_id=None):
+        self.label = label
+        self.company_id = company_id
+        self.count = 0
+        self.duration_ms = 0.0
+        self.fingerprints = Counter()
+        self.started_at = time.time()
+
+    def record(self, statement, duration_ms):
+        self.count += 1
+        self.duration_ms += duration_ms
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def duplicates(self):
+        return {fp: n for fp, n in self.fingerprints.items() if n > 1}
+
+    def n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        return {
+            fp: n for fp, n in self.fingerprints.items()
+            if n >= threshold and fp.upper().startswith('SELECT')
+        }
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'company_id': self.company_id,
+            'queries': self.count,
+            'duration_ms': round(self.duration_ms, 3),
+            'duplicates': self.duplicates(),
+            'n_plus_one': self.n_plus_one(),
+            'started_at': self.started_at,
+        }
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class SQLProfiler:
+    """Opt-in (SQL_PROFILING = True) query counting per request and Socket.IO event.
+
+    Engine events record every statement into the profiles active in the
+    current context. Requests get X-SQL-* response headers, a warning is
+    logged for N+1 patterns and /sql_profile shows per-endpoint totals.
+    query_budget() works in tests whether profiling is on or not.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._attached = set()
+        self.app = None
+        self.db = None
+        self.enabled = False
+        self.recent = deque(maxlen=RECENT_PROFILES)
+        self.endpoints = {}  # label -> totals
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.enabled = app.config.setdefault('SQL_PROFILING', False)
+        if not self.enabled:
+            return
+        self._attach()
+
+        @app.before_request
+        def start_sql_profile():
+            profile = QueryProfile(request.endpoint or request.path, session.get('company_id'))
+            g.sql_profile = profile
+            g.sql_profile_token = _active.set(_active.get() + (profile,))
+
+        @app.after_request
+        def sql_profile_headers(response):
+            profile = g.get('sql_profile')
+            if profile is not None:
+                response.headers['X-SQL-Queries'] = str(profile.count)
+                response.headers['X-SQL-Time-Ms'] = f'{profile.duration_ms:.1f}'
+                response.headers['X-SQL-Duplicates'] = str(sum(n - 1 for n in profile.duplicates().values()))
+                if profile.n_plus_one():
+                    response.headers['X-SQL-N-Plus-One'] = '1'
+            return response
+
+        @app.teardown_request
+        def finish_sql_profile(exc):
+            profile = g.pop('sql_profile', None)
+            token = g.pop('sql_profile_token', None)
+            if token is not None:
+                _active.reset(token)
+            if profile is not None:
+                self._store(profile)
+
+    def _attach(self):
+        with self.app.app_context():
+            engines = list(self.db.engines.values())
+        for engine in engines:
+            if id(engine) in self._attached:
+                continue
+            self._attached.add(id(engine))
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+    def _store(self, profile):
+        n_plus_one = profile.n_plus_one()
+        if n_plus_one:
+            for fp, n in n_plus_one.items():
+                logger.warning('N+1 in %s: %d x %s', profile.label, n, fp)
+        with self._lock:
+            self.recent.append(profile.to_dict())
+            totals = self.endpoints.setdefault(profile.label, {
+                'calls': 0, 'queries': 0, 'max_queries': 0, 'duration_ms': 0.0, 'n_plus_one_calls': 0,
+            })
+            totals['calls'] += 1
+            totals['queries'] += profile.count
+            totals['max_queries'] = max(totals['max_queries'], profile.count)
+            totals['duration_ms'] += profile.duration_ms
+            totals['n_plus_one_calls'] += bool(n_plus_one)
+
+    def socket_event(self, name):
+        """Profile a Socket.IO handler like a request: @sql_profiler.socket_event('check_alarm')."""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                profile = QueryProfile(f'socket:{name}', session.get('company_id') if has_request_context() else None)
+                token = _active.set(_active.get() + (profile,))
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    _active.reset(token)
+                    self._store(profile)
+            return decorated_function
+        return decorator
+
+    @contextmanager
+    def query_budget(self, max_queries=None, max_duplicates=None, allow_n_plus_one=False, label='budget'):
+        """Fail the block if it runs more queries than allowed:
+
+            with sql_profiler.query_budget(max_queries=5):
+                client.get('/home')
+        """
+        self._attach()
+        profile = QueryProfile(label)
+        token = _active.set(_active.get() + (profile,))
+        try:
+            yield profile
+        finally:
+            _active.reset(token)
+
+        problems = []
+        if max_queries is not None and profile.count > max_queries:
+            problems.append(f'{profile.count} queries, budget {max_queries}')
+        duplicates = sum(n - 1 for n in profile.duplicates().values())
+        if max_duplicates is not None and duplicates > max_duplicates:
+            problems.append(f'{duplicates} repeated queries, budget {max_duplicates}')
+        if not allow_n_plus_one and profile.n_plus_one():
+            problems.append('N+1: ' + '; '.join(f'{n} x {fp}' for fp, n in profile.n_plus_one().items()))
+        if problems:
+            raise QueryBudgetExceeded(', '.join(problems))
+
+    def stats(self, company_id):
+        # Per-endpoint totals hold no request data; recent profiles only the company's own
+        with self._lock:
+            recent = [p for p in self.recent if p['company_id'] == company_id]
+            return {
+                'enabled': self.enabled,
+                'endpoints': {
+                    label: dict(totals, avg_queries=totals['queries'] / totals['calls'])
+                    for label, totals in sorted(self.endpoints.items())
+                },
+                'n_plus_one': [p for p in recent if p['n_plus_one']][-20:],
+                'recent': recent[-20:],
+            }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('sql_profiler_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiles = _active.get()
+    if not profiles:
+        return
+    started = conn.info.get('sql_profiler_started')
+    if not started:
+        return
+    duration_ms = (time.perf_counter() - started.pop()) * 1000
+    for profile in profiles:
+        profile.record(statement, duration_ms)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('sql_profiler_started'):
+        conn.info['sql_profiler_started'].pop()
+
+
+sql_profiler = SQLProfiler()
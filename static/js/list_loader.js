@@ -0,0 +1,48 @@
+// Incremental loading for the company list pages: server-side search, sorting and "load more".
+// The first page is rendered by the server; the next ones come from the same URL with ?format=json.
+function initListLoader({ listEl, renderItem, nextCursor, searchInput, sortSelect, moreButton }) {
+    const url = window.location.pathname;
+    let cursor = nextCursor;
+    let requestId = 0;
+    let searchTimer = null;
+
+    function updateMoreButton() {
+        moreButton.style.display = cursor ? '' : 'none';
+    }
+
+    async function load(reset) {
+        const currentRequest = ++requestId;
+        const params = new URLSearchParams({ format: 'json' });
+        if (searchInput && searchInput.value.trim()) params.set('q', searchInput.value.trim());
+        if (sortSelect) params.set('sort', sortSelect.value);
+        if (!reset && cursor) params.set('cursor', cursor);
+
+        moreButton.disabled = true;
+        try {
+            const response = await fetch(`${url}?${params}`);
+            const data = await response.json();
+            // A newer search or sort has started meanwhile
+            if (currentRequest !== requestId) return;
+            if (reset) listEl.innerHTML = '';
+            data.items.forEach(item => listEl.appendChild(renderItem(item)));
+            cursor = data.next_cursor;
+        } catch (err) {
+            alert('Помилка з’єднання з сервером');
+        } finally {
+            moreButton.disabled = false;
+            updateMoreButton();
+        }
+    }
+
+    moreButton.addEventListener('click', () => load(false));
+    if (searchInput) {
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => load(true), 300);
+        });
+    }
+    if (sortSelect) {
+        sortSelect.addEventListener('change', () => load(true));
+    }
+    updateMoreButton();
+}
@@ -0,0 +1,151 @@
+from sqlalchemy import bindparam, insert, update
+
+from extensions import db
+from dashboard import count_new_tasks
+from models import Employee, Task
+from product_tree import load_product_tree
+
+# Reassigning a task somebody is already working on would strand it
+REASSIGNABLE_STATUS = 'Не активне'
+
+
+def _conflict(index, row, reason, message):
+    return {'index': index, 'row': row, 'reason': reason, 'message': message}
+
+
+def plan_assignments(admin_task, rows):
+    """Validate an assignment plan against the admin task's product tree.
+
+    Returns (inserts, updates, unchanged, conflicts); nothing is written.
+    """
+    company_id = admin_task.company_id
+    tree = load_product_tree(admin_task.product_id, company_id)
+
+    valid_operations = set()
+    nodes = [tree] if tree else []
+    while nodes:
+        node = nodes.pop()
+        for op in node['operations']:
+            valid_operations.add((op['id'], node['type'], node['id']))
+        nodes.extend(node.get('blocks', []))
+        nodes.extend(node.get('details', []))
+
+    employee_ids = set()
+    for row in rows:
+        try:
+            employee_ids.add(int(row.get('employee_id')))
+        except (TypeError, ValueError):
+            pass
+    valid_employees = set()
+    if employee_ids:
+        valid_employees = {e.id for e in db.session.query(Employee.id).filter(
+            Employee.id.in_(employee_ids), Employee.company_id == company_id
+        ).all()}
+
+    existing = {
+        (t.operation_id, t.component_type, t.product_id): t
+        for t in Task.query.filter_by(admin_task_id=admin_task.id, company_id=company_id).all()
+    }
+
+    inserts, updates, unchanged, conflicts = [], [], [], []
+    seen = set()
+    for index, row in enumerate(rows):
+        try:
+            key = (int(row['operation_id']), row['component_type'], int(row['component_id']))
+            employee_id = int(row['employee_id'])
+        except (KeyError, TypeError, ValueError):
+            conflicts.append(_conflict(index, row, 'invalid', 'Некоректний рядок призначення'))
+            continue
+
+        if key in seen:
+            conflicts.append(_conflict(index, row, 'duplicate', 'Операцію вказано в плані кілька разів'))
+            continue
+        seen.add(key)
+
+        if key not in valid_operations:
+            conflicts.append(_conflict(index, row, 'unknown_operation', 'Операція не належить до цього виробу'))
+            continue
+        if employee_id not in valid_employees:
+            conflicts.append(_conflict(index, row, 'unknown_employee', 'Працівника не знайдено'))
+            continue
+
+        task = existing.get(key)
+        if task is None:
+            inserts.append({
+                'product_id': key[2],
+                'operation_id': key[0],
+                'responsible_id': employee_id,
+                'status': 'Не активне',
+                'company_id': company_id,
+                'component_type': key[1],
+                'admin_task_id': admin_task.id,
+            })
+        elif task.responsible_id == employee_id:
+            unchanged.append(task.id)
+        elif task.status != REASSIGNABLE_STATUS:
+            conflicts.append(_conflict(index, row, 'task_started',
+                                       f'Завдання вже має статус "{task.status}"'))
+        else:
+            updates.append({
+                'task_id': task.id,
+                'employee_id': employee_id,
+                'previous_employee_id': task.responsible_id,
+            })
+
+    return inserts, updates, unchanged, conflicts
+
+
+def bulk_assign(admin_task, rows, atomic=False):
+    """Create or reassign every Task of a plan in one transaction.
+
+    With atomic=True nothing is written if any row conflicts, including
+    tasks started while the plan was applied: the caller rolls back when
+    summary['conflicts'] is not empty. Returns the summary dict and the
+    employee ids whose assignments changed; the caller commits.
+    """
+    inserts, updates, unchanged, conflicts = plan_assignments(admin_task, rows)
+    summary = {
+        'created': 0,
+        'updated': 0,
+        'unchanged': len(unchanged),
+        'conflicts': conflicts,
+    }
+    if atomic and conflicts:
+        return summary, set()
+
+    if inserts:
+        db.session.execute(insert(Task), inserts)
+        count_new_tasks(admin_task.company_id, admin_task.id, len(inserts))
+    applied = []
+    if updates:
+        # Only tasks that are still not started are reassigned
+        result = db.session.execute(
+            update(Task.__table__).where(
+                Task.__table__.c.id == bindparam('task_id'),
+                Task.__table__.c.status == REASSIGNABLE_STATUS
+            ).values(responsible_id=bindparam('employee_id')),
+            [{'task_id': row['task_id'], 'employee_id': row['employee_id']} for row in updates]
+        )
+        if result.rowcount == len(updates):
+            applied = updates
+        else:
+            # Some tasks were started in the meantime (or the driver reports no
+            # rowcount for executemany): check which rows really changed
+            current = dict(db.session.query(Task.id, Task.responsible_id).filter(
+                Task.id.in_([row['task_id'] for row in updates])
+            ).all())
+            for row in updates:
+                if current.get(row['task_id']) == row['employee_id']:
+                    applied.append(row)
+                else:
+                    summary['conflicts'].append(_conflict(
+                        None, {'task_id': row['task_id'], 'employee_id': row['employee_id']},
+                        'task_started', 'Завдання було розпочато під час призначення'
+                    ))
+
+    summary['created'] = len(inserts)
+    summary['updated'] = len(applied)
+    touched = {row['responsible_id'] for row in inserts}
+    for row in applied:
+        touched.update((row['employee_id'], row['previous_employee_id']))
+    return summary, touched
@@ -0,0 +1,70 @@
+"""Benchmark of the search index: build time, memory and query latency.
+
+    python tests/bench_search.py --items 1000000
+
+Indexes --items synthetic names of three words out of --vocabulary random
+words plus a unique code, then times exact, prefix, one-typo, two-word
+and code queries. Lower --vocabulary to see how words shared by a large
+part of the index slow the queries down.
+
+Not collected by pytest; needs no database.
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import _CompanyIndex, _doc  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--items', type=int, default=1000000)
+    parser.add_argument('--vocabulary', type=int, default=5000, help='distinct words in the names')
+    parser.add_argument('--queries', type=int, default=200, help='queries of each kind')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = [''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(args.vocabulary)]
+
+    index = _CompanyIndex()
+    started = time.perf_counter()
+    for i in range(args.items):
+        name = f'{rng.choice(words)} {rng.choice(words)} {rng.choice(words)} N-{i}'
+        index.upsert(_doc('tool', i, name), name)
+    index.compact()
+    build = time.perf_counter() - started
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'Indexed {args.items} items, {len(index.postings)} tokens in {build:.1f}s, max RSS {rss:.0f} MiB')
+
+    kinds = {
+        'exact': lambda w: w,
+        'prefix': lambda w: w[:3],
+        'typo': lambda w: w[:2] + w[3:],
+        'two words': lambda w: f'{w} {rng.choice(words)[:3]}',
+        'code': lambda w: f'n{rng.randrange(args.items)}',
+    }
+    for kind, make in kinds.items():
+        timings = []
+        for _ in range(args.queries):
+            query = make(rng.choice(words))
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+        print(f'{kind:>9}: ' + ' '.join(f'p{p}={percentile(timings, p) * 1000:.2f}ms' for p in (50, 95, 99)) +
+              f' max={max(timings) * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
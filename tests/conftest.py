@@ -0,0 +1,143 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py reads its settings from a config.py next to it that is not in the
+# repository; the tests bring their own, pointing at a throwaway SQLite file.
+_settings_dir = tempfile.mkdtemp(prefix='virtfact-tests-')
+DATABASE_PATH = os.path.join(_settings_dir, 'test.db')
+with open(os.path.join(_settings_dir, 'config.py'), 'w') as f:
+    f.write(
+        f'SQLALCHEMY_DATABASE_URI = {"sqlite:///" + DATABASE_PATH!r}\n'
+        'SQLALCHEMY_TRACK_MODIFICATIONS = False\n'
+        "SECRET_KEY = 'test'\n"
+    )
+sys.path.insert(0, _settings_dir)
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Uploads and media go to static/uploads under the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from alarm_cache import alarm_index
+    from blocking_tasks import blocking_task_cache
+    from extensions import db
+    from resource_usage import demand_reports
+    from search_index import search_index
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    alarm_index.clear()
+    blocking_task_cache.clear()
+    search_index.clear()
+    demand_reports.clear()
+    yield db
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def company(app, db):
+    """A company with an admin, an employee, one product tree and a task per operation."""
+    from dashboard import rebuild_status_summary
+    from models import (Account, Block, Company, Detail, Employee, Location, LocationO, Material, MaterialO,
+                        Operation, Product, Task, Tool, ToolO, aTask)
+
+    with app.app_context():
+        c = Company('Test')
+        db.session.add(c)
+        db.session.commit()
+        employee = Employee('Іван', 'Петренко', 'Майстер', '555', None, c.id)
+        db.session.add_all([employee, Account('admin', 'pw', True, c.id), Account('555', 'pw', False, c.id)])
+        product = Product('Виріб', c.id)
+        db.session.add(product)
+        db.session.commit()
+        block = Block('Блок', product.id)
+        db.session.add(block)
+        db.session.commit()
+        detail = Detail('Деталь', block.id)
+        tool, material, location = Tool('Ключ', c.id), Material('Сталь', c.id), Location('Цех', c.id)
+        db.session.add_all([detail, tool, material, location])
+        db.session.commit()
+
+        operations = []
+        for component_type, component_id in (('product', product.id), ('block', block.id), ('detail', detail.id)):
+            operation = Operation(f'op-{component_type}', component_id, component_type)
+            db.session.add(operation)
+            db.session.commit()
+            db.session.add_all([ToolO(tool.id, operation.id), MaterialO(material.id, operation.id),
+                                LocationO(location.id, operation.id)])
+            operations.append(operation)
+        admin_task = aTask(product.id, c.id)
+        db.session.add(admin_task)
+        db.session.commit()
+        tasks = [Task(o.component_id, o.id, employee.id, 'Не активне', c.id, o.product_type, admin_task.id)
+                 for o in operations]
+        db.session.add_all(tasks)
+        db.session.commit()
+        rebuild_status_summary()
+        db.session.commit()
+
+        return {
+            'company_id': c.id,
+            'employee_id': employee.id,
+            'product_id': product.id,
+            'block_id': block.id,
+            'detail_id': detail.id,
+            'tool_id': tool.id,
+            'material_id': material.id,
+            'location_id': location.id,
+            'admin_task_id': admin_task.id,
+            'operation_ids': [o.id for o in operations],
+            'task_ids': [t.id for t in tasks],
+        }
+
+
+def login(app, username, password='pw'):
+    client = app.test_client()
+    response = client.post('/', data={'login': username, 'password': password})
+    assert response.status_code == 302, response.data
+    return client
+
+
+@pytest.fixture
+def admin_client(app, company):
+    return login(app, 'admin')
+
+
+@pytest.fixture
+def employee_client(app, company):
+    return login(app, '555')
+
+
+@pytest.fixture
+def other_admin_client(app, company):
+    """The admin of a second company."""
+    from models import Account, Company
+
+    with app.app_context():
+        from extensions import db
+        other = Company('Інша')
+        db.session.add(other)
+        db.session.commit()
+        db.session.add(Account('other', 'pw', True, other.id))
+        db.session.commit()
+    return login(app, 'other')
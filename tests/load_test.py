@@ -0,0 +1,214 @@
+"""Load test for a running server: HTTP throughput and alarm fan-out latency.
+
+    python tests/load_test.py --url http://127.0.0.1:5000 --task-id 3
+
+HTTP threads, logged in as the admin, request --paths for --duration
+seconds. Meanwhile --clients Socket.IO websockets join the company room,
+and an alarm on --task-id is raised and cleared --alarms times. Every
+round measures how long it takes until every client got 'alarm_status'.
+Run it against the server with WEB_CONCURRENCY=1, 2, 4... to see how
+both scale with the workers. The task must not be in Alarm when the
+test starts. With --http-threads 500 and a long --duration it is a soak
+test of the connection pool: /db_pool_stats before and after tells how
+many connections were opened and whether checkouts timed out (counted
+per worker, in whichever worker answered).
+
+Not collected by pytest; needs only the packages in requirements.txt.
+"""
+import argparse
+import http.cookiejar
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import simple_websocket
+
+
+def login(url, username, password):
+    """An opener with the session cookie of the account, and that cookie as a header."""
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+    data = urllib.parse.urlencode({'login': username, 'password': password}).encode()
+    response = opener.open(f'{url}/', data=data, timeout=10)
+    response.read()
+    # A failed login redirects back to the login page
+    if urllib.parse.urlsplit(response.geturl()).path == '/':
+        raise SystemExit(f'Login as {username} failed')
+    return opener, '; '.join(f'{cookie.name}={cookie.value}' for cookie in cookies)
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def describe(values):
+    return ' '.join(f'p{p}={percentile(values, p) * 1000:.1f}ms' for p in (50, 95, 99)) + \
+        (f' max={max(values) * 1000:.1f}ms' if values else '')
+
+
+class SocketClient:
+    """One Socket.IO connection over a raw websocket, speaking Engine.IO v4 frames."""
+
+    def __init__(self, url, cookie, timeout):
+        ws_url = url.replace('http', 'ws', 1) + '/socket.io/?EIO=4&transport=websocket'
+        self.ws = simple_websocket.Client.connect(ws_url, headers={'Cookie': cookie})
+        self.events = queue.Queue()
+        self.closed = False
+        open_packet = self.ws.receive(timeout=timeout)
+        if not open_packet or not open_packet.startswith('0'):
+            raise RuntimeError(f'Unexpected Engine.IO open packet: {open_packet!r}')
+        self.ws.send('40')
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.closed:
+            try:
+                packet = self.ws.receive(timeout=1)
+            except simple_websocket.ConnectionClosed:
+                break
+            if packet is None:
+                continue
+            received = time.perf_counter()
+            if packet == '2':
+                self.ws.send('3')  # Engine.IO pong
+            elif packet.startswith('42'):
+                event, *args = json.loads(packet[2:])
+                self.events.put((received, event, args[0] if args else None))
+            elif packet.startswith('44'):
+                self.events.put((received, 'connect_error', packet[2:]))
+
+    def wait_for(self, event, match, timeout):
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            try:
+                received, name, data = self.events.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if name == event and match(data):
+                return received
+
+    def close(self):
+        self.closed = True
+        self.ws.close()
+
+
+def pool_stats(url, opener):
+    with opener.open(f'{url}/db_pool_stats', timeout=30) as response:
+        return json.loads(response.read())
+
+
+def describe_pool(before, after):
+    lines = [f'DB pool: {after["requests"] - before["requests"]} requests, '
+             f'{after["timeouts"] - before["timeouts"]} checkout timeouts, '
+             f'max {after["max_checkouts_per_request"]} checkouts per request']
+    for name, engine in after['engines'].items():
+        previous = before['engines'].get(name, {})
+        lines.append(f'  {name}: {engine["connects"] - previous.get("connects", 0)} connects, '
+                     f'{engine["invalidated"] - previous.get("invalidated", 0)} invalidated, '
+                     f'{engine["checkouts"] - previous.get("checkouts", 0)} checkouts, '
+                     f'{engine["checked_out"]} still checked out')
+    return '\n'.join(lines)
+
+
+def http_load(url, username, password, paths, deadline, latencies, errors, lock):
+    opener, _ = login(url, username, password)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            opener.open(f'{url}{path}', timeout=30).read()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+        except (urllib.error.URLError, OSError) as exc:
+            with lock:
+                errors.append(f'{path}: {exc}')
+
+
+def alarm_rounds(url, opener, task_id, clients, rounds, timeout, fanout, missed):
+    for _ in range(rounds):
+        for active, path, method in ((True, f'/submit_alarm/{task_id}', 'POST'),
+                                     (False, f'/delete_alarm/{task_id}', 'GET')):
+            data = urllib.parse.urlencode({'operationName': 'load test'}).encode() if method == 'POST' else None
+            started = time.perf_counter()
+            opener.open(f'{url}{path}', data=data, timeout=30).read()
+            for client in clients:
+                received = client.wait_for(
+                    'alarm_status',
+                    lambda d: d and d.get('task_id') == task_id and d.get('active') == active,
+                    timeout
+                )
+                if received is None:
+                    missed.append(active)
+                else:
+                    fanout.append(received - started)
+        time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--login', default='admin:pw', help='admin account, login:password')
+    parser.add_argument('--task-id', type=int, required=True, help='task to raise and clear alarms on')
+    parser.add_argument('--paths', default='/home,/task_product_list,/edit_tools_list')
+    parser.add_argument('--http-threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=50, help='Socket.IO connections')
+    parser.add_argument('--alarms', type=int, default=10, help='alarm raise/clear rounds')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of HTTP load')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds to wait for a broadcast')
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    username, password = args.login.split(':', 1)
+    opener, cookie = login(url, username, password)
+
+    pool_before = pool_stats(url, opener)
+    clients = [SocketClient(url, cookie, args.timeout) for _ in range(args.clients)]
+    for client in clients:
+        # The state sent on connect tells that the client joined the company room
+        if client.wait_for('alarm_status', lambda d: True, args.timeout) is None:
+            raise SystemExit('A Socket.IO client was not accepted')
+
+    lock = threading.Lock()
+    latencies, errors, fanout, missed = [], [], [], []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=http_load, args=(url, username, password, args.paths.split(','),
+                                                 deadline, latencies, errors, lock))
+        for _ in range(args.http_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    alarm_rounds(url, opener, args.task_id, clients, args.alarms, args.timeout, fanout, missed)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.close()
+
+    print(f'HTTP: {len(latencies)} requests in {elapsed:.1f}s = {len(latencies) / elapsed:.1f} req/s, '
+          f'{len(errors)} errors')
+    print(f'HTTP latency: {describe(latencies)}')
+    print(f'Alarm fan-out to {len(clients)} clients: {describe(fanout)}, '
+          f'{len(missed)} of {len(fanout) + len(missed)} broadcasts missed')
+    print(describe_pool(pool_before, pool_stats(url, opener)))
+    for error in errors[:10]:
+        print(f'  {error}')
+
+
+if __name__ == '__main__':
+    main()
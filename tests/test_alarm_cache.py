@@ -0,0 +1,114 @@
+import threading
+
+from tests.conftest import login
+
+THREADS = 8
+ROUNDS = 10
+
+
+def _add_tasks(app, db, company, count):
+    from dashboard import rebuild_status_summary
+    from models import Task
+
+    with app.app_context():
+        operation_id = company['operation_ids'][0]
+        tasks = [Task(company['product_id'], operation_id, company['employee_id'], 'У роботі',
+                      company['company_id'], 'product', company['admin_task_id']) for _ in range(count)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        rebuild_status_summary()
+        db.session.commit()
+        return [t.id for t in tasks]
+
+
+def test_alarm_index_consistent_under_concurrent_submit_and_clear(app, db, company):
+    from alarm_cache import alarm_index
+    from dashboard import check_status_summary
+    from models import Task
+
+    task_ids = _add_tasks(app, db, company, THREADS)
+    company_id = company['company_id']
+    # Load the company before the writers start, so every change goes through the write-through path
+    with app.app_context():
+        assert alarm_index.task_ids(company_id) == set()
+    errors = []
+    stop = threading.Event()
+
+    def writer(task_id, leave_alarm):
+        try:
+            client = login(app, '555')
+            for _ in range(ROUNDS):
+                assert client.post(f'/submit_alarm/{task_id}', data={'operationName': 'Зламався'}).status_code == 302
+                assert client.get(f'/delete_alarm/{task_id}').status_code == 302
+            if leave_alarm:
+                assert client.post(f'/submit_alarm/{task_id}', data={'operationName': 'Зламався'}).status_code == 302
+        except BaseException as exc:
+            errors.append(exc)
+
+    def reader():
+        with app.app_context():
+            while not stop.is_set():
+                alarm_index.has_alarms(company_id)
+
+    threads = [threading.Thread(target=writer, args=(task_id, i % 2 == 0)) for i, task_id in enumerate(task_ids)]
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads + readers:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert not errors, errors
+
+    expected = set(task_ids[::2])
+    with app.app_context():
+        in_db = {task_id for (task_id,) in db.session.query(Task.id).filter_by(company_id=company_id, status='Alarm')}
+        assert in_db == expected
+        assert alarm_index.task_ids(company_id) == expected
+        assert check_status_summary() == []
+
+        # Reading the company again from the database finds nothing the index missed
+        alarm_index.reconcile(company_id)
+        assert alarm_index.stats(company_id)['last_drift'] == 0
+        assert alarm_index.task_ids(company_id) == expected
+
+
+def test_alarm_index_follows_routes(app, db, company, employee_client, admin_client):
+    from alarm_cache import alarm_index
+
+    task_id = company['task_ids'][2]
+    company_id = company['company_id']
+    with app.app_context():
+        assert not alarm_index.has_alarms(company_id)
+
+        employee_client.get(f'/start_task/{task_id}')
+        employee_client.post(f'/submit_alarm/{task_id}', data={'operationName': 'Зламався'})
+        assert alarm_index.task_ids(company_id) == {task_id}
+
+        admin_client.get(f'/delete_alarm/{task_id}')
+        assert not alarm_index.has_alarms(company_id)
+    assert admin_client.get('/alarm_cache_stats').get_json()['active_alarms'] == 0
+    assert employee_client.get('/alarm_cache_stats').status_code == 403
+
+
+def test_deleting_admin_task_clears_its_alarms(app, db, company, employee_client, admin_client):
+    from alarm_cache import alarm_index
+    from app import socketio
+
+    task_id = company['task_ids'][2]
+    company_id = company['company_id']
+    employee_client.get(f'/start_task/{task_id}')
+    employee_client.post(f'/submit_alarm/{task_id}', data={'operationName': 'Зламався'})
+    with app.app_context():
+        assert alarm_index.task_ids(company_id) == {task_id}
+
+    listener = socketio.test_client(app, flask_test_client=admin_client)
+    listener.get_received()
+    assert admin_client.post(f'/delete_admin_task/{company["admin_task_id"]}').status_code == 302
+
+    with app.app_context():
+        assert not alarm_index.has_alarms(company_id)
+    alarm_events = [e['args'][0] for e in listener.get_received() if e['name'] == 'alarm_status']
+    assert {'alarm': False, 'task_id': task_id, 'active': False} in alarm_events
+    listener.disconnect()
@@ -0,0 +1,142 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import (BUCKET_BASE, bucket_for, bucket_value, duration_stats, percentiles, rebuild_rollups,
+                       record_finished_task, shift_start, throughput_by_shift)
+from models import DurationHistogram, ShiftThroughput, Task
+from tests.test_indexes import query_plan
+
+# Half a bucket on the log scale: the most a bucket's middle is off its values
+BUCKET_ERROR = BUCKET_BASE ** 0.5 - 1
+
+
+def test_buckets_are_geometric():
+    assert bucket_for(0) == bucket_for(0.99) == 0
+    assert bucket_for(1) == 1
+    assert bucket_value(0) == 0.0
+    previous = 0
+    for seconds in (1, 1.2, 2, 10, 59, 60, 3600, 8 * 3600, 30 * 86400):
+        bucket = bucket_for(seconds)
+        assert bucket >= previous
+        previous = bucket
+        assert abs(bucket_value(bucket) / seconds - 1) <= BUCKET_ERROR + 1e-9, seconds
+    # Every bucket is 2^(1/4) times wider than the one before
+    assert bucket_for(2 * 3600) - bucket_for(3600) == 4
+
+
+def test_percentiles_match_the_exact_ones_within_a_bucket():
+    rng = random.Random(1)
+    samples = [rng.lognormvariate(math.log(1800), 0.8) for _ in range(5000)]
+    counts = {}
+    for seconds in samples:
+        counts[bucket_for(seconds)] = counts.get(bucket_for(seconds), 0) + 1
+
+    result = percentiles(sorted(counts.items()))
+    samples.sort()
+    for q, estimate in result.items():
+        exact = samples[math.ceil(q * len(samples)) - 1]
+        assert abs(estimate / exact - 1) <= BUCKET_ERROR + 1e-9, (q, estimate, exact)
+
+
+def test_percentiles_of_few_samples():
+    assert percentiles([]) == {0.5: None, 0.9: None, 0.99: None}
+    only = bucket_for(600)
+    assert percentiles([(only, 1)]) == {q: bucket_value(only) for q in (0.5, 0.9, 0.99)}
+    # 9 fast tasks and 1 slow one: the slow one is p99 but not p50 or p90
+    fast, slow = bucket_for(60), bucket_for(3600)
+    result = percentiles([(fast, 9), (slow, 1)])
+    assert result == {0.5: bucket_value(fast), 0.9: bucket_value(fast), 0.99: bucket_value(slow)}
+
+
+@pytest.mark.parametrize('moment, start', [
+    (datetime(2026, 10, 18, 5, 59), datetime(2026, 10, 17, 22, 0)),
+    (datetime(2026, 10, 18, 6, 0), datetime(2026, 10, 18, 6, 0)),
+    (datetime(2026, 10, 18, 13, 59, 59), datetime(2026, 10, 18, 6, 0)),
+    (datetime(2026, 10, 18, 14, 0), datetime(2026, 10, 18, 14, 0)),
+    (datetime(2026, 10, 18, 23, 30), datetime(2026, 10, 18, 22, 0)),
+    (datetime(2026, 10, 18, 0, 0), datetime(2026, 10, 17, 22, 0)),
+])
+def test_shift_start(moment, start):
+    assert shift_start(moment) == start
+
+
+def _finish(app, db, company, durations, end=datetime(2026, 10, 18, 10, 0)):
+    """Finished tasks of the first operation with the given durations in seconds."""
+    with app.app_context():
+        for seconds in durations:
+            task = Task(company['product_id'], company['operation_ids'][0], company['employee_id'], 'Завершене',
+                        company['company_id'], 'product', company['admin_task_id'])
+            task.start_time, task.end_time = end - timedelta(seconds=seconds), end
+            db.session.add(task)
+            db.session.flush()
+            record_finished_task(task)
+        db.session.commit()
+
+
+def _rollups(company_id):
+    histograms = {(h.dimension, h.key_id, h.bucket): (h.count, round(h.total_seconds, 6))
+                  for h in DurationHistogram.query.filter_by(company_id=company_id)}
+    shifts = {s.shift_start: (s.completed, round(s.total_seconds, 6))
+              for s in ShiftThroughput.query.filter_by(company_id=company_id)}
+    return histograms, shifts
+
+
+def test_incremental_rollups_match_a_rebuild(app, db, company):
+    _finish(app, db, company, [60, 90, 600, 3600, 0.5])
+    _finish(app, db, company, [120], end=datetime(2026, 10, 18, 15, 0))
+    with app.app_context():
+        incremental = _rollups(company['company_id'])
+        assert rebuild_rollups(company['company_id']) == 6
+        db.session.commit()
+        assert _rollups(company['company_id']) == incremental
+
+        (stats,) = duration_stats(company['company_id'], 'operation')
+        assert stats['id'] == company['operation_ids'][0]
+        assert stats['count'] == 6
+        assert stats['mean_seconds'] == pytest.approx((60 + 90 + 600 + 3600 + 0.5 + 120) / 6)
+        assert stats['p99_seconds'] == bucket_value(bucket_for(3600))
+        assert [s['count'] for s in duration_stats(company['company_id'], 'employee')] == [6]
+
+        shifts = throughput_by_shift(company['company_id'], datetime(2026, 10, 18))
+        assert [(s['shift'], s['completed']) for s in shifts] == [(1, 5), (2, 1)]
+
+
+def test_finish_task_updates_the_rollups(app, db, company, admin_client, employee_client):
+    task_id = company['task_ids'][0]
+    employee_client.get(f'/start_task/{task_id}')
+    employee_client.get(f'/finish_task/{task_id}')
+
+    items = admin_client.get('/analytics/durations?dimension=product').get_json()['items']
+    assert [(i['id'], i['count']) for i in items] == [(company['product_id'], 1)]
+    assert admin_client.get('/analytics/durations?dimension=nope').status_code == 400
+    assert sum(s['completed'] for s in admin_client.get('/analytics/throughput').get_json()['shifts']) == 1
+    wip = admin_client.get('/analytics/wip').get_json()
+    assert wip['by_status']['Не активне']['tasks'] == 2
+    assert wip['total'] == 2
+
+
+ROLLUP_QUERIES = {
+    'durations of a dimension': lambda db: DurationHistogram.query.filter(
+        DurationHistogram.company_id == 1, DurationHistogram.dimension == 'operation'
+    ).order_by(DurationHistogram.key_id, DurationHistogram.bucket),
+    'durations of one key': lambda db: DurationHistogram.query.filter_by(
+        company_id=1, dimension='employee', key_id=1),
+    'throughput since a day': lambda db: ShiftThroughput.query.filter(
+        ShiftThroughput.company_id == 1, ShiftThroughput.shift_start >= datetime(2026, 10, 1)
+    ).order_by(ShiftThroughput.shift_start),
+    'work in progress': lambda db: db.session.query(Task.status).filter(
+        Task.company_id == 1, Task.status.in_(('Не активне', 'У роботі', 'Alarm'))),
+}
+
+
+@pytest.mark.parametrize('name', ROLLUP_QUERIES)
+def test_analytics_queries_use_an_index(app, db, name):
+    with app.app_context():
+        plan = query_plan(db, ROLLUP_QUERIES[name](db))
+    scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+    assert not scans, f'{name}: {plan}'
+    # Sorted by the index itself, not afterwards
+    assert not any('TEMP B-TREE' in step for step in plan), f'{name}: {plan}'
@@ -0,0 +1,160 @@
+import pytest
+
+import blocking_tasks
+from blocking_tasks import BlockingTaskCache, blocking_task_cache
+from models import Task
+from socket_queue import cache_sync
+from tests.test_bulk_assign import _second_employee
+
+ALARM = {'task_id': 1, 'status': 'Alarm', 'alarm_id': 7}
+IN_PROGRESS = {'task_id': 2, 'status': 'У роботі', 'alarm_id': None}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Replaces the query: answers[employee_id] is returned, each call is recorded."""
+    calls = []
+    answers = {}
+
+    def find(employee_id):
+        calls.append(employee_id)
+        during = answers.get(('during', employee_id))
+        if during:
+            during()
+        return answers.get(employee_id)
+
+    monkeypatch.setattr(blocking_tasks, 'find_blocking_task', find)
+    find.calls, find.answers = calls, answers
+    return find
+
+
+def test_get_caches_until_invalidated(lookups):
+    cache = BlockingTaskCache()
+    lookups.answers[1] = IN_PROGRESS
+    assert cache.get(1) == IN_PROGRESS
+    assert cache.get(1) == IN_PROGRESS
+    # "No blocking task" is cached too
+    assert cache.get(2) is None
+    assert cache.get(2) is None
+    assert lookups.calls == [1, 2]
+
+    lookups.answers[1] = ALARM
+    cache.invalidate(1, None, '2')
+    assert cache.get(1) == ALARM
+    assert cache.get(2) is None
+    assert lookups.calls == [1, 2, 1, 2]
+
+
+def test_entries_expire_after_ttl(lookups, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(blocking_tasks, 'time', clock)
+    cache = BlockingTaskCache(ttl=30)
+    cache.get(1)
+    clock.now += 29
+    cache.get(1)
+    assert lookups.calls == [1]
+    clock.now += 1
+    cache.get(1)
+    assert lookups.calls == [1, 1]
+
+
+def test_invalidation_during_the_query_is_not_overwritten(lookups):
+    cache = BlockingTaskCache()
+    # The task status changes and the route invalidates while the query still runs:
+    # its result is already stale and must not be stored
+    lookups.answers[1] = IN_PROGRESS
+    lookups.answers[('during', 1)] = lambda: cache.invalidate(1)
+    assert cache.get(1) == IN_PROGRESS
+
+    del lookups.answers[('during', 1)]
+    lookups.answers[1] = None
+    assert cache.get(1) is None
+    assert cache.get(1) is None
+    assert lookups.calls == [1, 1]
+
+
+def test_invalidating_another_employee_does_not_stop_the_store(lookups):
+    cache = BlockingTaskCache()
+    lookups.answers[('during', 1)] = lambda: cache.invalidate(2)
+    cache.get(1)
+    cache.get(1)
+    assert lookups.calls == [1]
+
+
+def test_clear_during_the_query_is_not_overwritten(lookups):
+    cache = BlockingTaskCache()
+    lookups.answers[1] = IN_PROGRESS
+    lookups.answers[('during', 1)] = cache.clear
+    cache.get(1)
+    del lookups.answers[('during', 1)]
+    cache.get(1)
+    cache.get(1)
+    assert lookups.calls == [1, 1]
+
+
+def test_published_invalidations_apply_to_the_shared_cache(lookups):
+    blocking_task_cache.clear()
+    lookups.answers[1] = lookups.answers[2] = IN_PROGRESS
+    blocking_task_cache.get(1)
+    blocking_task_cache.get(2)
+
+    # Another worker changed the task of employee 1
+    cache_sync.receive('blocking_tasks', {'employee_ids': [1]})
+    blocking_task_cache.get(1)
+    blocking_task_cache.get(2)
+    assert lookups.calls == [1, 2, 1]
+
+    # ...or deleted an admin task
+    cache_sync.receive('blocking_tasks', {'employee_ids': None})
+    blocking_task_cache.get(1)
+    blocking_task_cache.get(2)
+    assert lookups.calls == [1, 2, 1, 1, 2]
+
+
+def _home(client):
+    response = client.get('/home_for_employee')
+    return response.status_code, response.headers.get('Location')
+
+
+def test_status_routes_invalidate_the_redirect(app, db, company, employee_client):
+    task_id = company['task_ids'][0]
+    assert _home(employee_client) == (200, None)
+
+    employee_client.get(f'/start_task/{task_id}')
+    status, location = _home(employee_client)
+    assert status == 302 and location.endswith(f'/instruction_page?task_id={task_id}')
+
+    employee_client.post(f'/submit_alarm/{task_id}', data={'operationName': 'Зламався ключ'})
+    status, location = _home(employee_client)
+    assert status == 302 and location.startswith('/alarm?') and f'task_id={task_id}' in location
+
+    employee_client.get(f'/delete_alarm/{task_id}')
+    status, location = _home(employee_client)
+    assert status == 302 and location.endswith(f'/instruction_page?task_id={task_id}')
+
+    employee_client.get(f'/finish_task/{task_id}')
+    assert _home(employee_client) == (200, None)
+
+
+def test_reassigning_invalidates_both_employees(app, db, company, admin_client, employee_client):
+    other_id = _second_employee(app, db, company)
+    assert _home(employee_client) == (200, None)
+    with app.app_context():
+        blocking_task_cache.get(other_id)
+        task = db.session.get(Task, company['task_ids'][0])
+        row = {'operation_id': task.operation_id, 'component_type': task.component_type,
+               'component_id': task.product_id, 'employee_id': other_id}
+    assert set(blocking_task_cache._entries) == {company['employee_id'], other_id}
+
+    response = admin_client.post('/bulk_assign_tasks', json={'admin_task': company['admin_task_id'],
+                                                             'assignments': [row]})
+    assert response.get_json()['updated'] == 1
+    assert not blocking_task_cache._entries
@@ -0,0 +1,174 @@
+import itertools
+
+from models import Detail, Employee, Operation, Task, aTask
+from sql_profiler import sql_profiler
+
+_names = itertools.count(1)
+
+
+def _add_details(app, db, company, count):
+    """`count` more details with one operation each; returns their assignment rows."""
+    with app.app_context():
+        details = [Detail(f'Деталь {n}', company['block_id']) for n in itertools.islice(_names, count)]
+        db.session.add_all(details)
+        db.session.flush()
+        operations = [Operation(f'Операція {d.name}', d.id, 'detail') for d in details]
+        db.session.add_all(operations)
+        db.session.commit()
+        return [{'operation_id': o.id, 'component_type': 'detail', 'component_id': o.component_id,
+                 'employee_id': company['employee_id']} for o in operations]
+
+
+def _new_admin_task(app, db, company):
+    with app.app_context():
+        admin_task = aTask(company['product_id'], company['company_id'])
+        db.session.add(admin_task)
+        db.session.commit()
+        return admin_task.id
+
+
+def _second_employee(app, db, company):
+    with app.app_context():
+        employee = Employee('Петро', 'Іваненко', 'Слюсар', '556', None, company['company_id'])
+        db.session.add(employee)
+        db.session.commit()
+        return employee.id
+
+
+def _fixture_rows(company, employee_id):
+    return [
+        {'operation_id': operation_id, 'component_type': component_type, 'component_id': component_id,
+         'employee_id': employee_id}
+        for operation_id, component_type, component_id in zip(
+            company['operation_ids'], ('product', 'block', 'detail'),
+            (company['product_id'], company['block_id'], company['detail_id']))
+    ]
+
+
+def _assign(client, admin_task_id, rows, **extra):
+    return client.post('/bulk_assign_tasks', json=dict(extra, admin_task=admin_task_id, assignments=rows))
+
+
+def _queries(app, f, allow_n_plus_one=False):
+    with app.app_context():
+        with sql_profiler.query_budget(allow_n_plus_one=allow_n_plus_one) as profile:
+            f()
+        return profile.count
+
+
+def test_bulk_assign_query_count_does_not_grow_with_the_plan(app, db, company, admin_client):
+    from dashboard import check_status_summary
+
+    counts = []
+    for count in (2, 40):
+        admin_task_id = _new_admin_task(app, db, company)
+        rows = _add_details(app, db, company, count)
+        counts.append(_queries(app, lambda: _assign(admin_client, admin_task_id, rows)))
+    assert counts[0] == counts[1], counts
+
+    # The same plan one task per request is an N+1
+    admin_task_id = _new_admin_task(app, db, company)
+    rows = _add_details(app, db, company, 10)
+    one_by_one = _queries(app, allow_n_plus_one=True, f=lambda: [admin_client.post('/create_task', json={
+        'operation_id': row['operation_id'], 'employee_id': row['employee_id'],
+        'component_id': row['component_id'], 'component_type': row['component_type'], 'admin_task': admin_task_id,
+    }) for row in rows])
+    assert one_by_one >= 2 * len(rows) > counts[1]
+
+    with app.app_context():
+        assert check_status_summary() == []
+
+
+def test_created_updated_and_unchanged(app, db, company, admin_client):
+    other_id = _second_employee(app, db, company)
+    new_rows = _add_details(app, db, company, 2)
+    rows = _fixture_rows(company, company['employee_id'])
+    rows[1]['employee_id'] = other_id
+
+    response = _assign(admin_client, company['admin_task_id'], rows + new_rows)
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert (summary['created'], summary['updated'], summary['unchanged'], summary['conflicts']) == (2, 1, 2, [])
+
+    with app.app_context():
+        assert Task.query.get(company['task_ids'][1]).responsible_id == other_id
+        assert Task.query.filter_by(admin_task_id=company['admin_task_id']).count() == 5
+
+    # Applying the same plan again changes nothing
+    summary = _assign(admin_client, company['admin_task_id'], rows + new_rows).get_json()
+    assert (summary['created'], summary['updated'], summary['unchanged']) == (0, 0, 5)
+
+
+def test_conflicts_are_reported_per_row(app, db, company, admin_client, employee_client):
+    other_id = _second_employee(app, db, company)
+    employee_client.get(f'/start_task/{company["task_ids"][0]}')
+    rows = _fixture_rows(company, other_id)
+    rows += [
+        dict(rows[2]),
+        dict(rows[2], operation_id=999999),
+        dict(_add_details(app, db, company, 1)[0], employee_id=999999),
+        {'operation_id': 'x'},
+    ]
+
+    summary = _assign(admin_client, company['admin_task_id'], rows).get_json()
+    assert summary['updated'] == 2
+    assert [(c['index'], c['reason']) for c in summary['conflicts']] == [
+        (0, 'task_started'), (3, 'duplicate'), (4, 'unknown_operation'), (5, 'unknown_employee'), (6, 'invalid'),
+    ]
+    with app.app_context():
+        assert Task.query.get(company['task_ids'][0]).responsible_id == company['employee_id']
+
+
+def test_atomic_plan_with_a_conflict_writes_nothing(app, db, company, admin_client, employee_client):
+    from dashboard import check_status_summary
+
+    other_id = _second_employee(app, db, company)
+    employee_client.get(f'/start_task/{company["task_ids"][0]}')
+    rows = _fixture_rows(company, other_id) + _add_details(app, db, company, 2)
+
+    response = _assign(admin_client, company['admin_task_id'], rows, atomic=True)
+    assert response.status_code == 409
+    summary = response.get_json()
+    assert (summary['created'], summary['updated']) == (0, 0)
+    assert [c['reason'] for c in summary['conflicts']] == ['task_started']
+
+    with app.app_context():
+        assert Task.query.filter_by(admin_task_id=company['admin_task_id']).count() == 3
+        assert Task.query.filter_by(responsible_id=other_id).count() == 0
+        assert check_status_summary() == []
+
+
+def test_task_started_while_the_plan_is_applied(app, db, company, admin_client, monkeypatch):
+    import task_assignment
+
+    other_id = _second_employee(app, db, company)
+    first, second, third = company['task_ids']
+    started = [third]
+    plan_assignments = task_assignment.plan_assignments
+
+    def plan_then_start(admin_task, rows):
+        planned = plan_assignments(admin_task, rows)
+        # The employee starts a task between the plan and the update
+        db.session.execute(Task.__table__.update().where(Task.__table__.c.id == started[0]).values(status='У роботі'))
+        return planned
+
+    monkeypatch.setattr(task_assignment, 'plan_assignments', plan_then_start)
+    summary = _assign(admin_client, company['admin_task_id'], _fixture_rows(company, other_id)).get_json()
+    assert summary['updated'] == 2
+    assert [(c['row']['task_id'], c['reason']) for c in summary['conflicts']] == [(third, 'task_started')]
+
+    started[0] = first
+    response = _assign(admin_client, company['admin_task_id'], _fixture_rows(company, company['employee_id']),
+                       atomic=True)
+    assert response.status_code == 409
+    assert [(c['row']['task_id'], c['reason']) for c in response.get_json()['conflicts']] == [(first, 'task_started')]
+    with app.app_context():
+        # Rolled back: the other reassignment and the start of the task as well
+        assert Task.query.get(second).responsible_id == other_id
+        assert Task.query.get(first).status == 'Не активне'
+
+
+def test_other_company_cannot_assign(app, db, company, other_admin_client):
+    response = _assign(other_admin_client, company['admin_task_id'], _fixture_rows(company, company['employee_id']))
+    assert response.status_code == 404
+    assert _assign(other_admin_client, company['admin_task_id'], None).status_code == 400
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from models import InstructionFile, MediaBlob, MediaUpload
+
+CHUNK = 256 * 1024
+
+
+def _create(client, company, data, **extra):
+    body = dict(operation_id=company['operation_ids'][0], category='text', filename='steps.txt',
+                size=len(data), sha256=hashlib.sha256(data).hexdigest())
+    body.update(extra)
+    return client.post('/media_uploads', json=body)
+
+
+def _put(client, upload_id, data, offset, total, sha=None):
+    headers = {'Content-Range': f'bytes {offset}-{offset + len(data) - 1}/{total}'}
+    if sha:
+        headers['X-Chunk-Sha256'] = sha
+    return client.put(f'/media_uploads/{upload_id}', data=data, headers=headers,
+                      content_type='application/octet-stream')
+
+
+def _upload(client, upload_id, data, chunk=CHUNK):
+    for offset in range(0, len(data), chunk):
+        response = _put(client, upload_id, data[offset:offset + chunk], offset, len(data))
+        assert response.status_code == 200, response.get_json()
+
+
+def test_resumable_upload(app, db, company, admin_client):
+    data = os.urandom(3 * CHUNK + 100)
+    upload_id = _create(admin_client, company, data).get_json()['upload_id']
+
+    assert _put(admin_client, upload_id, data[:CHUNK], 0, len(data)).get_json()['received'] == CHUNK
+    # A chunk after a gap is refused, with the offset to resume from
+    response = _put(admin_client, upload_id, data[2 * CHUNK:3 * CHUNK], 2 * CHUNK, len(data))
+    assert response.status_code == 409
+    assert response.get_json()['received'] == CHUNK
+    assert admin_client.get(f'/media_uploads/{upload_id}').get_json()['received'] == CHUNK
+    # Completing too early says the same
+    response = admin_client.post(f'/media_uploads/{upload_id}/complete')
+    assert response.status_code == 409
+    assert response.get_json()['received'] == CHUNK
+
+    for offset in range(CHUNK, len(data), CHUNK):
+        assert _put(admin_client, upload_id, data[offset:offset + CHUNK], offset, len(data)).status_code == 200
+    assert admin_client.post(f'/media_uploads/{upload_id}/complete').status_code == 200
+
+    with app.app_context():
+        assert db.session.get(MediaUpload, upload_id) is None
+        attached = InstructionFile.query.filter_by(name='steps.txt').one()
+        blob = db.session.get(MediaBlob, attached.blob_id)
+        with open(blob.path, 'rb') as f:
+            assert f.read() == data
+    assert os.listdir('static/uploads/media/tmp') == []
+
+
+def test_corrupted_chunk_is_dropped(app, db, company, admin_client):
+    data = os.urandom(2 * CHUNK)
+    upload_id = _create(admin_client, company, data).get_json()['upload_id']
+    response = _put(admin_client, upload_id, data[:CHUNK], 0, len(data), sha='0' * 64)
+    assert response.status_code == 422
+    assert admin_client.get(f'/media_uploads/{upload_id}').get_json()['received'] == 0
+
+
+def test_file_checksum_mismatch(app, db, company, admin_client):
+    data = os.urandom(CHUNK)
+    upload_id = _create(admin_client, company, data, sha256='f' * 64).get_json()['upload_id']
+    _upload(admin_client, upload_id, data)
+    assert admin_client.post(f'/media_uploads/{upload_id}/complete').status_code == 422
+    with app.app_context():
+        assert InstructionFile.query.count() == 0
+
+
+def test_other_company_cannot_see_or_write(app, db, company, admin_client, other_admin_client):
+    data = os.urandom(CHUNK)
+    assert _create(other_admin_client, company, data).status_code == 404
+    upload_id = _create(admin_client, company, data).get_json()['upload_id']
+
+    assert other_admin_client.get(f'/media_uploads/{upload_id}').status_code == 404
+    assert _put(other_admin_client, upload_id, data, 0, len(data)).status_code == 404
+    assert other_admin_client.post(f'/media_uploads/{upload_id}/complete').status_code == 404
+    assert admin_client.get(f'/media_uploads/{upload_id}').get_json()['received'] == 0
+
+
+def test_size_is_validated(app, db, company, admin_client):
+    assert _create(admin_client, company, b'', size='много').status_code == 400
+    assert _create(admin_client, company, b'', size=-1).status_code == 400
+    limit = app.config['MAX_UPLOAD_SIZE']
+    app.config['MAX_UPLOAD_SIZE'] = 1024
+    try:
+        assert _create(admin_client, company, b'', size=1025).status_code == 413
+    finally:
+        app.config['MAX_UPLOAD_SIZE'] = limit
+
+
+def test_complete_can_be_retried_after_failed_commit(app, db, company, admin_client, monkeypatch):
+    data = os.urandom(CHUNK)
+    upload_id = _create(admin_client, company, data).get_json()['upload_id']
+    _upload(admin_client, upload_id, data)
+
+    def failing_commit():
+        raise RuntimeError('database went away')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', failing_commit)
+        with pytest.raises(RuntimeError):
+            admin_client.post(f'/media_uploads/{upload_id}/complete')
+
+    # The upload and its file are still there
+    assert admin_client.get(f'/media_uploads/{upload_id}').get_json()['received'] == len(data)
+    assert admin_client.post(f'/media_uploads/{upload_id}/complete').status_code == 200
+    with app.app_context():
+        blob = db.session.get(MediaBlob, InstructionFile.query.one().blob_id)
+        with open(blob.path, 'rb') as f:
+            assert f.read() == data
+
+
+def test_upload_memory_does_not_grow_with_file_size(app, db, company, admin_client):
+    # Each request needs memory for about one chunk, whatever the size of the file
+    chunk = 4 * 1024 * 1024
+    for chunks in (2, 8):
+        data = os.urandom(chunks * chunk)
+        upload_id = _create(admin_client, company, data, filename=f'{chunks}.bin').get_json()['upload_id']
+        extra = []
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            for offset in range(0, len(data), chunk):
+                body = data[offset:offset + chunk]
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                assert _put(admin_client, upload_id, body, offset, len(data)).status_code == 200
+                extra.append(tracemalloc.get_traced_memory()[1] - before)
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            assert admin_client.post(f'/media_uploads/{upload_id}/complete').status_code == 200
+            extra.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            elapsed = time.perf_counter() - started
+            tracemalloc.stop()
+        print(f'{len(data) >> 20} MiB: {len(data) / elapsed / 2 ** 20:.0f} MiB/s, '
+              f'peak {max(extra) / 2 ** 20:.1f} MiB per request')
+        assert max(extra) < 2 * chunk
@@ -0,0 +1,77 @@
+import threading
+
+from connections import DEFAULTS, pool_metrics
+
+CLIENTS = 500
+PATHS = ('/home', '/edit_tools_list', '/search?q=ключ')
+
+
+def test_pool_survives_many_concurrent_clients(app, db, company, admin_client):
+    cookie = admin_client.get_cookie('session').value
+    # The first requests load the in-process indexes
+    for path in PATHS:
+        assert admin_client.get(path).status_code == 200
+    before = pool_metrics.stats()
+    engine_before = before['engines']['default']
+
+    start = threading.Barrier(CLIENTS)
+    statuses, errors = [], []
+    lock = threading.Lock()
+
+    def client():
+        try:
+            c = app.test_client()
+            c.set_cookie('session', cookie)
+            start.wait()
+            for path in PATHS:
+                status = c.get(path).status_code
+                with lock:
+                    statuses.append(status)
+        except BaseException as exc:
+            with lock:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert statuses == [200] * (CLIENTS * len(PATHS))
+
+    after = pool_metrics.stats()
+    engine_after = after['engines']['default']
+    assert after['requests'] - before['requests'] == CLIENTS * len(PATHS)
+    assert after['timeouts'] == before['timeouts']
+    # Connections are reused: never more than the pool and its overflow, none thrown away
+    assert engine_after['connects'] - engine_before['connects'] <= DEFAULTS['DB_POOL_SIZE'] + DEFAULTS['DB_MAX_OVERFLOW']
+    assert engine_after['invalidated'] == engine_before['invalidated']
+    # Searches are answered from the in-process index
+    assert engine_after['checkouts'] - engine_before['checkouts'] >= CLIENTS * (len(PATHS) - 1)
+    # Nothing leaked a connection
+    assert engine_after['checked_out'] == 0
+
+    stats = admin_client.get('/db_pool_stats').get_json()
+    assert stats['engines']['default']['checked_out'] == 0
+    assert stats['timeouts'] == 0
+
+
+def test_pool_stats_are_admin_only(app, db, company, employee_client):
+    assert employee_client.get('/db_pool_stats').status_code == 403
+
+
+def test_connection_held_until_the_end_of_the_request_is_counted(app, db, company, admin_client):
+    from models import Tool
+
+    assert admin_client.get('/edit_tools_list').status_code == 200
+    before = pool_metrics.stats()
+    assert admin_client.get('/edit_tools_list').status_code == 200
+    after = pool_metrics.stats()
+    assert after['requests'] == before['requests'] + 1
+    assert after['avg_held_ms_per_request'] * after['requests'] > before['avg_held_ms_per_request'] * before['requests']
+
+    # A request context without before_request handlers still reports
+    with app.test_request_context():
+        assert Tool.query.count() == 1
+    assert pool_metrics.stats()['requests'] == after['requests'] + 1
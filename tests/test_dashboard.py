@@ -0,0 +1,148 @@
+import itertools
+
+from models import Product, Task, aTask
+from sql_profiler import sql_profiler
+
+# The summary joined with admin tasks and products
+DASHBOARD_QUERIES = 1
+# Nothing else: the alarm flag comes from the in-process index
+HOME_QUERIES = DASHBOARD_QUERIES
+
+_names = itertools.count(1)
+
+
+def _add_admin_tasks(app, db, company, count):
+    """`count` more admin tasks of a new product each, with one task per status."""
+    from dashboard import rebuild_status_summary
+
+    with app.app_context():
+        for n in itertools.islice(_names, count):
+            product = Product(f'Виріб {n}', company['company_id'])
+            db.session.add(product)
+            db.session.flush()
+            admin_task = aTask(product.id, company['company_id'])
+            db.session.add(admin_task)
+            db.session.flush()
+            db.session.add_all([
+                Task(product.id, company['operation_ids'][0], company['employee_id'], status,
+                     company['company_id'], 'product', admin_task.id)
+                for status in ('Не активне', 'У роботі', 'Завершене')
+            ])
+        rebuild_status_summary()
+        db.session.commit()
+    return f'Виріб {n}'
+
+
+def _count_queries(app, max_queries, f):
+    with app.app_context():
+        with sql_profiler.query_budget(max_queries=max_queries) as profile:
+            f()
+        return profile.count
+
+
+def test_dashboard_query_count_does_not_grow_with_admin_tasks(app, db, company):
+    from dashboard import get_dashboard_tasks
+
+    counts = []
+    for count in (1, 50):
+        _add_admin_tasks(app, db, company, count)
+        counts.append(_count_queries(app, DASHBOARD_QUERIES, lambda: get_dashboard_tasks(company['company_id'])))
+    assert counts[0] == counts[1], counts
+
+    with app.app_context():
+        dashboard = get_dashboard_tasks(company['company_id'])
+    assert len(dashboard['inactive_tasks']) == 1
+    assert len(dashboard['in_progress_tasks']) == 51
+    assert dashboard['alarm'] is False
+
+
+def test_home_query_count_does_not_grow_with_admin_tasks(app, db, company, admin_client):
+    # The first request loads the alarm index of the company
+    assert admin_client.get('/home').status_code == 200
+    counts = []
+    for count in (1, 50):
+        last = _add_admin_tasks(app, db, company, count)
+        counts.append(_count_queries(app, HOME_QUERIES, lambda: admin_client.get('/home')))
+    assert counts[0] == counts[1], counts
+
+    page = admin_client.get('/home').get_data(as_text=True)
+    assert page.count(last) == 1
+
+
+def _summary(app, company):
+    from dashboard import admin_task_counts, check_status_summary
+
+    with app.app_context():
+        assert check_status_summary() == []
+        return admin_task_counts(company['admin_task_id'])
+
+
+def test_summary_follows_every_status_change(app, db, company, admin_client, employee_client):
+    first, second, third = company['task_ids']
+    assert _summary(app, company) == {'Не активне': 3}
+
+    assert employee_client.get(f'/start_task/{first}').status_code == 302
+    assert _summary(app, company) == {'Не активне': 2, 'У роботі': 1}
+    # Starting it again changes nothing
+    employee_client.get(f'/start_task/{first}')
+    assert _summary(app, company) == {'Не активне': 2, 'У роботі': 1}
+
+    assert employee_client.get(f'/finish_task/{first}').status_code == 302
+    assert _summary(app, company) == {'Не активне': 2, 'Завершене': 1}
+
+    employee_client.get(f'/start_task/{second}')
+    assert employee_client.post(f'/submit_alarm/{second}', data={'operationName': 'Зламався'}).status_code == 302
+    assert _summary(app, company) == {'Не активне': 1, 'Завершене': 1, 'Alarm': 1}
+
+    assert admin_client.get(f'/delete_alarm/{second}').status_code == 302
+    assert _summary(app, company) == {'Не активне': 1, 'Завершене': 1, 'У роботі': 1}
+
+    assert admin_client.post('/create_task', json={
+        'operation_id': company['operation_ids'][2], 'employee_id': company['employee_id'],
+        'component_id': company['product_id'], 'component_type': 'product', 'admin_task': company['admin_task_id'],
+    }).status_code == 200
+    assert _summary(app, company) == {'Не активне': 2, 'Завершене': 1, 'У роботі': 1}
+
+    employee_client.post(f'/submit_alarm/{third}', data={'operationName': 'Зламався'})
+    assert admin_client.post(f'/delete_admin_task/{company["admin_task_id"]}').status_code == 302
+    assert _summary(app, company) == {}
+
+
+def test_dashboard_buckets_follow_the_admin_task_state(app, db, company, admin_client, employee_client):
+    from dashboard import get_dashboard_tasks
+
+    def bucket():
+        with app.app_context():
+            dashboard = get_dashboard_tasks(company['company_id'])
+        found = [key for key, entries in dashboard.items()
+                 if key != 'alarm' and any(e['task_id'] == company['admin_task_id'] for e in entries)]
+        assert len(found) == 1, dashboard
+        return found[0], dashboard['alarm']
+
+    first, second, third = company['task_ids']
+    assert bucket() == ('inactive_tasks', False)
+    employee_client.get(f'/start_task/{first}')
+    assert bucket() == ('in_progress_tasks', False)
+    employee_client.post(f'/submit_alarm/{first}', data={'operationName': 'Зламався'})
+    assert bucket() == ('alarm_tasks', True)
+    admin_client.get(f'/delete_alarm/{first}')
+    for task_id in company['task_ids']:
+        employee_client.get(f'/start_task/{task_id}')
+        employee_client.get(f'/finish_task/{task_id}')
+    assert bucket() == ('completed_tasks', False)
+
+
+def test_admin_task_state():
+    from dashboard import admin_task_state
+
+    assert admin_task_state({}) is None
+    assert admin_task_state({'Не активне': 0}) is None
+    assert admin_task_state({'Не активне': 3}) == 'Не активне'
+    # One started or finished task puts the whole admin task in progress
+    assert admin_task_state({'Не активне': 2, 'У роботі': 1}) == 'У роботі'
+    assert admin_task_state({'Не активне': 2, 'Завершене': 1}) == 'У роботі'
+    assert admin_task_state({'Завершене': 3}) == 'Завершене'
+    assert admin_task_state({'Завершене': 3, 'Не активне': 0}) == 'Завершене'
+    # An alarm wins over everything else
+    assert admin_task_state({'Завершене': 2, 'Alarm': 1}) == 'Alarm'
+    assert admin_task_state({'Не активне': 2, 'Alarm': 1}) == 'Alarm'
@@ -0,0 +1,174 @@
+import random
+import time
+
+import pytest
+
+from dependency_graph import DependencyCycleError, DependencyGraph, describe_graph
+
+BENCHMARK_BLOCKS = 100
+BENCHMARK_DETAILS = 50  # per block
+BENCHMARK_SECONDS = 2.0
+
+
+def _tree(blocks, product_ops=(1,)):
+    """Product 1 with its operations; blocks: {block_id: {detail_id: [operation ids]}}.
+
+    A block's own operations are listed under the detail id None.
+    """
+    def ops(ids):
+        return [{'id': i, 'name': f'op {i}'} for i in ids]
+
+    return {
+        'type': 'product', 'id': 1, 'operations': ops(product_ops),
+        'blocks': [{
+            'type': 'block', 'id': block_id, 'operations': ops(details.get(None, ())),
+            'details': [{'type': 'detail', 'id': detail_id, 'operations': ops(op_ids)}
+                        for detail_id, op_ids in details.items() if detail_id is not None],
+        } for block_id, details in blocks.items()],
+    }
+
+
+def test_dependencies_order_the_operations():
+    # Product op 1 waits for detail 20; detail op 21 waits for detail 30
+    tree = _tree({10: {None: [11], 20: [21], 30: [31]}})
+    graph = DependencyGraph.from_tree(tree, [(1, 'detail', 20), (21, 'detail', 30)])
+    order = graph.operation_order()
+    assert sorted(order) == [1, 11, 21, 31]
+    assert order.index(31) < order.index(21) < order.index(1)
+
+    assert graph.prerequisite_operations(1) == {21}
+    assert graph.prerequisite_operations(21) == {31}
+    assert graph.prerequisite_operations(11) == set()
+
+
+def test_dependency_on_a_component_waits_for_its_whole_subtree():
+    tree = _tree({10: {None: [11], 20: [21, 22], 30: [31]}}, product_ops=(1, 2))
+    graph = DependencyGraph.from_tree(tree, [(2, 'block', 10)])
+    assert graph.prerequisite_operations(2) == {11, 21, 22, 31}
+    order = graph.operation_order()
+    assert order[-1] == 2
+
+
+def test_dependencies_outside_the_product_are_ignored():
+    tree = _tree({10: {20: [21]}})
+    graph = DependencyGraph.from_tree(tree, [(21, 'detail', 999), (999, 'detail', 20)])
+    assert graph.prerequisites == {}
+    assert sorted(graph.operation_order()) == [1, 21]
+
+
+def test_cycle_is_reported_with_its_operations():
+    tree = _tree({10: {20: [21], 30: [31], 40: [41]}})
+    graph = DependencyGraph.from_tree(tree, [(21, 'detail', 30), (31, 'detail', 20), (41, 'detail', 20)])
+    with pytest.raises(DependencyCycleError) as error:
+        graph.topological_order()
+    cycle = error.value.cycle
+    assert cycle[0] == cycle[-1]
+    assert sorted(cycle[:-1]) == [21, 31]
+
+    summary = describe_graph(graph)
+    assert summary['cycle'] == cycle
+    assert summary['order'] == []
+
+
+@pytest.mark.parametrize('component', [('block', 10), ('product', 1)])
+def test_operation_depending_on_its_own_parent_is_a_cycle(component):
+    tree = _tree({10: {20: [21]}})
+    graph = DependencyGraph.from_tree(tree, [(21,) + component])
+    with pytest.raises(DependencyCycleError) as error:
+        graph.topological_order()
+    assert error.value.cycle == [21, 21]
+
+
+def test_critical_path_follows_the_longest_chain():
+    tree = _tree({10: {20: [21], 30: [31], 40: [41]}})
+    durations = {1: 10.0, 21: 100.0, 31: 50.0, 41: 500.0}
+    # 31 -> 21 -> 1 is 160 s; 41 alone is 500 s
+    graph = DependencyGraph.from_tree(tree, [(1, 'detail', 20), (21, 'detail', 30)], durations)
+    assert graph.critical_path() == (500.0, [41])
+
+    durations[41] = 5.0
+    graph = DependencyGraph.from_tree(tree, [(1, 'detail', 20), (21, 'detail', 30)], durations)
+    assert graph.critical_path() == (160.0, [31, 21, 1])
+    summary = describe_graph(graph)
+    assert summary['critical_path'] == [31, 21, 1]
+    assert summary['critical_path_seconds'] == 160.0
+    assert summary['dependencies'] == 2
+
+
+def test_unfinished_prerequisites_block_the_start(app, db, company, employee_client):
+    from dependency_graph import unfinished_prerequisites
+    from models import Task, dComponent
+
+    product_task, block_task, detail_task = company['task_ids']
+    with app.app_context():
+        # The product operation waits for the detail
+        db.session.add(dComponent(company['detail_id'], 'detail', company['operation_ids'][0]))
+        db.session.commit()
+        assert [t.id for t in unfinished_prerequisites(db.session.get(Task, product_task))] == [detail_task]
+        assert unfinished_prerequisites(db.session.get(Task, detail_task)) == []
+
+    employee_client.get(f'/start_task/{product_task}')
+    with app.app_context():
+        assert db.session.get(Task, product_task).status == 'Не активне'
+
+    employee_client.get(f'/start_task/{detail_task}')
+    employee_client.get(f'/finish_task/{detail_task}')
+    with app.app_context():
+        assert unfinished_prerequisites(db.session.get(Task, product_task)) == []
+    employee_client.get(f'/start_task/{product_task}')
+    with app.app_context():
+        assert db.session.get(Task, product_task).status == 'У роботі'
+
+
+def test_admin_task_graph_route(app, db, company, admin_client, other_admin_client):
+    from models import dComponent
+
+    product_op, block_op, detail_op = company['operation_ids']
+    url = f'/admin_task_graph/{company["admin_task_id"]}'
+    with app.app_context():
+        db.session.add(dComponent(company['detail_id'], 'detail', product_op))
+        db.session.commit()
+    graph = admin_client.get(url).get_json()
+    assert graph['operations'] == 3
+    assert graph['order'].index(detail_op) < graph['order'].index(product_op)
+    assert graph['cycle'] is None
+
+    with app.app_context():
+        db.session.add(dComponent(company['product_id'], 'product', detail_op))
+        db.session.commit()
+    assert sorted(admin_client.get(url).get_json()['cycle'][:-1]) == sorted([detail_op, product_op])
+
+    assert other_admin_client.get(url).status_code == 404
+
+
+def test_large_graph_analysis_time():
+    rng = random.Random(1)
+    next_id = iter(range(1, 10 ** 9))
+    blocks, details = {}, []
+    for _ in range(BENCHMARK_BLOCKS):
+        block = blocks.setdefault(next(next_id), {None: [next(next_id)]})
+        for _ in range(BENCHMARK_DETAILS):
+            detail_id = next(next_id)
+            block[detail_id] = [next(next_id) for _ in range(5)]
+            details.append(detail_id)
+    tree = _tree(blocks)
+    # Every detail's operations wait for an earlier detail, so there is no cycle
+    dependencies = []
+    operations = {detail_id: ops for block in blocks.values() for detail_id, ops in block.items() if detail_id}
+    for position, detail_id in enumerate(details[1:], 1):
+        for _ in range(2):
+            dependencies.append((rng.choice(operations[detail_id]), 'detail', details[rng.randrange(position)]))
+    durations = {op: rng.uniform(60, 7200) for ops in operations.values() for op in ops}
+
+    started = time.perf_counter()
+    graph = DependencyGraph.from_tree(tree, dependencies, durations)
+    order = graph.operation_order()
+    seconds, path = graph.critical_path()
+    elapsed = time.perf_counter() - started
+
+    assert len(graph.operations) == len(order) == 1 + BENCHMARK_BLOCKS * (1 + BENCHMARK_DETAILS * 5)
+    position = {op: i for i, op in enumerate(order)}
+    for operation_id, _, detail_id in dependencies:
+        assert all(position[op] < position[operation_id] for op in operations[detail_id])
+    assert path and seconds == pytest.approx(sum(durations.get(op, 0) for op in path))
+    assert elapsed < BENCHMARK_SECONDS, elapsed
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import text
+
+from blocking_tasks import BLOCKING_STATUSES
+from models import Alarm, Instruction, LocationO, MaterialO, Operation, Task, ToolO, aTask, dComponent
+
+# The lookups behind every employee page, the dashboards and the instruction page
+HOT_QUERIES = {
+    'blocking task of an employee': lambda db: db.session.query(Task.id, Task.status, Alarm.id).outerjoin(
+        Alarm, Alarm.task_id == Task.id).filter(Task.responsible_id == 1, Task.status.in_(BLOCKING_STATUSES)),
+    'tasks of an admin task': lambda db: Task.query.filter_by(company_id=1, admin_task_id=1),
+    'alarms of a company': lambda db: Task.query.filter_by(company_id=1, status='Alarm'),
+    'tasks of an operation': lambda db: Task.query.filter_by(operation_id=1, status='У роботі'),
+    'admin tasks of a company': lambda db: aTask.query.filter_by(company_id=1),
+    'operations of a component': lambda db: Operation.query.filter_by(component_id=1, product_type='block'),
+    'alarm of a task': lambda db: Alarm.query.filter_by(task_id=1),
+    'instruction of an operation': lambda db: Instruction.query.filter_by(operation_id=1),
+    'tools of an operation': lambda db: ToolO.query.filter_by(operation_id=1),
+    'materials of an operation': lambda db: MaterialO.query.filter_by(operation_id=1),
+    'locations of an operation': lambda db: LocationO.query.filter_by(operation_id=1),
+    'dependencies of an operation': lambda db: dComponent.query.filter_by(operation_id=1),
+}
+
+
+def query_plan(db, query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_an_index(app, db, name):
+    with app.app_context():
+        plan = query_plan(db, HOT_QUERIES[name](db))
+
+    # SQLite reports a table it reads without an index as "SCAN <table>"
+    scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+    assert not scans, f'{name}: {plan}'
+    assert any('INDEX' in step for step in plan), f'{name}: {plan}'
+
+
+def test_plan_reports_full_scans(app, db):
+    # Guards the check above: a filter on a column without an index is reported as a scan
+    with app.app_context():
+        plan = query_plan(db, Task.query.filter_by(end_time=None))
+    assert plan == ['SCAN tasks']
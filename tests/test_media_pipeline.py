@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import media_pipeline as pipeline
+from media_pipeline import media_pipeline
+from models import MediaJob
+
+
+def _job(db, status, age=None, attempts=0):
+    job = MediaJob('static/uploads/photos/a.png', 'image', company_id=1)
+    job.status, job.attempts = status, attempts
+    if age is not None:
+        job.started_at = job.claimed_at = datetime.utcnow() - timedelta(seconds=age)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_jobs_of_dead_workers_are_requeued(app, db):
+    timeout = app.config['MEDIA_JOB_TIMEOUT']
+    with app.app_context():
+        lost = _job(db, 'running', age=timeout + 60, attempts=1)
+        out_of_attempts = _job(db, 'running', age=timeout + 60, attempts=app.config['MEDIA_JOB_MAX_ATTEMPTS'])
+        # Still reporting progress, or not claimed at all
+        alive = _job(db, 'running', age=timeout - 60, attempts=1)
+        queued = _job(db, 'queued')
+
+        assert media_pipeline.requeue_stale() == 1
+        statuses = {job.id: (job.status, job.progress) for job in MediaJob.query}
+        assert statuses[lost] == ('queued', 0)
+        assert statuses[out_of_attempts][0] == 'failed'
+        assert statuses[alive][0] == 'running'
+        assert statuses[queued][0] == 'queued'
+        assert db.session.get(MediaJob, out_of_attempts).error
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.requeues = []  # times of the requeue_stale() calls
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pipeline, 'time', clock)
+    monkeypatch.setattr(media_pipeline, '_next_requeue', 0.0)
+    real = media_pipeline.requeue_stale
+    monkeypatch.setattr(media_pipeline, 'requeue_stale', lambda: clock.requeues.append(clock.now) or real())
+    return clock
+
+
+def test_dispatch_looks_for_dead_workers_once_per_interval(app, db, clock):
+    interval = app.config['MEDIA_REQUEUE_INTERVAL']
+    with app.app_context():
+        # The first dispatch of the process checks at once, the uploads after it do not
+        for _ in range(3):
+            media_pipeline.dispatch()
+        assert clock.requeues == [1000.0]
+
+        clock.now += interval - 1
+        media_pipeline.dispatch()
+        assert len(clock.requeues) == 1
+        clock.now += 1
+        media_pipeline.dispatch()
+        assert clock.requeues == [1000.0, 1000.0 + interval]
+
+
+def test_cli_requeues_regardless_of_the_interval(app, db, clock, monkeypatch):
+    monkeypatch.setattr(media_pipeline, 'wait', lambda: None)
+    with app.app_context():
+        media_pipeline.dispatch()
+        _job(db, 'running', age=app.config['MEDIA_JOB_TIMEOUT'] + 60, attempts=1)
+    # Without a worker to hand it to, the re-queued job just stays queued
+    monkeypatch.setattr(media_pipeline, 'dispatch', lambda: None)
+
+    result = app.test_cli_runner().invoke(args=['dispatch-media-jobs'])
+    assert result.exit_code == 0, result.output
+    assert '1 stale jobs re-queued' in result.output
+    assert len(clock.requeues) == 2
+    with app.app_context():
+        assert [job.status for job in MediaJob.query] == ['queued']
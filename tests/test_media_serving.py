@@ -0,0 +1,211 @@
+import os
+import time
+from email.utils import parsedate_to_datetime
+
+import pytest
+
+from media_serving import CONTENT_HASH_MAX_BYTES, IMMUTABLE_CACHE_CONTROL, file_fingerprint, media_url
+
+# A shift of an employee: the instruction pages of SHIFT_TASKS tasks, each
+# opened SHIFT_VISITS times, with a photo and a video seeked into twice.
+# The tablet replays SHIFTS of them with its browser cache kept in between.
+SHIFTS = 2
+SHIFT_TASKS = 8
+SHIFT_VISITS = 4
+PHOTO_BYTES = 200 * 1024
+VIDEO_BYTES = 2 * 1024 * 1024
+
+
+def _write(relative, size, fill=b'x'):
+    path = os.path.join('static', 'uploads', relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(fill * size)
+    return path
+
+
+def _url(app, path):
+    with app.test_request_context():
+        return media_url(path)
+
+
+def test_fingerprinted_url_is_immutable(app, db):
+    path = _write('photos/a.png', 1000)
+    url = _url(app, path)
+    fingerprint = file_fingerprint(path)
+    assert url == f'/media/{fingerprint}/photos/a.png'
+
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers['ETag'] == f'"{fingerprint}"'
+    assert len(response.data) == 1000
+
+
+def test_if_none_match_gets_304(app, db):
+    url = _url(app, _write('photos/a.png', 1000))
+    client = app.test_client()
+    etag = client.get(url).headers['ETag']
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert client.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_range_requests_get_206(app, db):
+    path = _write('videos/v.mp4', 0)
+    with open(path, 'wb') as f:
+        f.write(bytes(range(256)) * 40)
+    url = _url(app, path)
+    client = app.test_client()
+
+    response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 100-199/10240'
+    assert response.data == bytes(range(100, 200))
+
+    response = client.get(url, headers={'Range': 'bytes=10000-'})
+    assert response.status_code == 206
+    assert len(response.data) == 240
+    assert client.get(url, headers={'Range': 'bytes=20000-'}).status_code == 416
+
+
+def test_changed_file_gets_a_new_url(app, db):
+    path = _write('photos/a.png', 1000)
+    old_url = _url(app, path)
+    _write('photos/a.png', 1000, fill=b'y')
+    # Same size: only the mtime tells the cache that the file changed
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    new_url = _url(app, path)
+    assert new_url != old_url
+
+    # The old link still works, but is no longer cacheable forever
+    response = app.test_client().get(old_url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.data == b'y' * 1000
+
+
+def test_large_files_are_fingerprinted_without_reading_them(app, db, monkeypatch):
+    import builtins
+
+    path = _write('videos/big.mp4', CONTENT_HASH_MAX_BYTES + 1)
+    opened = []
+    real_open = builtins.open
+    monkeypatch.setattr(builtins, 'open', lambda file, *a, **kw: opened.append(file) or real_open(file, *a, **kw))
+    assert len(file_fingerprint(path)) == 16
+    assert path not in opened
+
+
+@pytest.mark.parametrize('url', ['/media/abc/../../app.py', '/media/abc/missing.png', '/media/abc/'])
+def test_missing_and_outside_files_are_404(app, db, url):
+    assert app.test_client().get(url).status_code == 404
+
+
+def test_static_assets_get_versioned_urls(app, db):
+    from flask import url_for
+
+    with app.test_request_context():
+        url = url_for('static', filename='js/list_loader.js')
+    assert '?v=' in url
+    client = app.test_client()
+    response = client.get(url)
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    response.close()
+    # Without the version, or with an old one, the browser has to revalidate
+    for stale in (url.split('?')[0], url.split('?')[0] + '?v=0'):
+        response = client.get(stale)
+        assert response.headers.get('Cache-Control') != IMMUTABLE_CACHE_CONTROL
+        response.close()
+
+
+class CachingClient:
+    """Browser-like HTTP cache over a test client.
+
+    Fresh responses (max-age not over) are used without a request,
+    others are revalidated with If-None-Match/If-Modified-Since when
+    they carry a validator, and downloaded again otherwise.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {}  # url -> (fresh_until, headers, body)
+        self.requests = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def _fetch(self, url, headers):
+        started = time.perf_counter()
+        response = self.client.get(url, headers=headers)
+        body = response.get_data()
+        self.seconds += time.perf_counter() - started
+        self.requests += 1
+        self.bytes += len(body)
+        return response, body
+
+    def get(self, url, range_=None):
+        now = time.time()
+        cached = self.cache.get(url)
+        if cached and cached[0] > now:
+            body = cached[2]
+            return body[range_[0]:range_[1] + 1] if range_ else body
+        if range_:
+            # Seeking in a video that is not cached asks for the part only
+            return self._fetch(url, {'Range': f'bytes={range_[0]}-{range_[1]}'})[1]
+
+        headers = {}
+        if cached:
+            if 'ETag' in cached[1]:
+                headers['If-None-Match'] = cached[1]['ETag']
+            if 'Last-Modified' in cached[1]:
+                headers['If-Modified-Since'] = cached[1]['Last-Modified']
+        response, body = self._fetch(url, headers)
+        if response.status_code == 304:
+            body = cached[2]
+        cache_control = response.headers.get('Cache-Control', '')
+        max_age = 0
+        for part in cache_control.split(','):
+            name, _, value = part.strip().partition('=')
+            if name == 'max-age' and 'no-cache' not in cache_control:
+                max_age = int(value)
+        if 'no-store' not in cache_control:
+            self.cache[url] = (now + max_age, response.headers, body)
+        return body
+
+
+def _replay_shift(client, urls):
+    for _ in range(SHIFT_VISITS):
+        for photo, video in urls:
+            client.get(photo)
+            client.get(video, range_=(0, 64 * 1024 - 1))
+            client.get(video, range_=(VIDEO_BYTES // 2, VIDEO_BYTES // 2 + 64 * 1024 - 1))
+            client.get(video)
+
+
+def test_shift_replay_benchmark(app, db, monkeypatch):
+    files = [(_write(f'photos/p{i}.png', PHOTO_BYTES, bytes([i])), _write(f'videos/v{i}.mp4', VIDEO_BYTES, bytes([i])))
+             for i in range(SHIFT_TASKS)]
+    # Before: the same files straight from /static, as the templates linked them
+    monkeypatch.setattr(app, 'static_folder', os.path.abspath('static'))
+    static = CachingClient(app.test_client())
+    media = CachingClient(app.test_client())
+    for _ in range(SHIFTS):
+        _replay_shift(static, [('/' + photo, '/' + video) for photo, video in files])
+        _replay_shift(media, [(_url(app, photo), _url(app, video)) for photo, video in files])
+
+    first_visit = SHIFT_TASKS * (PHOTO_BYTES + VIDEO_BYTES + 2 * 64 * 1024)
+    print(f'\nshift replay: /static {static.requests} requests, {static.bytes} bytes, {static.seconds * 1000:.0f} ms; '
+          f'/media {media.requests} requests, {media.bytes} bytes, {media.seconds * 1000:.0f} ms')
+    # Only the first visit of each page in the first shift downloads anything
+    assert media.requests == SHIFT_TASKS * 4
+    assert media.bytes == first_visit
+    assert media.requests < static.requests
+    assert media.bytes <= static.bytes
+
+
+def test_media_responses_carry_last_modified(app, db):
+    path = _write('photos/a.png', 10)
+    response = app.test_client().get(_url(app, path))
+    assert parsedate_to_datetime(response.headers['Last-Modified']).timestamp() == pytest.approx(
+        os.stat(path).st_mtime, abs=1)
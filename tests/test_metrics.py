@@ -0,0 +1,97 @@
+import json
+import os
+import time
+
+from flask import Response
+
+from metrics import LATENCY_BUCKETS, Metrics, _Histogram, metrics
+
+# Overhead the request hooks may add to every request
+MAX_HOOK_SECONDS = 50e-6
+
+
+def _hook(funcs, name):
+    return next(f for f in funcs[None] if f.__name__ == name)
+
+
+def test_request_hooks_cost_less_than_50_microseconds(app):
+    start = _hook(app.before_request_funcs, 'start_request_metrics')
+    status = _hook(app.after_request_funcs, 'remember_status')
+    finish = _hook(app.teardown_request_funcs, 'finish_request_metrics')
+    response = Response('ok')
+    directory, metrics.directory = metrics.directory, None
+    try:
+        with app.test_request_context('/home'):
+            n = 20000
+            best = float('inf')
+            # Best of several runs, so a busy machine does not fail the test
+            for _ in range(5):
+                started = time.perf_counter()
+                for _ in range(n):
+                    start()
+                    status(response)
+                    finish(None)
+                best = min(best, (time.perf_counter() - started) / n)
+    finally:
+        metrics.directory = directory
+    assert best < MAX_HOOK_SECONDS, f'{best * 1e6:.1f} µs per request'
+
+
+def test_histogram_exposition():
+    recorder = Metrics()
+    for seconds in (0.001, 0.02, 0.02, 3.0, 60.0):
+        recorder.latency.setdefault('/home', _Histogram()).observe(seconds)
+    lines = recorder.render().splitlines()
+
+    name = 'virtfact_http_request_duration_seconds'
+    assert f'# TYPE {name} histogram' in lines
+    buckets = {line.split('le="')[1].split('"')[0]: int(line.rsplit(' ', 1)[1])
+               for line in lines if line.startswith(f'{name}_bucket')}
+    assert list(buckets) == [_le(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+    assert buckets['0.005'] == 1
+    assert buckets['0.025'] == 3
+    assert buckets['5'] == 4
+    assert buckets['+Inf'] == 5
+    assert f'{name}_count{{route="/home"}} 5' in lines
+    assert f'{name}_sum{{route="/home"}} 63.041' in lines
+
+
+def test_workers_are_added_up(tmp_path):
+    recorder = Metrics()
+    recorder.directory = str(tmp_path)
+    recorder.requests[('/home', 'GET', '200')] = 2
+    recorder.in_flight['/home'] = 1
+
+    other = recorder.snapshot()
+    # A live worker, and one that exited: pids never go above 2 ** 22 on Linux
+    for pid, in_flight in ((os.getppid(), 3), (2 ** 22 + 1, 5)):
+        other['pid'] = pid
+        other['gauges']['virtfact_http_requests_in_flight'] = [[{'route': '/home'}, in_flight]]
+        (tmp_path / f'{pid}.json').write_text(json.dumps(other))
+
+    lines = recorder.render().splitlines()
+    assert 'virtfact_http_requests_total{method="GET",route="/home",status="200"} 6' in lines
+    # Requests of exited workers still count, their in-flight gauges do not
+    assert 'virtfact_http_requests_in_flight{route="/home"} 4' in lines
+
+
+def test_metrics_endpoint_access(app, company, admin_client, employee_client):
+    employee_client.get(f'/start_task/{company["task_ids"][0]}')
+    assert app.test_client().get('/metrics').status_code == 401
+    assert employee_client.get('/metrics').status_code == 403
+
+    lines = admin_client.get('/metrics').get_data(as_text=True).splitlines()
+    assert f'virtfact_tasks_in_progress{{company_id="{company["company_id"]}"}} 1' in lines
+    # Server-wide numbers are only for the scraper
+    assert not any(line.startswith('virtfact_upload_pending_bytes') for line in lines)
+
+    app.config['METRICS_TOKEN'] = 'secret'
+    try:
+        response = app.test_client().get('/metrics', headers={'Authorization': 'Bearer secret'})
+    finally:
+        app.config['METRICS_TOKEN'] = None
+    assert 'virtfact_upload_pending_bytes 0' in response.get_data(as_text=True).splitlines()
+
+
+def _le(bound):
+    return repr(bound) if not float(bound).is_integer() else str(int(bound))
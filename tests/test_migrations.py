@@ -0,0 +1,111 @@
+import argparse
+import importlib.util
+import os
+
+import pytest
+from alembic.config import Config
+from alembic.operations import Operations
+from alembic.runtime.environment import EnvironmentContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect, text
+
+from extensions import db
+from tests.conftest import ROOT
+
+MIGRATIONS = os.path.join(ROOT, 'migrations')
+
+
+def _revision(name):
+    path = os.path.join(MIGRATIONS, 'versions', name)
+    spec = importlib.util.spec_from_file_location(name[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _upgrade(engine, module, *x_args):
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS)
+    config.cmd_opts = argparse.Namespace(x=list(x_args))
+    with engine.begin() as connection, EnvironmentContext(config, ScriptDirectory.from_config(config)) as env:
+        env.configure(connection=connection)
+        with Operations.context(env.get_context()):
+            module.upgrade()
+
+
+@pytest.fixture
+def engine(app, tmp_path):
+    # The schema of the models minus what the revision under test adds
+    engine = create_engine(f'sqlite:///{tmp_path}/migrate.db')
+    with app.app_context():
+        db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _drop_indexes(engine, names):
+    with engine.begin() as connection:
+        for name in names:
+            connection.execute(text(f'DROP INDEX {name}'))
+
+
+def _count(engine, sql):
+    with engine.connect() as connection:
+        return connection.execute(text(sql)).scalar()
+
+
+HOT_LOOKUP = ('3c1f9a7b2d4e_hot_lookup_indexes.py', [
+    'ix_tasks_responsible_id_status', 'ix_tasks_company_id_admin_task_id', 'ix_tasks_company_id_status',
+    'ix_tasks_admin_task_id', 'ix_operations_component_id_product_type', 'ix_tools_for_operation_operation_id',
+    'ix_materials_for_operation_operation_id', 'ix_locations_for_operation_operation_id',
+    'ix_dependent_components_operation_id', 'ix_instructions_operation_id', 'ix_alarms_task_id',
+    'ix_admin_tasks_company_id',
+])
+REVERSE_USAGE = ('d2b8f4a61c37_reverse_usage_indexes.py', [
+    'ix_tools_for_operation_tool_id', 'ix_materials_for_operation_material_id',
+    'ix_locations_for_operation_location_id', 'ix_tasks_operation_id_status',
+])
+
+
+def _orphan_rows(engine):
+    with engine.begin() as connection:
+        # SQLite does not enforce foreign keys unless asked to, like the databases these revisions clean up
+        connection.execute(text(
+            "INSERT INTO tasks (product_id, operation_id, responsible_id, status, company_id, component_type, "
+            "admin_task_id) VALUES (1, 1, 1, 'Виконано', 1, 'product', 999)"
+        ))
+        connection.execute(text('INSERT INTO tools_for_operation (tool_id, operation_id) VALUES (999, 999)'))
+
+
+@pytest.mark.parametrize('revision', [HOT_LOOKUP, REVERSE_USAGE], ids=['hot_lookup', 'reverse_usage'])
+def test_orphans_abort_the_upgrade(engine, revision):
+    name, indexes = revision
+    _drop_indexes(engine, indexes)
+    _orphan_rows(engine)
+
+    with pytest.raises(RuntimeError, match='delete_orphans=true'):
+        _upgrade(engine, _revision(name))
+
+    assert _count(engine, 'SELECT COUNT(*) FROM tasks') == 1
+    assert _count(engine, 'SELECT COUNT(*) FROM tools_for_operation') == 1
+
+
+@pytest.mark.parametrize('revision', [HOT_LOOKUP, REVERSE_USAGE], ids=['hot_lookup', 'reverse_usage'])
+def test_orphans_are_deleted_on_request(engine, revision):
+    name, indexes = revision
+    _drop_indexes(engine, indexes)
+    _orphan_rows(engine)
+
+    _upgrade(engine, _revision(name), 'delete_orphans=true')
+
+    assert _count(engine, 'SELECT COUNT(*) FROM tools_for_operation') == 0
+    created = {index['name'] for table in inspect(engine).get_table_names()
+               for index in inspect(engine).get_indexes(table)}
+    assert set(indexes) <= created
+
+
+def test_clean_database_upgrades_without_opt_in(engine):
+    name, indexes = HOT_LOOKUP
+    _drop_indexes(engine, indexes)
+    _upgrade(engine, _revision(name))
+    assert _count(engine, 'SELECT COUNT(*) FROM tasks') == 0
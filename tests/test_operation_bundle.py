@@ -0,0 +1,90 @@
+import itertools
+
+import pytest
+
+from models import (Block, Detail, Instruction, InstructionFile, Material, MaterialO, MediaBlob, Product, Tool,
+                    ToolO, dComponent)
+from operation_bundle import load_operation_bundle
+from sql_profiler import QueryBudgetExceeded, sql_profiler
+
+# Operation and instruction, tools, materials, location, dependencies, the three
+# component tables, media files and their renditions
+BUNDLE_QUERIES = 10
+# The task, then the bundle
+INSTRUCTION_PAGE_QUERIES = BUNDLE_QUERIES + 1
+
+_names = itertools.count(1)
+
+
+def _grow(db, company, operation_id, count):
+    """Give the operation `count` more tools, materials, dependencies and instruction files."""
+    instruction = Instruction.query.filter_by(operation_id=operation_id).first()
+    if instruction is None:
+        instruction = Instruction(operation_id, None, None, None)
+        db.session.add(instruction)
+    for n in itertools.islice(_names, count):
+        product = Product(f'Залежний виріб {n}', company['company_id'])
+        tool, material = Tool(f'Інструмент {n}', company['company_id']), Material(f'Матеріал {n}', company['company_id'])
+        db.session.add_all([product, tool, material])
+        db.session.flush()
+        block = Block(f'Залежний блок {n}', product.id)
+        db.session.add(block)
+        db.session.flush()
+        detail = Detail(f'Залежна деталь {n}', block.id)
+        blob = MediaBlob(f'{n:064x}', 1, 'image/png', 1, 1, f'static/uploads/media/{n}.png', 1)
+        db.session.add_all([detail, blob])
+        db.session.flush()
+        db.session.add_all([
+            ToolO(tool.id, operation_id), MaterialO(material.id, operation_id),
+            dComponent(product.id, 'product', operation_id), dComponent(block.id, 'block', operation_id),
+            dComponent(detail.id, 'detail', operation_id),
+            InstructionFile(instruction.id, 'photo', f'{blob.id}.png', blob.id),
+        ])
+    db.session.commit()
+
+
+def _count_queries(app, max_queries, f):
+    with app.app_context():
+        with sql_profiler.query_budget(max_queries=max_queries) as profile:
+            f()
+        return profile.count
+
+
+def test_bundle_query_count_does_not_grow_with_the_operation(app, db, company):
+    operation_id = company['operation_ids'][2]
+    counts = []
+    for count in (1, 10):
+        with app.app_context():
+            _grow(db, company, operation_id, count)
+        counts.append(_count_queries(app, BUNDLE_QUERIES, lambda: load_operation_bundle(operation_id)))
+
+    assert counts[0] == counts[1], counts
+    with app.app_context():
+        bundle = load_operation_bundle(operation_id)
+    assert len(bundle['tools']) == 12
+    assert len(bundle['dependencies']) == 33
+    assert all(d['name'] != 'Невідомо' for d in bundle['dependencies'])
+    assert len(bundle['photos']) == 11
+
+
+def test_instruction_page_query_count_does_not_grow_with_the_operation(app, db, company, employee_client):
+    task_id = company['task_ids'][2]
+    operation_id = company['operation_ids'][2]
+    counts = []
+    for count in (1, 10):
+        with app.app_context():
+            _grow(db, company, operation_id, count)
+        counts.append(_count_queries(
+            app, INSTRUCTION_PAGE_QUERIES, lambda: employee_client.get(f'/instruction_page?task_id={task_id}')
+        ))
+    assert counts[0] == counts[1], counts
+    assert employee_client.get(f'/instruction_page?task_id={task_id}').status_code == 200
+
+
+def test_query_budget_catches_n_plus_one(app, db, company):
+    with app.app_context():
+        _grow(db, company, company['operation_ids'][0], 5)
+    with app.app_context(), pytest.raises(QueryBudgetExceeded, match='N\\+1'):
+        with sql_profiler.query_budget():
+            for tool_o in ToolO.query.all():
+                ToolO.query.filter_by(id=tool_o.id).first()
@@ -0,0 +1,73 @@
+from models import Operation
+from sql_profiler import sql_profiler
+from tests.test_bulk_assign import _add_details, _second_employee
+
+
+def _batch(client, headers=None, **params):
+    return client.get('/operations_batch', query_string=params, headers=headers or {})
+
+
+def test_admin_task_batch(app, db, company, admin_client):
+    response = _batch(admin_client, admin_task_id=company['admin_task_id'])
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.headers['ETag']
+    data = response.get_json()
+    assert set(data['components']) == {f'product:{company["product_id"]}', f'block:{company["block_id"]}',
+                                       f'detail:{company["detail_id"]}'}
+    assert sorted(t['id'] for t in data['tasks']) == sorted(company['task_ids'])
+
+
+def test_unchanged_batch_is_304(app, db, company, admin_client):
+    etag = _batch(admin_client, admin_task_id=company['admin_task_id']).headers['ETag']
+
+    response = _batch(admin_client, {'If-None-Match': etag}, admin_task_id=company['admin_task_id'])
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_changes_give_a_new_etag(app, db, company, admin_client):
+    params = {'admin_task_id': company['admin_task_id']}
+    etags = [_batch(admin_client, **params).headers['ETag']]
+
+    with app.app_context():
+        db.session.get(Operation, company['operation_ids'][0]).name = 'Перейменована'
+        db.session.commit()
+    etags.append(_batch(admin_client, **params).headers['ETag'])
+
+    # Reassigning a task changes the tasks part only
+    assert admin_client.post('/create_task', json={
+        'operation_id': company['operation_ids'][0], 'employee_id': _second_employee(app, db, company),
+        'component_id': company['product_id'], 'component_type': 'product', 'admin_task': company['admin_task_id'],
+    }).status_code == 200
+    etags.append(_batch(admin_client, **params).headers['ETag'])
+    assert len(set(etags)) == 3
+
+    response = _batch(admin_client, {'If-None-Match': etags[0]}, **params)
+    assert response.status_code == 200
+    assert response.get_json()['components'][f'product:{company["product_id"]}']
+
+
+def test_component_batch(app, db, company, admin_client, other_admin_client):
+    components = f'product:{company["product_id"]},detail:{company["detail_id"]},block:999999,x:1,detail:'
+    data = _batch(admin_client, components=components).get_json()
+    assert set(data['components']) == {f'product:{company["product_id"]}', f'detail:{company["detail_id"]}'}
+    assert data['tasks'] == []
+
+    # Another company neither sees the components nor the admin task
+    assert _batch(other_admin_client, components=components).get_json()['components'] == {}
+    assert _batch(other_admin_client, admin_task_id=company['admin_task_id']).status_code == 404
+    assert _batch(other_admin_client, product_id=company['product_id']).status_code == 404
+    assert _batch(admin_client, components='').status_code == 400
+
+
+def test_batch_query_count_does_not_grow_with_the_tree(app, db, company, admin_client):
+    counts = []
+    for count in (1, 30):
+        _add_details(app, db, company, count)
+        with app.app_context():
+            with sql_profiler.query_budget() as profile:
+                assert _batch(admin_client, admin_task_id=company['admin_task_id']).status_code == 200
+        counts.append(profile.count)
+    assert counts[0] == counts[1], counts
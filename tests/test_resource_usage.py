@@ -0,0 +1,41 @@
+from resource_usage import demand_reports
+
+
+def test_alarm_page_survives_forced_location_delete(app, db, company, employee_client, admin_client):
+    task_id = company['task_ids'][2]
+    employee_client.get(f'/start_task/{task_id}')
+    employee_client.post(f'/submit_alarm/{task_id}', data={'operationName': 'Зламався'})
+
+    assert admin_client.delete(f'/delete-location/{company["location_id"]}').status_code == 409
+    assert admin_client.delete(f'/delete-location/{company["location_id"]}?force=1').status_code == 204
+
+    response = admin_client.get(f'/alarm_for_admin?task_id={task_id}')
+    assert response.status_code == 200
+    assert 'Локація: Невідомо' in response.get_data(as_text=True)
+
+
+def test_demand_report_counts_open_tasks(app, db, company, employee_client, admin_client):
+    employee_client.get(f'/start_task/{company["task_ids"][0]}')
+
+    report = admin_client.get('/demand_report?format=json').get_json()
+    tool, = report['tool']
+    assert tool['id'] == company['tool_id']
+    assert tool['open_tasks'] == 3
+    assert tool['operations'] == 3
+    assert tool['by_status'] == {'У роботі': 1, 'Не активне': 2}
+    assert admin_client.get('/demand_report').status_code == 200
+
+
+def test_demand_report_is_built_once_per_ttl(app, db, company, employee_client):
+    with app.app_context():
+        first = demand_reports.get(company['company_id'])
+        employee_client.get(f'/start_task/{company["task_ids"][0]}')
+        assert demand_reports.get(company['company_id']) is first
+
+        demand_reports.ttl = 0
+        try:
+            fresh = demand_reports.get(company['company_id'])
+        finally:
+            demand_reports.ttl = 60
+    assert fresh is not first
+    assert fresh['tool'][0]['by_status'] == {'У роботі': 1, 'Не активне': 2}
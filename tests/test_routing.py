@@ -0,0 +1,120 @@
+import shutil
+import time
+
+import pytest
+from flask import g
+from sqlalchemy import create_engine
+
+import routing
+from connections import REPLICA_BIND
+from models import Tool
+from routing import PRIMARY_UNTIL_KEY, on_primary, replica_monitor
+from tests.conftest import DATABASE_PATH, login
+
+
+@pytest.fixture
+def replica(app, db, company, tmp_path, monkeypatch):
+    """A SQLite copy of the primary as it is now, registered as the replica bind.
+
+    Nothing replicates to it afterwards, so rows added later only exist on
+    the primary and show which database a read went to.
+    """
+    path = tmp_path / 'replica.db'
+    shutil.copyfile(DATABASE_PATH, path)
+    engine = create_engine(f'sqlite:///{path}')
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', dict(app.config.get('SQLALCHEMY_BINDS', {}),
+                                                             **{REPLICA_BIND: f'sqlite:///{path}'}))
+    monkeypatch.setitem(app.config, 'REPLICA_STICKY_SECONDS', 5)
+    with app.app_context():
+        monkeypatch.setitem(db.engines, REPLICA_BIND, engine)
+    # Measure the lag on every read, so a test can change it
+    monkeypatch.setattr(replica_monitor, 'check_interval', 0)
+    with app.app_context():
+        db.session.add(Tool('Тільки на основній', company['company_id']))
+        db.session.commit()
+    yield engine
+    engine.dispose()
+
+
+def _tools(client):
+    response = client.get('/edit_tools_list?format=json')
+    assert response.status_code == 200
+    return {item['name'] for item in response.get_json()['items']}
+
+
+def test_read_only_views_read_the_replica(app, replica, admin_client):
+    reads = replica_monitor.replica_reads
+    assert _tools(admin_client) == {'Ключ'}
+    assert replica_monitor.replica_reads > reads
+
+
+def test_other_views_and_cache_loaders_read_the_primary(app, replica, company):
+    with app.test_request_context():
+        g.db_read_only = True
+        assert Tool.query.count() == 1
+        with on_primary():
+            assert Tool.query.count() == 2
+    with app.test_request_context():
+        # Not marked read-only
+        assert Tool.query.count() == 2
+
+
+def test_session_that_wrote_keeps_reading_the_primary(app, db, replica, company):
+    with app.test_request_context():
+        g.db_read_only = True
+        db.session.add(Tool('Новий', company['company_id']))
+        db.session.flush()
+        assert Tool.query.count() == 3
+        db.session.rollback()
+
+
+def test_user_reads_own_writes_after_commit(app, replica, admin_client):
+    other = login(app, 'admin')
+    assert admin_client.post('/add-tool', json={'name': 'Щойно доданий'}).status_code == 201
+
+    sticky = replica_monitor.sticky_reads
+    assert _tools(admin_client) == {'Ключ', 'Тільки на основній', 'Щойно доданий'}
+    assert replica_monitor.sticky_reads > sticky
+    # Only the user who wrote is held on the primary
+    assert _tools(other) == {'Ключ'}
+
+    # Once the sticky window is over, the replica is trusted to have caught up
+    with admin_client.session_transaction() as session:
+        assert session[PRIMARY_UNTIL_KEY] > time.time()
+        session[PRIMARY_UNTIL_KEY] = time.time() - 1
+    assert _tools(admin_client) == {'Ключ'}
+
+
+def test_lagging_replica_falls_back_to_the_primary(app, replica, admin_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'REPLICA_MAX_LAG_SECONDS', 5)
+    monkeypatch.setitem(routing.LAG_PROBES, 'sqlite', lambda connection: 60.0)
+    fallbacks = replica_monitor.lag_fallbacks
+    assert _tools(admin_client) == {'Ключ', 'Тільки на основній'}
+    assert replica_monitor.lag_fallbacks > fallbacks
+    assert admin_client.get('/db_pool_stats').get_json()['replica']['lag_seconds'] == 60.0
+
+    monkeypatch.setitem(routing.LAG_PROBES, 'sqlite', lambda connection: 1.0)
+    assert _tools(admin_client) == {'Ключ'}
+
+
+def test_unmeasurable_lag_falls_back_to_the_primary(app, replica, admin_client, monkeypatch):
+    def broken(connection):
+        raise RuntimeError('replica unreachable')
+
+    monkeypatch.setitem(routing.LAG_PROBES, 'sqlite', broken)
+    assert _tools(admin_client) == {'Ключ', 'Тільки на основній'}
+
+
+def test_cache_loaded_in_a_read_only_view_comes_from_the_primary(app, db, replica, company, admin_client):
+    from alarm_cache import alarm_index
+    from models import Task
+
+    task_id = company['task_ids'][0]
+    with app.app_context():
+        db.session.get(Task, task_id).status = 'Alarm'
+        db.session.commit()
+    alarm_index.clear()
+    # /home is read-only and loads the company's alarms; the replica has none
+    assert admin_client.get('/home').status_code == 200
+    with app.app_context():
+        assert alarm_index.task_ids(company['company_id']) == {task_id}
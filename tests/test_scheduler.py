@@ -0,0 +1,109 @@
+import random
+import time
+from datetime import datetime
+
+import scheduler
+from dependency_graph import DependencyGraph
+from models import Employee, Task, aTask, dComponent
+from scheduler import RUNNING_STATUSES, schedule_admin_task
+
+NOW = datetime(2026, 10, 18, 8, 0)
+
+
+def _intervals(plan, running):
+    """Per employee, the planned work plus the rest of their running tasks."""
+    intervals = {}
+    for employee_id, seconds in running:
+        intervals.setdefault(employee_id, []).append((0.0, seconds))
+    for a in plan['assignments']:
+        intervals.setdefault(a['employee_id'], []).append((a['start_seconds'], a['finish_seconds']))
+    return intervals
+
+
+def assert_no_overlap(plan, running=()):
+    for employee_id, spans in _intervals(plan, running).items():
+        spans.sort()
+        for (_, end), (start, _) in zip(spans, spans[1:]):
+            assert start >= end - 1e-6, f'employee {employee_id} has overlapping work: {spans}'
+
+
+def test_running_task_released_late_keeps_its_employee_busy(app, db, company):
+    with app.app_context():
+        admin_task = db.session.get(aTask, company['admin_task_id'])
+        product_op, block_op, detail_op = company['operation_ids']
+        # The product operation waits for the detail but is already running
+        db.session.add(dComponent(company['detail_id'], 'detail', product_op))
+        task = Task.query.filter_by(operation_id=product_op).first()
+        task.status, task.start_time = 'У роботі', NOW
+        db.session.commit()
+
+        plan = schedule_admin_task(admin_task, [company['employee_id']], now=NOW)
+
+    running = [(company['employee_id'], 3600.0)]
+    assert_no_overlap(plan, running)
+    starts = {a['operation_id']: a['start_seconds'] for a in plan['assignments']}
+    assert product_op not in starts
+    assert starts[detail_op] == 3600.0
+    # The running operation ends after its prerequisites, not before them
+    assert plan['makespan_seconds'] == 3 * 3600.0
+
+
+def _synthetic_tree(blocks, details, operations):
+    tree = {'type': 'product', 'id': 1, 'operations': [], 'blocks': [], 'details': []}
+    operation_id = 0
+    for b in range(blocks):
+        block = {'type': 'block', 'id': b, 'operations': [], 'details': []}
+        for d in range(details):
+            detail = {'type': 'detail', 'id': b * details + d, 'operations': []}
+            for _ in range(operations):
+                operation_id += 1
+                detail['operations'].append({'id': operation_id, 'name': f'op{operation_id}'})
+            block['details'].append(detail)
+        tree['blocks'].append(block)
+    return tree, operation_id
+
+
+def _synthetic_plan(app, db, company, monkeypatch, blocks, details, operations, employees, running_count):
+    rng = random.Random(1)
+    tree, count = _synthetic_tree(blocks, details, operations)
+    # Dependencies only point at details of earlier blocks, so the plan has no cycle
+    dependencies = []
+    for _ in range(count // 15):
+        operation_id = rng.randint(details * operations + 1, count)
+        earlier_block = (operation_id - 1) // (details * operations) - 1
+        dependencies.append((operation_id, 'detail', rng.randint(0, (earlier_block + 1) * details - 1)))
+    durations = {i: rng.uniform(600, 7200) for i in range(1, count + 1)}
+    graph = DependencyGraph.from_tree(tree, dependencies, durations)
+    monkeypatch.setattr(scheduler, 'load_dependency_graph', lambda admin_task: graph)
+
+    with app.app_context():
+        staff = [Employee(f'Ім{i}', f'Пр{i}', 'По', f'380{i:07d}', None, company['company_id'])
+                 for i in range(employees)]
+        db.session.add_all(staff)
+        db.session.flush()
+        running = []
+        for operation_id, employee in zip(rng.sample(range(1, count + 1), running_count), staff):
+            db.session.add(Task(1, operation_id, employee.id, RUNNING_STATUSES[0], company['company_id'],
+                                'detail', company['admin_task_id'], start_time=NOW))
+            running.append((employee.id, durations[operation_id]))
+        db.session.commit()
+
+        admin_task = db.session.get(aTask, company['admin_task_id'])
+        started = time.perf_counter()
+        plan = schedule_admin_task(admin_task, [e.id for e in staff], now=NOW)
+        return plan, running, time.perf_counter() - started, count
+
+
+def test_plan_never_overlaps_per_employee(app, db, company, monkeypatch):
+    plan, running, _, count = _synthetic_plan(app, db, company, monkeypatch, 6, 5, 4, 8, running_count=5)
+    assert_no_overlap(plan, running)
+    assert len(plan['assignments']) == count - len(running)
+
+
+def test_5000_operations_over_200_employees_in_seconds(app, db, company, monkeypatch):
+    plan, running, seconds, count = _synthetic_plan(app, db, company, monkeypatch, 50, 10, 10, 200,
+                                                    running_count=20)
+    assert count == 5000
+    assert_no_overlap(plan, running)
+    assert len(plan['assignments']) == count - len(running)
+    assert seconds < 10, f'{seconds:.1f}s'
@@ -0,0 +1,213 @@
+import random
+import threading
+import time
+
+import pytest
+
+BENCHMARK_ITEMS = 50000
+BENCHMARK_QUERY_MS = 50
+
+
+def _search(client, q, **params):
+    response = client.get('/search', query_string=dict(params, q=q))
+    assert response.status_code == 200, response.data
+    return response.get_json()['results']
+
+
+def _names(results):
+    return [r['name'] for r in results]
+
+
+def _add_tools(app, db, company, names):
+    from models import Tool
+
+    with app.app_context():
+        tools = [Tool(name, company['company_id']) for name in names]
+        db.session.add_all(tools)
+        db.session.commit()
+        return [t.id for t in tools]
+
+
+def test_prefix_exact_and_fuzzy_matches(app, db, company, admin_client):
+    _add_tools(app, db, company, ['Torque wrench T-12', 'Hammer 500g', 'Torx driver'])
+
+    assert _names(_search(admin_client, 'torqu')) == ['Torque wrench T-12']
+    # "torx" is one letter off "torq", but a prefix match ranks first
+    assert _names(_search(admin_client, 'torq')) == ['Torque wrench T-12', 'Torx driver']
+    assert set(_names(_search(admin_client, 'tor'))) == {'Torque wrench T-12', 'Torx driver'}
+    # One typo: a missing, a replaced or two swapped letters
+    assert _names(_search(admin_client, 'wrnch')) == ['Torque wrench T-12']
+    assert _names(_search(admin_client, 'hamer')) == ['Hammer 500g']
+    assert _names(_search(admin_client, 'hmamer')) == ['Hammer 500g']
+    # "T-12" is also findable written together
+    assert _names(_search(admin_client, 't12')) == ['Torque wrench T-12']
+    # Every word of the query has to match
+    assert _search(admin_client, 'torque hammer') == []
+
+
+def test_exact_matches_rank_before_prefix_and_fuzzy(app, db, company, admin_client):
+    _add_tools(app, db, company, ['Drill', 'Drills set', 'Drell'])
+
+    results = _search(admin_client, 'drill')
+    assert _names(results) == ['Drill', 'Drills set', 'Drell']
+    assert [r['score'] for r in results] == [3, 2, 1]
+    assert _names(_search(admin_client, 'drill', limit=1)) == ['Drill']
+
+
+def test_kinds_filter(app, db, company, admin_client):
+    results = _search(admin_client, 'op')
+    assert {r['type'] for r in results} == {'operation'}
+    assert _search(admin_client, 'op', type='tool') == []
+    assert _names(_search(admin_client, 'ключ', type='tool,material')) == ['Ключ']
+
+
+def test_routes_write_through(app, db, company, admin_client):
+    response = admin_client.post('/add-tool', json={'name': 'Calipers'})
+    assert response.status_code == 201
+    tool_id = response.get_json()['id']
+    assert _names(_search(admin_client, 'calip')) == ['Calipers']
+
+    assert admin_client.put(f'/edit-tool/{tool_id}', json={'name': 'Micrometer'}).status_code == 204
+    assert _search(admin_client, 'calip') == []
+    assert _names(_search(admin_client, 'micro')) == ['Micrometer']
+
+    assert admin_client.delete(f'/delete-tool/{tool_id}').status_code == 204
+    assert _search(admin_client, 'micro') == []
+
+
+def test_text_instructions_are_searchable(app, db, company):
+    from models import Instruction, InstructionFile, MediaBlob
+    from search_index import search_index
+
+    with open('steps.txt', 'w', encoding='utf-8') as f:
+        f.write('Затягнути болти динамометричним ключем')
+    operation_id = company['operation_ids'][0]
+    with app.app_context():
+        instruction = Instruction(operation_id, None, None, None)
+        blob = MediaBlob('0' * 64, 10, 'text/plain', None, None, 'steps.txt', 1)
+        db.session.add_all([instruction, blob])
+        db.session.commit()
+        db.session.add(InstructionFile(instruction.id, 'text', 'steps.txt', blob.id))
+        db.session.commit()
+
+        results = search_index.search(company['company_id'], 'динамометр')
+    assert [(r['type'], r['id']) for r in results] == [('instruction', operation_id)]
+
+
+def test_companies_do_not_see_each_other(app, db, company, admin_client, other_admin_client):
+    _add_tools(app, db, company, ['Torque wrench'])
+
+    assert _names(_search(admin_client, 'torque')) == ['Torque wrench']
+    assert _search(other_admin_client, 'torque') == []
+
+
+def test_first_load_makes_concurrent_searches_wait(app, db, company, monkeypatch):
+    from search_index import SearchIndex, search_index
+
+    _add_tools(app, db, company, ['Torque wrench'])
+    documents = SearchIndex._documents
+    loading = threading.Event()
+
+    def slow_documents(self, company_id):
+        loading.set()
+        time.sleep(0.3)
+        yield from documents(self, company_id)
+
+    monkeypatch.setattr(SearchIndex, '_documents', slow_documents)
+    loads = search_index.loads
+    results, errors = [], []
+
+    def searcher():
+        try:
+            with app.app_context():
+                results.append(_names(search_index.search(company['company_id'], 'torque')))
+        except BaseException as exc:
+            errors.append(exc)
+
+    first = threading.Thread(target=searcher)
+    first.start()
+    # The others arrive while the first one is reading the documents
+    assert loading.wait(5)
+    others = [threading.Thread(target=searcher) for _ in range(4)]
+    for thread in others:
+        thread.start()
+    for thread in [first] + others:
+        thread.join()
+
+    assert errors == []
+    assert results == [['Torque wrench']] * 5
+    assert search_index.loads == loads + 1
+
+
+def test_stale_index_is_served_while_rebuilt_in_background(app, db, company, monkeypatch):
+    from search_index import SearchIndex, search_index
+
+    company_id = company['company_id']
+    with app.app_context():
+        assert search_index.search(company_id, 'torque') == []
+    # Another process adds a tool; this one does not hear of it until the reload
+    _add_tools(app, db, company, ['Torque wrench'])
+
+    documents = SearchIndex._documents
+    release = threading.Event()
+
+    def slow_documents(self, company_id):
+        release.wait(5)
+        yield from documents(self, company_id)
+
+    monkeypatch.setattr(SearchIndex, '_documents', slow_documents)
+    monkeypatch.setattr(search_index, 'reload_interval', 0)
+    loads = search_index.loads
+    with app.app_context():
+        # Served from the old index without waiting for the rebuild
+        started = time.perf_counter()
+        assert search_index.search(company_id, 'torque') == []
+        assert time.perf_counter() - started < 1
+    release.set()
+
+    deadline = time.monotonic() + 5
+    while search_index.loads == loads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    monkeypatch.setattr(search_index, 'reload_interval', 300)
+    with app.app_context():
+        assert _names(search_index.search(company_id, 'torque')) == ['Torque wrench']
+
+
+def _benchmark_names(count, seed=1):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = [''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(5000)]
+    return words, [f'{rng.choice(words)} {rng.choice(words)} {rng.choice(words)} N-{i}' for i in range(count)]
+
+
+def test_query_latency_on_a_large_index():
+    from search_index import _CompanyIndex, _doc
+
+    words, names = _benchmark_names(BENCHMARK_ITEMS)
+    index = _CompanyIndex()
+    for i, name in enumerate(names):
+        index.upsert(_doc('tool', i, name), name)
+    index.compact()
+
+    rng = random.Random(2)
+    queries = []
+    for word in rng.sample(words, 20):
+        typo = word[:2] + word[3:]
+        queries += [word, word[:3], typo, f'{word} {rng.choice(words)[:3]}', f'n{rng.randrange(BENCHMARK_ITEMS)}']
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    assert timings[len(timings) // 2] < BENCHMARK_QUERY_MS / 5
+    assert timings[-1] < BENCHMARK_QUERY_MS, timings[-5:]
+
+    # A typo still finds the item, and its exact name ranks first
+    assert index.search(f'{names[7].split()[0][:2]}{names[7].split()[0][3:]} n7')[0]['id'] == 7
+    assert index.search('n-7')[0]['id'] == 7
+
+
+@pytest.mark.parametrize('query', ['', '   ', '!!'])
+def test_empty_queries(app, db, company, admin_client, query):
+    assert _search(admin_client, query) == []
@@ -0,0 +1,4 @@
+from app import app, folder_create
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+folder_create('uploads', 'static')